@@ -0,0 +1,119 @@
+"""
+Compares the size of each seeded table's extract against the CPU it costs to compress and
+decompress it, for every EXTRACT_COMPRESSION option.
+
+The seeded tables only hold a handful of rows, so each table is scaled up to '--rows' rows by
+copying its seeded rows with fresh keys and randomly varied numbers, timestamps and booleans.
+
+Run against the local test database after seeding it:
+    python -m benchmarks.compression_benchmark --rows 100000
+"""
+
+import argparse
+import gzip
+import time
+from io import BytesIO
+
+from src.extract import TABLE_LIST, copy_query_to_file
+from src.utils.compression import compressed_writer, zstandard
+from src.utils.connection import create_connection_to_local
+
+# column type: SQL that varies a copied value, so repeated rows don't compress unrealistically well
+VARIATIONS = {
+    "integer": "({column} + floor(random() * 1000))::int",
+    "numeric": "round(({column} * (0.5 + random()))::numeric, 2)",
+    "timestamp without time zone": "{column} + random() * interval '365 days'",
+    "boolean": "random() < 0.5",
+}
+
+
+def export_table(db, table, rows):
+    """Returns about 'rows' rows of the table as COPY CSV, generated from its seeded rows."""
+    db_cursor = db.cursor()
+    db_cursor.execute(
+        """
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+        ORDER BY ordinal_position
+        """,
+        (table,),
+    )
+    key, *columns = db_cursor.fetchall()
+    expressions = [f"row_number() OVER () AS {key['column_name']}"] + [
+        VARIATIONS.get(column["data_type"], "{column}").format(
+            column=f"t.{column['column_name']}"
+        )
+        + f" AS {column['column_name']}"
+        for column in columns
+    ]
+    db_cursor.execute(f"SELECT count(*) AS total FROM {table}")
+    repeats = -(-rows // max(db_cursor.fetchone()["total"], 1))
+    file = BytesIO()
+    copy_query_to_file(
+        db_cursor,
+        f"SELECT {', '.join(expressions)} FROM {table} t "
+        f"CROSS JOIN generate_series(1, {repeats})",
+        file,
+    )
+    db.rollback()
+    return file.getvalue()
+
+
+def decompress(data, compression):
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=BytesIO(data)).read()
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().stream_reader(BytesIO(data)).read()
+    return data
+
+
+def measure(data, compression):
+    """Returns (compressed size, compress CPU seconds, decompress CPU seconds)."""
+    file = BytesIO()
+    start = time.process_time()
+    with compressed_writer(file, compression) as out:
+        out.write(data)
+    compress_time = time.process_time() - start
+
+    start = time.process_time()
+    assert decompress(file.getvalue(), compression) == data
+    decompress_time = time.process_time() - start
+    return len(file.getvalue()), compress_time, decompress_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100000, help="rows per table")
+    args = parser.parse_args()
+
+    compressions = ["none", "gzip"] + (["zstd"] if zstandard else [])
+    db = create_connection_to_local()
+    totals = {compression: [0, 0.0, 0.0] for compression in compressions}
+    print(
+        f"{'table':<16}{'compression':<13}{'MiB':>9}{'ratio':>8}"
+        f"{'compress s':>12}{'decompress s':>14}"
+    )
+    try:
+        for table in TABLE_LIST:
+            data = export_table(db, table, args.rows)
+            for compression in compressions:
+                size, compress_time, decompress_time = measure(data, compression)
+                for index, value in enumerate((size, compress_time, decompress_time)):
+                    totals[compression][index] += value
+                print(
+                    f"{table:<16}{compression:<13}{size / 2**20:>9.2f}"
+                    f"{len(data) / size:>8.1f}{compress_time:>12.3f}{decompress_time:>14.3f}"
+                )
+    finally:
+        db.close()
+
+    raw_size = totals["none"][0]
+    for compression, (size, compress_time, decompress_time) in totals.items():
+        print(
+            f"{'all tables':<16}{compression:<13}{size / 2**20:>9.2f}"
+            f"{raw_size / size:>8.1f}{compress_time:>12.3f}{decompress_time:>14.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
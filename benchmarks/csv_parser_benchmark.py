@@ -0,0 +1,84 @@
+"""
+Compares the two CSV parsers read_csv_to_df can use (TRANSFORM_CSV_PARSER): pandas, inferring
+every column's type, and pyarrow, parsing blocks on several threads with declared types.
+
+The file is a table's COPY CSV export scaled up to '--rows' rows, as in compression_benchmark.
+Each parser is timed on its own and followed by the table's transformation, as the sales
+transformation has to parse the timestamps pandas leaves as strings.
+
+Run against the local test database after seeding it:
+    python -m benchmarks.csv_parser_benchmark --rows 1000000
+"""
+
+import argparse
+import gzip
+import time
+from io import BytesIO
+
+import pandas as pd
+
+from benchmarks.compression_benchmark import export_table
+from src.utils.connection import create_connection_to_local
+from src.utils.utils import create_sales_fact, read_csv_with_arrow
+
+PARSERS = {
+    "pandas": lambda data, key: pd.read_csv(
+        BytesIO(data), index_col=0, compression="gzip" if key.endswith(".gz") else None
+    ),
+    "pyarrow": read_csv_with_arrow,
+}
+
+
+def best_time(function, repeat):
+    """Returns the fastest of 'repeat' wall clock times of function(), and its last result."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000000, help="rows in the file")
+    parser.add_argument("--table", default="sales_order", help="table to export")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per parser")
+    parser.add_argument("--gzip", action="store_true", help="compress the file first")
+    args = parser.parse_args()
+
+    db = create_connection_to_local()
+    try:
+        data = export_table(db, args.table, args.rows)
+    finally:
+        db.close()
+    key = f"{args.table}_benchmark.csv"
+    if args.gzip:
+        data, key = gzip.compress(data), f"{key}.gz"
+    print(f"{key}: {len(data) / 2**20:.1f} MiB")
+    print(f"{'parser':<10}{'parse s':>10}{'transform s':>13}{'rows/s':>12}  types")
+
+    error = None
+    for name, parse in PARSERS.items():
+        parse_time, df = best_time(lambda: parse(data, key), args.repeat)
+        transform = "-"
+        if args.table == "sales_order":
+            try:
+                transform_time, _ = best_time(
+                    lambda: create_sales_fact(df.copy()), args.repeat
+                )
+                transform = f"{transform_time:.3f}"
+            except ValueError as e:
+                # e.g. pandas' timestamp strings mixing precisions, see the note printed below
+                transform, error = "failed", e
+        types = ", ".join(sorted({str(dtype) for dtype in df.dtypes}))
+        print(
+            f"{name:<10}{parse_time:>10.3f}{transform:>13}"
+            f"{len(df) / parse_time:>12,.0f}  {types}"
+        )
+    if error is not None:
+        print(f"transform failed: {str(error).splitlines()[0]}")
+
+
+if __name__ == "__main__":
+    main()
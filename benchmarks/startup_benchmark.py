@@ -0,0 +1,225 @@
+"""
+Measures the cold start of each Lambda handler: the time to import its module, which heavy
+libraries that import loads, and the latency of its first and of a warm second invocation.
+
+Every run of a handler is a fresh Python process, as a new Lambda container would be. The
+process imports the handler before anything else, then starts moto, uploads the handler's input
+and invokes it twice. The inputs of transform and load are made once beforehand, by running the
+extract and transform handlers in this process.
+
+Load writes to '--warehouse-url', an in-memory SQLite database unless another is given, so the
+benchmark doesn't need a warehouse. Extract reads the database in the PG_* variables.
+
+Run against the local test database after seeding it:
+    python -m benchmarks.startup_benchmark --runs 5
+    python -m benchmarks.startup_benchmark --max-import-ms 500  # exits 1 over the budget
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HANDLERS = {
+    "extract": ("src.extract", "extract_handler"),
+    "transform": ("src.transform", "transform_handler"),
+    "load": ("src.load", "load_handler"),
+}
+# the libraries a cold start can't afford to import when the invocation doesn't need them
+HEAVY_MODULES = ["boto3", "psycopg2", "numpy", "pandas", "pyarrow", "sqlalchemy"]
+REGION = "eu-west-2"
+
+
+def upload(s3_client, bucket, directory=None):
+    """Creates the bucket and uploads the files saved under 'directory' to it, if one is given."""
+    s3_client.create_bucket(
+        Bucket=bucket, CreateBucketConfiguration={"LocationConstraint": REGION}
+    )
+    if directory is None:
+        return
+    root = Path(directory)
+    for path in sorted(root.rglob("*")):
+        if path.is_file():
+            key = path.relative_to(root).as_posix()
+            s3_client.put_object(Bucket=bucket, Key=key, Body=path.read_bytes())
+
+
+def download(s3_client, bucket, directory):
+    """Saves every object of the bucket under 'directory', at its key."""
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket):
+        for item in page.get("Contents", []):
+            path = Path(directory, item["Key"])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            body = s3_client.get_object(Bucket=bucket, Key=item["Key"])["Body"]
+            path.write_bytes(body.read())
+
+
+def prepare_inputs(directory):
+    """
+    Runs extract and transform once under moto and saves their buckets, as the inputs of the
+    transform and load runs.
+
+    Returns:
+        dict: The event each handler is invoked with.
+    """
+    import boto3
+    from moto import mock_aws
+
+    with mock_aws():
+        from src.extract import extract_handler
+        from src.transform import transform_handler
+
+        s3_client = boto3.client("s3", region_name=REGION)
+        for bucket in (os.environ["BUCKET"], os.environ["TRANSFORM_BUCKET"]):
+            s3_client.create_bucket(
+                Bucket=bucket, CreateBucketConfiguration={"LocationConstraint": REGION}
+            )
+        extracted = extract_handler({}, None)
+        transformed = transform_handler(
+            {"manifest_key": extracted["manifest_key"]}, None
+        )
+        download(s3_client, os.environ["BUCKET"], Path(directory, "extract"))
+        download(
+            s3_client, os.environ["TRANSFORM_BUCKET"], Path(directory, "transform")
+        )
+    return {
+        "extract": {},
+        "transform": {"manifest_key": extracted["manifest_key"]},
+        "load": transformed,
+    }
+
+
+def measure_handler(handler, event, inputs):
+    """
+    Runs in the child process: imports the handler, then invokes it twice under moto.
+
+    Returns:
+        dict: Import and invocation times in milliseconds, and the heavy modules loaded by each.
+    """
+    module_name, function_name = HANDLERS[handler]
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    import_ms = (time.perf_counter() - start) * 1000
+    imported = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    import boto3
+    from moto import mock_aws
+
+    with mock_aws():
+        s3_client = boto3.client("s3", region_name=REGION)
+        stages = list(HANDLERS)
+        for stage, bucket in (
+            ("extract", os.environ["BUCKET"]),
+            ("transform", os.environ["TRANSFORM_BUCKET"]),
+        ):
+            # a handler's input is what the stages before it wrote
+            written = stages.index(stage) < stages.index(handler)
+            upload(s3_client, bucket, Path(inputs, stage) if written else None)
+        handle = getattr(module, function_name)
+        invocations = []
+        for _ in range(2):
+            start = time.perf_counter()
+            handle(event, None)
+            invocations.append((time.perf_counter() - start) * 1000)
+    return {
+        "import_ms": import_ms,
+        "first_ms": invocations[0],
+        "warm_ms": invocations[1],
+        "imported": imported,
+        "first_imported": [name for name in HEAVY_MODULES if name in sys.modules],
+    }
+
+
+def run_child(handler, event, inputs, env):
+    """Measures a handler in a new Python process and returns its results."""
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.startup_benchmark",
+            "--child",
+            handler,
+            "--event",
+            json.dumps(event),
+            "--inputs",
+            inputs,
+        ],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(output.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=3, help="processes per handler")
+    parser.add_argument(
+        "--warehouse-url",
+        default="sqlite://",
+        help="database the load handler writes to",
+    )
+    parser.add_argument(
+        "--max-import-ms",
+        type=float,
+        help="exit with status 1 if a handler's median import time is over this",
+    )
+    parser.add_argument("--child", choices=HANDLERS, help=argparse.SUPPRESS)
+    parser.add_argument("--event", help=argparse.SUPPRESS)
+    parser.add_argument("--inputs", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        results = measure_handler(args.child, json.loads(args.event), args.inputs)
+        print(json.dumps(results))
+        return
+
+    # moto only needs credentials to be set, and the handlers' clients take the region from here
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+        os.environ.setdefault(name, "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", REGION)
+    os.environ["PG_CONNECTION"] = args.warehouse_url
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+
+    over_budget = []
+    print(
+        f"{'handler':<11}{'import ms':>11}{'first ms':>10}{'warm ms':>9}"
+        f"  heavy modules after import / after first invocation"
+    )
+    with tempfile.TemporaryDirectory() as inputs:
+        logging.disable(logging.INFO)  # the handlers' export messages
+        events = prepare_inputs(inputs)
+        for handler in HANDLERS:
+            runs = [
+                run_child(handler, events[handler], inputs, env)
+                for _ in range(args.runs)
+            ]
+            import_ms, first_ms, warm_ms = (
+                statistics.median(run[field] for run in runs)
+                for field in ("import_ms", "first_ms", "warm_ms")
+            )
+            print(
+                f"{handler:<11}{import_ms:>11.0f}{first_ms:>10.0f}{warm_ms:>9.0f}"
+                f"  {', '.join(runs[0]['imported']) or '-'}"
+                f" / {', '.join(runs[0]['first_imported']) or '-'}"
+            )
+            if args.max_import_ms is not None and import_ms > args.max_import_ms:
+                over_budget.append(handler)
+    if over_budget:
+        print(
+            f"Over the {args.max_import_ms:.0f} ms import budget: {', '.join(over_budget)}"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
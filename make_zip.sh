@@ -7,7 +7,8 @@ rm -rf util_layer.zip
 rm -rf layer.zip
 echo "Creating dependencies"
 
-pip install python-dotenv --platform manylinux2014_x86_64 --only-binary=:all: -t python/
+# zstandard: EXTRACT_COMPRESSION=zstd in extract, reading '.zst' objects in transform
+pip install python-dotenv zstandard==0.25.0 --platform manylinux2014_x86_64 --only-binary=:all: -t python/
 zip -r layer.zip python
 rm -rf python
 
@@ -1,14 +1,46 @@
+import csv
 import datetime
+import functools
+import io
+import itertools
 import json
 import logging
-import pandas as pd
-import boto3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, nullcontext
 from botocore.exceptions import ClientError
 import psycopg2
+import psycopg2.extensions
 import os
 from dotenv import load_dotenv
-from src.utils.connection import create_connection, close_connection
-
+from src.utils.connection import (
+    choose_replica,
+    create_connection,
+    close_connection,
+    connect_with_retry,
+    export_snapshot,
+    get_pool,
+    use_snapshot,
+)
+from src.utils.cdc import (
+    advance_slot,
+    ensure_replication_slot,
+    lsn_to_int,
+    read_changes,
+)
+from src.utils.compression import compressed_writer, COMPRESSION_SUFFIXES
+from src.utils.governor import LoadGovernor, RateLimitedWriter
+from src.utils.pipeline import BackgroundWriter, iterate_in_background
+from src.utils.s3_stream import S3MultipartWriter
+from src.utils.clients import get_client
+from src.utils.columns import EXTRACT_COLUMNS
+from src.utils.xmin import (
+    XMIN_MAX_AGE,
+    get_current_snapshot,
+    snapshot_age,
+    xmin_condition,
+)
 
 load_dotenv()
 
@@ -16,8 +48,60 @@ load_dotenv()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# pandas, numpy and pyarrow are imported by the functions that use them (the batch, Parquet and
+# row hash paths), so a cold start of the default COPY to CSV path doesn't pay for loading them.
+
 BUCKET = os.environ["BUCKET"]
 STATUS_KEY = "status_check.json"
+MANIFEST_PREFIX = "manifests"
+EXTRACT_MODE = os.environ.get("EXTRACT_MODE", "copy")  # "copy" or "batch"
+EXTRACT_FORMAT = os.environ.get("EXTRACT_FORMAT", "csv")  # "csv" or "parquet"
+# "none", "gzip" or "zstd"; CSV only, Parquet is always compressed internally
+EXTRACT_COMPRESSION = os.environ.get("EXTRACT_COMPRESSION", "none")
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", "4"))
+EXTRACT_SNAPSHOT = os.environ.get("EXTRACT_SNAPSHOT", "false").lower() == "true"
+EXTRACT_CHUNK_ROWS = int(os.environ.get("EXTRACT_CHUNK_ROWS", "500000"))
+# batches (or writes) each pipeline stage may run ahead of the next; 0 runs the stages in turn
+EXTRACT_PIPELINE_DEPTH = int(os.environ.get("EXTRACT_PIPELINE_DEPTH", "4"))
+# source latency (a 'SELECT 1' round trip) above which fewer tables are extracted at once, 0 to never back off
+EXTRACT_LATENCY_TARGET_MS = float(os.environ.get("EXTRACT_LATENCY_TARGET_MS", "100"))
+# rows read per second from any one table, 0 for no cap
+EXTRACT_MAX_ROWS_PER_SEC = float(os.environ.get("EXTRACT_MAX_ROWS_PER_SEC", "0"))
+# "true" selects every column instead of only those in EXTRACT_COLUMNS, e.g. for an audit
+EXTRACT_FULL_ROWS = os.environ.get("EXTRACT_FULL_ROWS", "false").lower() == "true"
+# "watermark" polls 'last_updated', "cdc" reads the changes from a logical replication slot
+EXTRACT_STRATEGY = os.environ.get("EXTRACT_STRATEGY", "watermark")
+CDC_SLOT = os.environ.get("EXTRACT_CDC_SLOT", "totes_extract")
+CDC_PUBLICATION = os.environ.get("EXTRACT_CDC_PUBLICATION", "totes_extract")
+CDC_MAX_CHANGES = int(os.environ.get("EXTRACT_CDC_MAX_CHANGES", "100000"))
+# "true" only exports rows whose content changed since they were last exported, not rows that
+# only had 'last_updated' touched; the hash of every exported row is kept under 'hash_index/'
+EXTRACT_ROW_HASHES = os.environ.get("EXTRACT_ROW_HASHES", "false").lower() == "true"
+# changed primary keys sent per export query, which bounds the size of the SQL carrying them
+EXTRACT_KEY_BATCH = int(os.environ.get("EXTRACT_KEY_BATCH", "10000"))
+# comma separated tables whose changes are found by the transaction that wrote each row (xmin)
+# instead of 'last_updated', e.g. tables that backfills update without touching 'last_updated'
+XMIN_TABLES = {
+    table for table in os.environ.get("EXTRACT_XMIN_TABLES", "").split(",") if table
+}
+
+TABLE_LIST = [
+    "address",
+    "counterparty",
+    "currency",
+    "department",
+    "design",
+    "payment",
+    "payment_type",
+    "purchase_order",
+    "sales_order",
+    "staff",
+    "transaction",
+]
+
+PRIMARY_KEYS = {table: f"{table}_id" for table in TABLE_LIST}
+
+state_lock = threading.Lock()  # the status file is read-modify-written by every worker
 
 
 def get_state(s3_client):
@@ -66,10 +150,12 @@ def change_state(s3_client, status: bool):
     """
     if isinstance(status, bool):
         try:
+            state = read_state_file(s3_client)
+            state["is_first_run"] = status
             s3_client.put_object(
                 Bucket=BUCKET,
                 Key=STATUS_KEY,
-                Body=json.dumps({"is_first_run": status}),
+                Body=json.dumps(state),
             )
         except ClientError as e:
             print(e)
@@ -77,86 +163,1361 @@ def change_state(s3_client, status: bool):
         raise TypeError("Only arguments of type bool accepted")
 
 
+def read_state_file(s3_client):
+    """
+    Reads the whole status file, which holds the first run flag and the per-table watermarks.
+
+    Note: this function is specific to the Extract Lambda.
+
+    Args:
+        s3_client (boto3.client): An S3 client used to access the status file.
+
+    Returns:
+        dict: The status file contents, or a first run state if the file doesn't exist yet.
+    """
+    try:
+        response = s3_client.get_object(Bucket=BUCKET, Key=STATUS_KEY)
+        return json.loads(response["Body"].read().decode("utf-8"))
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "NoSuchKey":
+            raise
+        return {"is_first_run": True}
+
+
+def get_watermarks(s3_client):
+    """
+    Gets the high-water mark of every table, i.e. the largest 'last_updated' value that has
+    been successfully exported so far.
+
+    Note: this function is specific to the Extract Lambda.
+
+    Args:
+        s3_client (boto3.client): An S3 client used to access the status file.
+
+    Returns:
+        dict: Table names mapped to their watermark (datetime). Tables never exported are missing.
+    """
+    watermarks = read_state_file(s3_client).get("watermarks", {})
+    return {
+        table: datetime.datetime.fromisoformat(watermark)
+        for table, watermark in watermarks.items()
+    }
+
+
+def set_watermark(s3_client, table, watermark):
+    """
+    Stores the high-water mark for one table in the status file.
+       Only call this once the table's data has been uploaded, so a failed run is retried
+       from the previous watermark instead of skipping rows.
+
+    Note: this function is specific to the Extract Lambda.
+
+    Args:
+        s3_client (boto3.client): An S3 client used to update the status file.
+        table (str): The table the watermark belongs to.
+        watermark (datetime.datetime): The largest 'last_updated' value that was exported.
+    """
+    with state_lock:
+        state = read_state_file(s3_client)
+        state.setdefault("watermarks", {})[table] = watermark.isoformat()
+        s3_client.put_object(Bucket=BUCKET, Key=STATUS_KEY, Body=json.dumps(state))
+
+
+def get_xmin_snapshots(s3_client):
+    """
+    Gets the transaction snapshot taken before the last extract of every XMIN_TABLES table.
+
+    Note: this function is specific to the Extract Lambda.
+
+    Args:
+        s3_client (boto3.client): An S3 client used to access the status file.
+
+    Returns:
+        dict: Table names mapped to their snapshot (str). Tables never exported are missing.
+    """
+    return read_state_file(s3_client).get("snapshots", {})
+
+
+def set_xmin_snapshots(s3_client, snapshots):
+    """
+    Stores the snapshots the next extract of each table starts from.
+       Only call this once the table's data has been uploaded.
+
+    Note: this function is specific to the Extract Lambda.
+
+    Args:
+        s3_client (boto3.client): An S3 client used to update the status file.
+        snapshots (dict): Table names mapped to a snapshot from get_current_snapshot.
+    """
+    with state_lock:
+        state = read_state_file(s3_client)
+        state.setdefault("snapshots", {}).update(snapshots)
+        s3_client.put_object(Bucket=BUCKET, Key=STATUS_KEY, Body=json.dumps(state))
+
+
+def get_usable_snapshots(snapshots, current_snapshot):
+    """
+    Drops the stored snapshots that are too old to compare row xmin values against safely.
+       Their tables are extracted in full instead, and tracked from a new snapshot after that.
+
+    Args:
+        snapshots (dict): Stored snapshots, as returned by get_xmin_snapshots.
+        current_snapshot (str): A snapshot taken now, from get_current_snapshot.
+
+    Returns:
+        dict: The snapshots of XMIN_TABLES tables that can still be used.
+    """
+    usable = {}
+    for table, snapshot in snapshots.items():
+        if table not in XMIN_TABLES:
+            continue
+        if snapshot_age(snapshot, current_snapshot) < XMIN_MAX_AGE:
+            usable[table] = snapshot
+        else:
+            logger.warning(
+                f"The snapshot of {table} is too old to compare transaction ids, "
+                f"extracting the table in full"
+            )
+    return usable
+
+
+def get_cdc_checkpoint(s3_client):
+    """
+    Gets the LSN up to which changes from the replication slot have been stored in S3.
+
+    Note: this function is specific to the Extract Lambda.
+
+    Args:
+        s3_client (boto3.client): An S3 client used to access the status file.
+
+    Returns:
+        str | None: The confirmed LSN, e.g. '0/83E71C0', or None if no changes have been stored yet.
+    """
+    return read_state_file(s3_client).get("cdc_lsn")
+
+
+def set_cdc_checkpoint(s3_client, lsn):
+    """
+    Stores the LSN up to which changes have been uploaded.
+       Only call this once every change file of the batch has been uploaded.
+
+    Note: this function is specific to the Extract Lambda.
+
+    Args:
+        s3_client (boto3.client): An S3 client used to update the status file.
+        lsn (str): The end LSN of the last stored transaction.
+    """
+    with state_lock:
+        state = read_state_file(s3_client)
+        state["cdc_lsn"] = lsn
+        s3_client.put_object(Bucket=BUCKET, Key=STATUS_KEY, Body=json.dumps(state))
+
+
+def get_high_watermark(db_cursor, table, low_watermark=None, replay_point=None):
+    """
+    Gets the largest 'last_updated' value among the rows that are newer than 'low_watermark'.
+
+    Args:
+        db_cursor: An open psycopg2 cursor.
+        table (str): The table to check.
+        low_watermark (datetime.datetime, optional): The table's stored watermark. If None, all rows are checked.
+        replay_point (datetime.datetime, optional): When reading from a replica, the commit time of the last
+            transaction it replayed. Rows updated after it are left for a later run, see clamp_condition.
+
+    Returns:
+        datetime.datetime | None: The new watermark, or None if no rows changed.
+    """
+    query = f"SELECT max(last_updated) AS watermark FROM {table}"
+    conditions, params = [], []
+    if low_watermark is not None:
+        conditions.append("last_updated > %s")
+        params.append(low_watermark)
+    if replay_point is not None:
+        conditions.append(clamp_condition())
+        params.append(replay_point)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    db_cursor.execute(query, params or None)
+    return db_cursor.fetchone()["watermark"]
+
+
+def clamp_condition():
+    """
+    The condition that keeps a watermark at or before a replica's replay point.
+       A replica may have replayed a row updated after its last replayed commit (e.g. a clock ahead
+       of the primary's), but not others updated at the same time. Leaving such rows for a later run,
+       instead of moving the watermark past them, means none of the others are skipped.
+
+    Returns:
+        str: The condition, with one placeholder for the replay point.
+    """
+    return "last_updated <= %s"
+
+
+def build_extract_query(
+    table,
+    low_watermark,
+    high_watermark,
+    key_range=None,
+    full_rows=False,
+    xmin_snapshot=None,
+    select=None,
+    keys=None,
+):
+    """
+    Builds the query for the rows between two watermarks.
+       Both bounds are passed as parameters so the comparison can use an index on 'last_updated'.
+       The upper bound stops rows committed during the export from being skipped next run.
+       Only the table's columns in EXTRACT_COLUMNS are selected, unless 'full_rows' is set.
+
+    Args:
+        table (str): The table to extract.
+        low_watermark (datetime.datetime | None): Exclusive lower bound. If None, there is no lower bound.
+        high_watermark (datetime.datetime | None): Inclusive upper bound. If None, there is no upper bound.
+        key_range (list, optional): A [low, high) primary key range from get_chunk_ranges, to extract one chunk.
+        full_rows (bool, optional): Select every column of the table. Defaults to False.
+        xmin_snapshot (str, optional): Select the rows written after this snapshot, instead of after 'low_watermark'.
+        select (str, optional): The select list to use instead of the table's columns, e.g. from row_hash_select.
+        keys (list, optional): Only select the rows with these primary keys.
+
+    Returns:
+        tuple: The query string and its parameters.
+    """
+    conditions, params = [], []
+    if xmin_snapshot is not None:
+        condition, snapshot_params = xmin_condition(xmin_snapshot)
+        conditions.append(condition)
+        params.extend(snapshot_params)
+    elif low_watermark is not None:
+        conditions.append("last_updated > %s")
+        params.append(low_watermark)
+    if high_watermark is not None:
+        conditions.append("last_updated <= %s")
+        params.append(high_watermark)
+    if keys is not None:
+        conditions.append(f"{PRIMARY_KEYS[table]} = ANY(%s)")
+        params.append(keys)
+    if key_range is not None:
+        low_key, high_key = key_range
+        if low_key is not None:
+            conditions.append(f"{PRIMARY_KEYS[table]} >= %s")
+            params.append(low_key)
+        if high_key is not None:
+            conditions.append(f"{PRIMARY_KEYS[table]} < %s")
+            params.append(high_key)
+    if select is None:
+        columns = None if full_rows else EXTRACT_COLUMNS.get(table)
+        select = ", ".join(columns) if columns else "*"
+    query = f"SELECT {select} FROM {table}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query, tuple(params)
+
+
+def get_chunk_ranges(db_cursor, table, chunk_rows=EXTRACT_CHUNK_ROWS):
+    """
+    Splits a table into primary key ranges of roughly 'chunk_rows' rows each, so a full load
+    can run as several smaller queries.
+       Split points come from the primary key's histogram in pg_stats when the table has been
+       analyzed (which copes with gaps in the keys), otherwise the min/max range is divided evenly.
+
+    Args:
+        db_cursor: An open psycopg2 cursor.
+        table (str): The table to split.
+        chunk_rows (int, optional): The target number of rows per chunk.
+
+    Returns:
+        list[list]: [low, high) key ranges covering the whole table. The first low and last high are
+            None (unbounded). A single [None, None] range means the table doesn't need splitting.
+    """
+    key = PRIMARY_KEYS[table]
+    db_cursor.execute(
+        f"""
+        SELECT min({key}) AS low_key, max({key}) AS high_key,
+            (SELECT greatest(reltuples, 0) FROM pg_class
+                WHERE oid = to_regclass(%s)) AS estimate,
+            (SELECT histogram_bounds::text::bigint[] FROM pg_stats
+                WHERE schemaname = current_schema() AND tablename = %s
+                    AND attname = %s) AS bounds
+        FROM {table}
+        """,
+        (table, table, key),
+    )
+    row = db_cursor.fetchone()
+    if row["low_key"] is None:
+        return [[None, None]]
+    key_span = row["high_key"] - row["low_key"] + 1
+    chunk_count = -(-int(row["estimate"] or key_span) // chunk_rows)
+    if chunk_count <= 1:
+        return [[None, None]]
+
+    bounds = row["bounds"]
+    if bounds and len(bounds) > chunk_count:
+        step = (len(bounds) - 1) / chunk_count
+        splits = [bounds[round(step * index)] for index in range(1, chunk_count)]
+    else:
+        step = key_span / chunk_count
+        splits = [
+            row["low_key"] + round(step * index) for index in range(1, chunk_count)
+        ]
+    splits = sorted(set(splits))
+    return [[low, high] for low, high in zip([None] + splits, splits + [None])]
+
+
+def get_chunk_progress(s3_client):
+    """
+    Gets the chunked full loads that are in progress, so a run that timed out can resume.
+
+    Note: this function is specific to the Extract Lambda.
+
+    Args:
+        s3_client (boto3.client): An S3 client used to access the status file.
+
+    Returns:
+        dict: Table names mapped to {"ranges": [...], "watermark": str, "done": [chunk indexes]}.
+    """
+    return read_state_file(s3_client).get("chunks", {})
+
+
+def save_chunk_plan(s3_client, table, ranges, watermark, snapshot=None):
+    """
+    Records a table's chunk ranges before any chunk is extracted.
+
+    Note: this function is specific to the Extract Lambda.
+
+    Args:
+        s3_client (boto3.client): An S3 client used to update the status file.
+        table (str): The table being loaded.
+        ranges (list[list]): Key ranges from get_chunk_ranges.
+        watermark (datetime.datetime): The watermark the whole load is bounded by.
+        snapshot (str, optional): For XMIN_TABLES, the snapshot taken before the load.
+    """
+    with state_lock:
+        state = read_state_file(s3_client)
+        state.setdefault("chunks", {})[table] = {
+            "ranges": ranges,
+            "watermark": watermark.isoformat(),
+            "snapshot": snapshot,
+            "done": [],
+        }
+        s3_client.put_object(Bucket=BUCKET, Key=STATUS_KEY, Body=json.dumps(state))
+
+
+def complete_chunk(s3_client, table, index):
+    """
+    Marks one chunk of a table as uploaded. When it was the last one, the table's watermark
+    is advanced and its chunk plan removed.
+
+    Note: this function is specific to the Extract Lambda.
+
+    Args:
+        s3_client (boto3.client): An S3 client used to update the status file.
+        table (str): The table being loaded.
+        index (int): The position of the chunk in the table's ranges.
+
+    Returns:
+        bool: True if every chunk of the table is now done.
+    """
+    with state_lock:
+        state = read_state_file(s3_client)
+        plan = state["chunks"][table]
+        plan["done"] = sorted(set(plan["done"]) | {index})
+        finished = len(plan["done"]) == len(plan["ranges"])
+        if finished:
+            del state["chunks"][table]
+            state.setdefault("watermarks", {})[table] = plan["watermark"]
+            if plan.get("snapshot"):
+                state.setdefault("snapshots", {})[table] = plan["snapshot"]
+        s3_client.put_object(Bucket=BUCKET, Key=STATUS_KEY, Body=json.dumps(state))
+    return finished
+
+
+def plan_table(
+    db_cursor,
+    s3_client,
+    table,
+    progress,
+    chunk_rows=EXTRACT_CHUNK_ROWS,
+    replay_point=None,
+):
+    """
+    Decides how a table is extracted on a first run: in one piece, or as primary key chunks.
+       A plan left behind by an earlier run that didn't finish is reused, minus its completed chunks.
+
+    Args:
+        db_cursor: An open psycopg2 cursor.
+        s3_client (boto3.client): An S3 client used to record new chunk plans.
+        table (str): The table to plan.
+        progress (dict): Plans in progress, as returned by get_chunk_progress.
+        chunk_rows (int, optional): Target rows per chunk of a new plan. Defaults to EXTRACT_CHUNK_ROWS.
+        replay_point (datetime.datetime, optional): Clamps the plan's watermark, see get_high_watermark.
+
+    Returns:
+        list[dict | None]: One entry per extraction task. None means the whole table in one query
+            (also used when the table has no watermark to bound the chunks by), otherwise a dict
+            with the chunk's "index", "range" and "watermark".
+    """
+    if table in progress:
+        plan = progress[table]
+        logger.info(
+            f"Resuming the load of {table} at {len(plan['done'])} of {len(plan['ranges'])} chunks"
+        )
+    else:
+        snapshot = get_current_snapshot(db_cursor) if table in XMIN_TABLES else None
+        ranges = get_chunk_ranges(db_cursor, table, chunk_rows)
+        if len(ranges) == 1:
+            return [None]
+        watermark = get_high_watermark(db_cursor, table, replay_point=replay_point)
+        if watermark is None:
+            # every 'last_updated' is NULL: there is nothing to bound the chunks by, and the
+            # unchunked path treats the table as unchanged, as it does on every other run
+            logger.info(f"{table} has no 'last_updated' values, so it is not chunked")
+            return [None]
+        save_chunk_plan(s3_client, table, ranges, watermark, snapshot)
+        plan = {"ranges": ranges, "watermark": watermark.isoformat(), "done": []}
+    watermark = datetime.datetime.fromisoformat(plan["watermark"])
+    return [
+        {"index": index, "range": key_range, "watermark": watermark}
+        for index, key_range in enumerate(plan["ranges"])
+        if index not in plan["done"]
+    ]
+
+
+def copy_query_to_file(db_cursor, query, file, params=None, metrics=None, limiter=None):
+    """
+    Streams the result of a query into a file using the Postgres COPY protocol.
+
+    The database formats the rows as CSV (with a header line) and psycopg2 writes the bytes
+    straight into the file, so no row dicts or DataFrames are built in Python.
+
+    Args:
+        db_cursor: An open psycopg2 cursor.
+        query (str): The SELECT statement to export.
+        file: A writable binary file-like object.
+        params (tuple | list[tuple], optional): Parameters for the query's placeholders, see param_sets.
+        metrics (dict, optional): Not used, COPY fetches and encodes in one step on the server.
+        limiter (RowRateLimiter, optional): Caps the rows/sec read, counted by CSV line as they arrive.
+
+    Returns:
+        int: The number of rows written.
+    """
+    if limiter is not None:
+        file = RateLimitedWriter(file, limiter)
+    row_count = 0
+    for index, query_params in enumerate(param_sets(params)):
+        copy_query = query
+        if query_params:
+            # COPY doesn't take bind parameters, so let psycopg2 quote them into the query
+            copy_query = db_cursor.mogrify(query, query_params).decode()
+        header = " HEADER" if index == 0 else ""
+        db_cursor.copy_expert(f"COPY ({copy_query}) TO STDOUT WITH CSV{header}", file)
+        row_count += db_cursor.rowcount
+    return row_count
+
+
+def param_sets(params):
+    """
+    The parameter sets an extract function runs its query with. A list of tuples runs the query
+    once per tuple, appending every run's rows to the same file, e.g. for batches of keys.
+
+    Args:
+        params (tuple | list[tuple] | None): The 'params' given to the extract function.
+
+    Returns:
+        list: The parameter sets, in order.
+    """
+    return params if isinstance(params, list) else [params]
+
+
+def execute_server_side(db_cursor, name, query, params=None):
+    """
+    Runs a query on a new server-side cursor for each of its parameter sets, see param_sets.
+
+    Args:
+        db_cursor: An open psycopg2 cursor. Its connection is used for the server-side cursors.
+        name (str): Name prefix of the cursors, unique to the calling thread.
+        query (str): The SELECT statement to run.
+        params (tuple | list[tuple], optional): Parameters for the query's placeholders.
+
+    Yields:
+        A psycopg2 named cursor that has executed the query, closed when the next is asked for.
+    """
+    for query_params in param_sets(params):
+        server_cursor = db_cursor.connection.cursor(
+            name=f"{name}_{threading.get_ident()}",
+            cursor_factory=psycopg2.extensions.cursor,
+        )
+        try:
+            server_cursor.execute(query, query_params)
+            yield server_cursor
+        finally:
+            server_cursor.close()
+
+
+def fetch_batches(server_cursor, batch_size, metrics=None, limiter=None):
+    """
+    Fetches the rows of an executed server-side cursor in batches.
+       With 'EXTRACT_PIPELINE_DEPTH' above 0 and 'metrics' given, up to that many batches are
+       fetched ahead on a background thread, so the database keeps sending while the caller encodes.
+
+    Args:
+        server_cursor: A psycopg2 named cursor that has executed its query.
+        batch_size (int): Number of rows fetched per round trip.
+        metrics (dict, optional): Collects the 'rows' queue wait times, see MeteredQueue.
+        limiter (RowRateLimiter, optional): Caps the rows/sec fetched.
+
+    Returns:
+        Iterator[list]: The batches of rows, in order.
+    """
+
+    def fetch():
+        rows = server_cursor.fetchmany(batch_size)
+        if limiter is not None:
+            limiter.wait(len(rows))
+        return rows
+
+    batches = iter(fetch, [])
+    if EXTRACT_PIPELINE_DEPTH and metrics is not None:
+        batches = iterate_in_background(
+            batches, "rows", EXTRACT_PIPELINE_DEPTH, metrics
+        )
+    return batches
+
+
+def fetch_query_to_file(
+    db_cursor, query, file, params=None, batch_size=1000, metrics=None, limiter=None
+):
+    """
+    Runs a query on a server-side cursor and writes the result to a file as CSV, one batch of rows at a time.
+
+    This is the original fetchmany + DataFrame path, kept as a fallback for when COPY is not available.
+    Booleans are written as 't'/'f' to match the COPY output.
+
+    Args:
+        db_cursor: An open psycopg2 cursor. Its connection is used for the server-side cursor.
+        query (str): The SELECT statement to export.
+        file: A writable binary file-like object.
+        params (tuple | list[tuple], optional): Parameters for the query's placeholders, see param_sets.
+        batch_size (int, optional): Number of rows fetched per round trip. Defaults to 1000.
+        metrics (dict, optional): If given, the next batches are fetched while one is encoded, see fetch_batches.
+        limiter (RowRateLimiter, optional): Caps the rows/sec fetched.
+
+    Returns:
+        int: The number of rows written.
+    """
+    import pandas as pd
+
+    row_count = 0
+    with closing(
+        execute_server_side(db_cursor, "batch_extract", query, params)
+    ) as server_cursors:
+        for server_cursor in server_cursors:
+            for rows in fetch_batches(server_cursor, batch_size, metrics, limiter):
+                df_batch = pd.DataFrame.from_records(
+                    rows, columns=[desc[0] for desc in server_cursor.description]
+                )
+                for desc in server_cursor.description:
+                    # write booleans the way COPY does ('t'/'f'), so both modes produce the same files
+                    if desc.type_code in psycopg2.extensions.BOOLEAN.values:
+                        df_batch[desc.name] = df_batch[desc.name].map(
+                            {True: "t", False: "f"}
+                        )
+                df_batch.to_csv(file, mode="wb", index=False, header=row_count == 0)
+                row_count += len(rows)
+    return row_count
+
+
+def parquet_query_to_file(
+    db_cursor, query, file, params=None, batch_size=10000, metrics=None, limiter=None
+):
+    """
+    Runs a query on a server-side cursor and writes the result to a file as compressed Parquet.
+       The Arrow schema is fixed from the cursor's column types before the first batch is written,
+       so timestamps, numerics and integers keep their types instead of being re-parsed from text.
+
+    Args:
+        db_cursor: An open psycopg2 cursor. Its connection is used for the server-side cursor.
+        query (str): The SELECT statement to export.
+        file: A writable binary file-like object.
+        params (tuple | list[tuple], optional): Parameters for the query's placeholders, see param_sets.
+        batch_size (int, optional): Number of rows fetched and written per row group. Defaults to 10000.
+        metrics (dict, optional): If given, the next batches are fetched while one is encoded, see fetch_batches.
+        limiter (RowRateLimiter, optional): Caps the rows/sec fetched.
+
+    Returns:
+        int: The number of rows written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from src.utils.schemas import arrow_schema_from_description
+
+    writer = None
+    row_count = 0
+    try:
+        with closing(
+            execute_server_side(db_cursor, "parquet_extract", query, params)
+        ) as server_cursors:
+            for server_cursor in server_cursors:
+                rows = server_cursor.fetchmany(batch_size)
+                if limiter is not None:
+                    limiter.wait(len(rows))
+                if writer is None:
+                    # fixed by the first run of the query, which later parameter sets share
+                    schema = arrow_schema_from_description(server_cursor.description)
+                    writer = pq.ParquetWriter(file, schema, compression="zstd")
+                batches = (
+                    fetch_batches(server_cursor, batch_size, metrics, limiter)
+                    if rows
+                    else []
+                )
+                for rows in itertools.chain([rows] if rows else [], batches):
+                    columns = zip(*rows)
+                    arrays = [
+                        pa.array(
+                            (
+                                [
+                                    None if value is None else str(value)
+                                    for value in column
+                                ]
+                                if pa.types.is_string(field.type)
+                                else column
+                            ),
+                            type=field.type,
+                        )
+                        for column, field in zip(columns, schema)
+                    ]
+                    writer.write_batch(
+                        pa.RecordBatch.from_arrays(arrays, schema=schema)
+                    )
+                    row_count += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    return row_count
+
+
+extract_functions = {
+    "copy": copy_query_to_file,
+    "batch": fetch_query_to_file,
+}
+
+file_formats = {
+    # format: (file extension, content type)
+    "csv": ("csv", "text/csv"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+
+def get_extract_function():
+    """
+    Picks the function that writes a query's rows to a file, from 'EXTRACT_FORMAT' and 'EXTRACT_MODE'.
+    Parquet is always written from a server-side cursor; CSV uses COPY or the batch fallback.
+
+    Returns:
+        tuple: The extract function and a short name for it used in the logs.
+    """
+    if EXTRACT_FORMAT == "parquet":
+        return parquet_query_to_file, "parquet"
+    return extract_functions[EXTRACT_MODE], EXTRACT_MODE
+
+
+def row_hash_select(db_cursor, table):
+    """
+    Builds the select list of a table's row hash query: the primary key and a hash of the
+    columns the warehouse uses. 'last_updated' is left out, so touching it doesn't change the hash.
+
+    Args:
+        db_cursor: An open psycopg2 cursor, to look up the columns of tables extracted whole.
+        table (str): The table to hash.
+
+    Returns:
+        str: The select list, with the columns 'row_key' and 'row_hash'.
+    """
+    from src.utils.hash_index import row_hash_expression
+
+    columns = EXTRACT_COLUMNS.get(table)
+    if columns is None:
+        db_cursor.execute(
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = %s
+            ORDER BY ordinal_position
+            """,
+            (table,),
+        )
+        columns = [row["column_name"] for row in db_cursor.fetchall()]
+    content = [column for column in columns if column != "last_updated"]
+    return (
+        f"{PRIMARY_KEYS[table]} AS row_key, {row_hash_expression(content)} AS row_hash"
+    )
+
+
+def fetch_row_hashes(db, query, params=None, batch_size=100000):
+    """
+    Streams the results of a row hash query with a server-side cursor, so a full table's
+    hashes are never held in memory at once.
+
+    Args:
+        db: An open psycopg2 connection, inside a transaction.
+        query (str): A query built with row_hash_select.
+        params (tuple, optional): Parameters for the query.
+        batch_size (int, optional): Rows fetched per round trip.
+
+    Yields:
+        tuple[numpy.ndarray, numpy.ndarray]: A batch of primary keys and their row hashes (int64).
+    """
+    import numpy as np
+
+    with db.cursor(name="row_hashes") as db_cursor:
+        db_cursor.itersize = batch_size
+        db_cursor.execute(query, params)
+        while rows := db_cursor.fetchmany(batch_size):
+            yield (
+                np.fromiter((row["row_key"] for row in rows), np.int64, len(rows)),
+                np.fromiter((row["row_hash"] for row in rows), np.int64, len(rows)),
+            )
+
+
+def find_changed_rows(db, index, query, params=None):
+    """
+    Compares the hashes of the rows a query selects with those stored in the index.
+
+    Args:
+        db: An open psycopg2 connection, inside a transaction.
+        index (RowHashIndex): The table's hash index.
+        query (str): A query built with row_hash_select.
+        params (tuple, optional): Parameters for the query.
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: The keys and hashes of the rows whose content changed, or that are new.
+    """
+    import numpy as np
+
+    changed_keys, changed_hashes = [np.empty(0, np.int64)], [np.empty(0, np.int64)]
+    for keys, hashes in fetch_row_hashes(db, query, params):
+        mask = index.changed(keys, hashes)
+        changed_keys.append(keys[mask])
+        changed_hashes.append(hashes[mask])
+    return np.concatenate(changed_keys), np.concatenate(changed_hashes)
+
+
+def probe_changes(db_cursor, table_list, watermarks, snapshots=None, replay_point=None):
+    """
+    Checks every table for changes in one round trip, so unchanged tables can be skipped
+    without running their extract query.
+
+    Args:
+        db_cursor: An open psycopg2 cursor.
+        table_list (list[str]): The tables to check.
+        watermarks (dict): Stored watermarks, as returned by get_watermarks. Tables without one are checked in full.
+        snapshots (dict, optional): Usable snapshots of XMIN_TABLES, checked instead of their watermark.
+        replay_point (datetime.datetime, optional): Clamps the watermarks, see get_high_watermark.
+            XMIN_TABLES aren't clamped, rows their snapshot can see are always exported.
+
+    Returns:
+        dict: Table names mapped to {"watermark": the largest changed 'last_updated' (None if no rows
+            changed), "changed": the number of changed rows}.
+    """
+    if not table_list:
+        return {}
+    selects, params = [], []
+    for table in table_list:
+        select = (
+            f"SELECT %s AS table_name, max(last_updated) AS watermark, "
+            f"count(*) AS changed FROM {table}"
+        )
+        params.append(table)
+        if table in XMIN_TABLES:
+            if (snapshots or {}).get(table) is not None:
+                condition, snapshot_params = xmin_condition(snapshots[table])
+                select += f" WHERE {condition}"
+                params.extend(snapshot_params)
+        else:
+            conditions = []
+            if watermarks.get(table) is not None:
+                conditions.append("last_updated > %s")
+                params.append(watermarks[table])
+            if replay_point is not None:
+                conditions.append(clamp_condition())
+                params.append(replay_point)
+            if conditions:
+                select += " WHERE " + " AND ".join(conditions)
+        selects.append(select)
+    db_cursor.execute(" UNION ALL ".join(selects), params)
+    return {
+        row["table_name"]: {"watermark": row["watermark"], "changed": row["changed"]}
+        for row in db_cursor.fetchall()
+    }
+
+
+def order_tables_by_size(db_cursor, table_list):
+    """
+    Sorts tables largest first using the planner's row estimate (pg_class.reltuples),
+    so the longest extraction is started first when tables run in parallel.
+
+    Args:
+        db_cursor: An open psycopg2 cursor.
+        table_list (list[str]): The tables to sort.
+
+    Returns:
+        list[str]: The same tables, largest first. Tables without statistics go last.
+    """
+    db_cursor.execute(
+        """
+        SELECT t.name AS table_name, greatest(c.reltuples, 0) AS estimate
+        FROM unnest(%s::text[]) AS t(name)
+        JOIN pg_class c ON c.oid = to_regclass(t.name)
+        """,
+        (table_list,),
+    )
+    estimates = {row["table_name"]: row["estimate"] for row in db_cursor.fetchall()}
+    return sorted(table_list, key=lambda table: -estimates.get(table, 0))
+
+
+def extract_table(
+    table,
+    pool,
+    s3_client,
+    watermarks,
+    snapshot_id=None,
+    chunk=None,
+    high_watermark=None,
+    full_rows=False,
+    snapshots=None,
+    governor=None,
+    replay_point=None,
+):
+    """
+    Exports the changed rows of one table to S3 and advances its watermark.
+       Runs on its own pooled connection so several tables can be extracted at once.
+       "No changes" and failure are logged here. The success message is returned instead,
+       so the handler can log every export in TABLE_LIST order.
+
+    Args:
+        table (str): The table to extract.
+        pool (ConnectionPool): Pool to borrow a database connection from.
+        s3_client (boto3.client): An S3 client used for the upload and the status file.
+        watermarks (dict): Stored watermarks, as returned by get_watermarks. Tables without one are exported in full.
+        snapshot_id (str, optional): An exported snapshot to read from, so every table sees the same database state.
+        chunk (dict, optional): One chunk from plan_table. If given, only that key range is exported, to its own part file.
+        high_watermark (datetime.datetime, optional): The table's new watermark, if already found by probe_changes.
+        full_rows (bool, optional): Export every column instead of only those in EXTRACT_COLUMNS.
+        snapshots (dict, optional): Usable snapshots of XMIN_TABLES, from get_usable_snapshots.
+            An XMIN_TABLES table is exported from its snapshot, or in full if it has none.
+        governor (LoadGovernor, optional): If given, the export waits for a slot, reports the source's
+            latency to it before querying, and reads at most its rows/sec for the table.
+        replay_point (datetime.datetime, optional): Clamps the new watermark, see get_high_watermark.
+
+    Returns:
+        dict | None: The table name, S3 key, row count, size, checksum, watermark and log message
+            of the exported file, or None if nothing was exported.
+    """
+    try:
+        with governor.slot() if governor else nullcontext(), pool.connection() as db:
+            if snapshot_id:
+                use_snapshot(db, snapshot_id)
+            hashing = EXTRACT_ROW_HASHES and chunk is None and not full_rows
+            if hashing and not snapshot_id:
+                # the hash queries must see the same rows as the export
+                db.cursor().execute(
+                    "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY"
+                )
+            db_cursor = db.cursor()
+            if governor is not None:
+                governor.measure(db_cursor)
+            xmin_tracked = table in XMIN_TABLES
+            new_snapshot = None
+            if chunk is None:
+                # a table with no watermark yet has never been exported, so it is exported in full
+                low_watermark = watermarks.get(table)
+                snapshot = (snapshots or {}).get(table)
+                if xmin_tracked:
+                    # taken before the query, so rows committed meanwhile are read again next run
+                    new_snapshot = get_current_snapshot(db_cursor)
+                    if high_watermark is None:
+                        high_watermark = probe_changes(
+                            db_cursor, [table], watermarks, snapshots, replay_point
+                        )[table]["watermark"]
+                elif high_watermark is None:
+                    high_watermark = get_high_watermark(
+                        db_cursor, table, low_watermark, replay_point
+                    )
+                if high_watermark is None:
+                    db.rollback()
+                    logger.info(f"No data changes in the table {table}")
+                    return None
+                if xmin_tracked:
+                    bounds = (None, None)
+                else:
+                    bounds, snapshot = (low_watermark, high_watermark), None
+                query, params = build_extract_query(
+                    table, *bounds, full_rows=full_rows, xmin_snapshot=snapshot
+                )
+                part = ""
+                if hashing:
+                    from src.utils.hash_index import RowHashIndex
+
+                    index = RowHashIndex(s3_client, BUCKET, table)
+                    hash_query, hash_params = build_extract_query(
+                        table,
+                        *bounds,
+                        xmin_snapshot=snapshot,
+                        select=row_hash_select(db_cursor, table),
+                    )
+                    # a full export stores the hash of every row, after the upload
+                    incremental = bounds[0] is not None or snapshot is not None
+                if hashing and incremental:
+                    changed_keys, changed_hashes = find_changed_rows(
+                        db, index, hash_query, hash_params
+                    )
+                    if not len(changed_keys):
+                        db.rollback()
+                        set_watermark(s3_client, table, high_watermark)
+                        if new_snapshot is not None:
+                            set_xmin_snapshots(s3_client, {table: new_snapshot})
+                        logger.info(f"No content changes in the table {table}")
+                        return None
+                    # sorted batches keep each query's SQL small and its keys in one index range
+                    sorted_keys = changed_keys[changed_keys.argsort()]
+                    params = []
+                    for start in range(0, len(sorted_keys), EXTRACT_KEY_BATCH):
+                        query, batch_params = build_extract_query(
+                            table,
+                            *bounds,
+                            full_rows=full_rows,
+                            xmin_snapshot=snapshot,
+                            keys=sorted_keys[
+                                start : start + EXTRACT_KEY_BATCH
+                            ].tolist(),
+                        )
+                        params.append(batch_params)
+            else:
+                high_watermark = chunk["watermark"]
+                query, params = build_extract_query(
+                    table,
+                    None,
+                    None if xmin_tracked else high_watermark,
+                    chunk["range"],
+                    full_rows,
+                )
+                part = f"_part{chunk['index']:04d}"
+
+            current_time = datetime.datetime.now(datetime.UTC)
+            year = current_time.strftime("%Y")
+            month = current_time.strftime("%m")
+            day = current_time.strftime("%d")
+
+            extension, content_type = file_formats[EXTRACT_FORMAT]
+            extract_function, mode = get_extract_function()
+            compression = EXTRACT_COMPRESSION if EXTRACT_FORMAT == "csv" else "none"
+            suffix = COMPRESSION_SUFFIXES[compression]
+            file_name = f"{table}_{current_time}{part}.{extension}{suffix}"
+            file_key = f"{year}/{month}/{day}/{file_name}"
+
+            start = time.perf_counter()
+            metrics = {}
+            with S3MultipartWriter(
+                s3_client, BUCKET, file_key, content_type=content_type
+            ) as file:
+                with compressed_writer(file, compression) as out:
+                    # compression and upload run on their own thread, behind the fetch and encoding
+                    with (
+                        BackgroundWriter(out, EXTRACT_PIPELINE_DEPTH, metrics)
+                        if EXTRACT_PIPELINE_DEPTH
+                        else nullcontext(out)
+                    ) as staged:
+                        row_count = extract_function(
+                            db_cursor,
+                            query,
+                            staged,
+                            params,
+                            metrics=metrics,
+                            limiter=governor and governor.limiter(table),
+                        )
+                if row_count == 0:
+                    file.abort()
+            duration = time.perf_counter() - start
+            metrics["parts_full_wait"] = file.upload_wait
+            if hashing:
+                if incremental:
+                    index.update(changed_keys, changed_hashes)
+                else:
+                    for keys, hashes in fetch_row_hashes(db, hash_query, hash_params):
+                        index.update(keys, hashes)
+                index.flush()
+            db.rollback()  # ends the read-only transaction before the connection is reused
+
+        if chunk is not None:
+            complete_chunk(s3_client, table, chunk["index"])
+        if new_snapshot is not None:
+            set_xmin_snapshots(s3_client, {table: new_snapshot})
+        if row_count == 0:
+            logger.info(f"No data changes in the table {table}{part}")
+            return None
+        if chunk is None:
+            set_watermark(s3_client, table, high_watermark)
+        return {
+            "table": table,
+            "key": file_key,
+            "row_count": row_count,
+            "bytes": file.bytes_written,
+            "checksum": file.checksum,
+            "watermark": high_watermark.isoformat(),
+            "stalls": metrics,
+            "message": f"Data exported to 's3://{BUCKET}/{file_name}' successfully. "
+            f"{row_count} rows in {duration:.3f}s "
+            f"({row_count / max(duration, 1e-6):.0f} rows/sec, {mode} mode). Stalls: "
+            + ", ".join(f"{name} {wait:.3f}s" for name, wait in metrics.items()),
+        }
+
+    except Exception as e:
+        logger.error(
+            {
+                "message": f"failed to extract the table {table}",
+                "chunk": chunk and chunk["index"],
+                "details": e,
+            }
+        )
+        return None
+
+
+def write_change_file(s3_client, table, changes, full_rows=False):
+    """
+    Uploads the changes read for one table as a CSV change file.
+       Every row is written as it is after the change, followed by an 'op' column:
+       'I' insert, 'U' update or 'D' delete. Deleted rows only hold their primary key.
+       Rows are in commit order, so the last row for a key is its latest state.
+
+    Args:
+        s3_client (boto3.client): An S3 client used for the upload.
+        table (str): The table the changes belong to.
+        changes (list[dict]): The table's changes, as returned by read_changes.
+        full_rows (bool, optional): Write every column instead of only those in EXTRACT_COLUMNS.
+
+    Returns:
+        dict: The table name, S3 key, row count, size, checksum and log message of the file.
+    """
+    columns = EXTRACT_COLUMNS.get(table)
+    if full_rows or columns is None:
+        columns = list(changes[0]["row"])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns + ["op"])
+    for change in changes:
+        writer.writerow(
+            [change["row"].get(column) for column in columns] + [change["op"]]
+        )
+
+    current_time = datetime.datetime.now(datetime.UTC)
+    suffix = COMPRESSION_SUFFIXES[EXTRACT_COMPRESSION]
+    file_name = f"{table}_{current_time}_changes.csv{suffix}"
+    file_key = f"{current_time:%Y/%m/%d}/{file_name}"
+    with S3MultipartWriter(
+        s3_client, BUCKET, file_key, content_type="text/csv"
+    ) as file:
+        with compressed_writer(file, EXTRACT_COMPRESSION) as out:
+            out.write(buffer.getvalue().encode("utf-8"))
+
+    counts = {op: sum(change["op"] == op for change in changes) for op in "IUD"}
+    return {
+        "table": table,
+        "key": file_key,
+        "row_count": len(changes),
+        "bytes": file.bytes_written,
+        "checksum": file.checksum,
+        "watermark": None,
+        "message": f"Data exported to 's3://{BUCKET}/{file_name}' successfully. "
+        f"{len(changes)} changes ({counts['I']} inserts, {counts['U']} updates, "
+        f"{counts['D']} deletes, cdc mode)",
+    }
+
+
+def extract_changes(db, s3_client, full_rows=False):
+    """
+    Exports the changes waiting in the replication slot, one change file per table, then
+    stores the confirmed LSN and advances the slot past them.
+       If an upload fails, neither is moved, so the next run reads the same changes again.
+
+    Note: this function is specific to the Extract Lambda.
+
+    Args:
+        db: A psycopg2 connection in autocommit mode.
+        s3_client (boto3.client): An S3 client used for the uploads and the status file.
+        full_rows (bool, optional): Write every column instead of only those in EXTRACT_COLUMNS.
+
+    Returns:
+        tuple[list[dict], str | None]: The results of write_change_file in TABLE_LIST order,
+            and the new checkpoint LSN, or None if no transactions were waiting.
+    """
+    checkpoint = get_cdc_checkpoint(s3_client)
+    changes, lsn = read_changes(
+        db, CDC_SLOT, CDC_PUBLICATION, CDC_MAX_CHANGES, after_lsn=checkpoint
+    )
+    exported = []
+    for table in TABLE_LIST:
+        table_changes = [change for change in changes if change["table"] == table]
+        if not table_changes:
+            logger.info(f"No data changes in the table {table}")
+            continue
+        exported.append(write_change_file(s3_client, table, table_changes, full_rows))
+    if lsn is None:
+        return exported, checkpoint
+    if checkpoint is None or lsn_to_int(lsn) > lsn_to_int(checkpoint):
+        set_cdc_checkpoint(s3_client, lsn)
+    else:
+        lsn = checkpoint  # everything read was already stored, only the slot is behind
+    advance_slot(db, CDC_SLOT, lsn)
+    return exported, lsn
+
+
+def write_manifest(s3_client, exported, full_rows=False, lsn=None):
+    """
+    Writes the list of files this run exported to S3, so transform can find them with one GET
+    instead of reading them back out of the logs.
+       A manifest is written even when nothing changed, so an empty run is recorded too.
+
+    Note: this function is specific to the Extract Lambda.
+
+    Args:
+        s3_client (boto3.client): An S3 client used to write the manifest.
+        exported (list[dict]): Results of extract_table, in the order transform should read them.
+        full_rows (bool, optional): Whether the files hold every column, rather than only those in EXTRACT_COLUMNS.
+        lsn (str, optional): In cdc mode, the checkpoint LSN the change files are complete up to.
+
+    Returns:
+        str: The key of the manifest object.
+    """
+    current_time = datetime.datetime.now(datetime.UTC)
+    manifest_key = (
+        f"{MANIFEST_PREFIX}/{current_time:%Y/%m/%d}/extract_{current_time}.json"
+    )
+    manifest = {
+        "created_at": current_time.isoformat(),
+        "full_rows": full_rows,
+        "lsn": lsn,
+        "files": [
+            {
+                field: result[field]
+                for field in (
+                    "key",
+                    "table",
+                    "row_count",
+                    "bytes",
+                    "checksum",
+                    "watermark",
+                )
+            }
+            for result in exported
+        ],
+    }
+    s3_client.put_object(
+        Bucket=BUCKET,
+        Key=manifest_key,
+        Body=json.dumps(manifest),
+        ContentType="application/json",
+    )
+    return manifest_key
+
+
 def extract_handler(event, context):
     """
     Main function that connects to the transactional database (OLTP), checks for updates,
-    and uploads any new or changed data to an S3 bucket in CSV format.
+    and uploads any new or changed data to an S3 bucket in CSV (or Parquet) format.
 
     Scheduled to run automatically every 10 minutes.
     - If this is the first time the pipeline is run, it extracts all data from each table.
-    - On subsequent runs, it extracts only rows updated in the last 10 minutes.
+    - On subsequent runs, it extracts only rows updated since the table's stored watermark
+      (tables without a watermark are exported in full).
+    - A table's watermark only advances once its file has been uploaded.
+    - Rows are streamed out with COPY by default; set 'EXTRACT_MODE' to 'batch' to use the fetchmany fallback.
+    - Set 'EXTRACT_FORMAT' to 'parquet' to write typed, zstd-compressed Parquet files instead of CSV.
+    - Only the columns the warehouse uses (EXTRACT_COLUMNS in src/utils/columns.py) are selected.
+      Set 'EXTRACT_FULL_ROWS' to true, or pass 'full_rows': true in the event, to export every column for an audit.
+    - Set 'EXTRACT_COMPRESSION' to 'gzip' or 'zstd' to compress CSV files as they stream out.
+      The key gets a '.gz' or '.zst' suffix so the reader knows how to decompress it.
     - All exported data is stored in the S3 bucket defined in the environment variable 'BUCKET' and logged.
-    - If there are no chnages this is also logged.
+    - Every run writes a manifest listing its files (key, table, row count, size, checksum and
+      watermark) under 'manifests/', and returns its key for transform to read.
+    - If there are no chnages this is also logged. One batched query finds the tables that changed
+      since their watermark first, and the rest are skipped without running their extract query.
     - Each table is saved to a dated folder structure that contains date, tablename, and timestamp.
+    - On a first run, tables with more than 'EXTRACT_CHUNK_ROWS' rows are split into primary key ranges,
+      each saved as its own part file. Completed chunks are recorded, so a run that times out
+      resumes from the chunks that are left. The first run only ends once every chunk is done,
+      and tables it already finished are only extracted from their watermark on resume.
+    - Up to 'EXTRACT_WORKERS' tables (or chunks) are extracted at once, each on its own pooled connection,
+      largest (or on repeat runs, most changed) first. The pool outlives the invocation, so a warm
+      Lambda reuses its connections (pinged first if idle for a while); its hit and miss counts are returned.
+      The exported files are logged once every table has finished, in TABLE_LIST order.
+    - With 'EXTRACT_SNAPSHOT' set to true, a coordinator connection exports a REPEATABLE READ snapshot
+      that every worker imports, so all tables are read from the same database state. A
+      'snapshot_id' in the event is used instead, for workers running in separate invocations.
+    - Rows are streamed to S3 as a multipart upload while they are read, nothing is staged in /tmp.
+    - A LoadGovernor protects the source: every export first times a 'SELECT 1', and when it takes
+      longer than 'EXTRACT_LATENCY_TARGET_MS' fewer exports run at once and new chunks get smaller.
+      'EXTRACT_MAX_ROWS_PER_SEC' caps the rows read per second from each table. Every session is named
+      'PG_APPLICATION_NAME' and has statement, lock and idle-in-transaction timeouts (src/utils/connection.py).
+    - With 'PG_REPLICA_DSNS' set, tables are read from the replica least behind the primary, as long as
+      it is within 'PG_MAX_REPLICA_LAG_SECONDS' (otherwise from the primary). Watermarks never pass the
+      replica's replay point (pg_last_xact_replay_timestamp()), so rows it hasn't caught up on are
+      picked up by a later run. CDC always reads from the primary, which holds the slot.
+    - Tables listed in 'EXTRACT_XMIN_TABLES' are tracked by transaction instead of by 'last_updated':
+      the snapshot taken before each export is stored, and the next run exports the rows written by
+      transactions it couldn't see, however 'last_updated' was set. A snapshot too old to compare
+      transaction ids safely (XMIN_MAX_AGE) is dropped and the table is exported in full.
+    - With 'EXTRACT_ROW_HASHES' set to true, a 64 bit md5 of each row's warehouse columns is compared
+      with the hash stored when the row was last exported, and rows that only had 'last_updated'
+      touched are left out. The hashes are kept in Parquet shards of a million keys under 'hash_index/',
+      and only the shards of changed keys are read, so memory stays bounded for very large tables.
+      The changed rows are exported in queries of at most 'EXTRACT_KEY_BATCH' keys, into one file.
+    - Set 'EXTRACT_STRATEGY' to 'cdc' to read repeat runs from a logical replication slot ('pgoutput',
+      needs wal_level=logical) instead of polling 'last_updated', so hard deletes are captured too.
+      The slot and its publication are created on the first cdc run, which still polls the tables.
+      After that each table's inserts, updates and deletes are written to a '_changes.csv' file with
+      an 'op' column, and the confirmed LSN is stored in the status file as the checkpoint.
 
     Args:
         event (dict): An event to trigger the Lambda- required for Lambda compatibility (pass empty dict).
+            May contain a 'snapshot_id' exported by a coordinator that is still holding it open,
+            and 'full_rows' to override 'EXTRACT_FULL_ROWS'.
         context (object): A context for the Lambda (locally- pass None).
 
     Returns:
-        dict: Contains the log group name, useful for tracing logs.
+        dict: Contains the key of the run's manifest, the log group name, useful for tracing logs,
+            and the connection pool's counts so far (ConnectionPool.stats).
     """
-    current_state = get_state(
-        boto3.client("s3")
-    )  # checks if it is the first run- returns bool
+    s3 = get_client("s3")
+    current_state = get_state(s3)  # checks if it is the first run- returns bool
+    replica, replay_point = (None, None)
+    if not (event or {}).get("snapshot_id"):
+        # a snapshot exported by another invocation can only be imported on the primary
+        replica, replay_point = choose_replica()
+    source_args = () if replica is None else (replica,)
+    if replica is not None:
+        # the dsn isn't logged, it may hold a password
+        logger.info(f"Extracting from a replica, replayed up to {replay_point}")
+    source = functools.partial(create_connection, *source_args)
+    # kept open between warm invocations
+    pool = get_pool(create_connection, *source_args, max_size=EXTRACT_WORKERS)
+    governor = LoadGovernor(
+        EXTRACT_WORKERS, EXTRACT_LATENCY_TARGET_MS, EXTRACT_MAX_ROWS_PER_SEC
+    )
+    coordinator = None
+    cdc_db = None
     try:
-        db = create_connection()
-
-        table_list = [
-            "address",
-            "counterparty",
-            "currency",
-            "department",
-            "design",
-            "payment",
-            "payment_type",
-            "purchase_order",
-            "sales_order",
-            "staff",
-            "transaction",
-        ]
-        condition = " WHERE now() - last_updated <= interval '10 mins'"
-        db_cursor = db.cursor()
-
-        for table in table_list:
-            query = f"SELECT * FROM {table}" + (
-                condition if current_state is False else ""
+        snapshot_id = (event or {}).get("snapshot_id")
+        full_rows = (event or {}).get("full_rows", EXTRACT_FULL_ROWS)
+        if snapshot_id is None and EXTRACT_SNAPSHOT:
+            # held open until every table is extracted, or the snapshot disappears
+            coordinator = connect_with_retry(source)
+            snapshot_id = export_snapshot(coordinator)
+        lsn = None
+        if EXTRACT_STRATEGY == "cdc":
+            cdc_db = connect_with_retry(create_connection)
+            cdc_db.autocommit = True
+            # a new slot only holds changes made from now on, so the tables are polled once more
+            slot_created = ensure_replication_slot(
+                cdc_db, CDC_SLOT, CDC_PUBLICATION, TABLE_LIST
             )
+        if cdc_db is not None and not slot_created and current_state is False:
+            exported, lsn = extract_changes(cdc_db, s3, full_rows)
+        else:
+            # a first run that was cut short has already written watermarks for the tables it finished
+            watermarks = get_watermarks(s3)
+            with pool.connection() as db:
+                if snapshot_id:
+                    use_snapshot(db, snapshot_id)
+                current_snapshot = get_current_snapshot(db.cursor())
+                snapshots = get_usable_snapshots(
+                    get_xmin_snapshots(s3), current_snapshot
+                )
+                tasks = [(table, None) for table in TABLE_LIST]
+                if current_state is True:
+                    # a slow source gets smaller chunks from the start
+                    governor.measure(db.cursor())
+                    chunk_rows = governor.chunk_rows(EXTRACT_CHUNK_ROWS)
+                    table_list = order_tables_by_size(db.cursor(), TABLE_LIST)
+                    progress = get_chunk_progress(s3)
+                    tasks = [
+                        (table, chunk)
+                        for table in table_list
+                        for chunk in (
+                            [None]
+                            if table in watermarks
+                            else plan_table(
+                                db.cursor(),
+                                s3,
+                                table,
+                                progress,
+                                chunk_rows,
+                                replay_point,
+                            )
+                        )
+                    ]
+                changes = probe_changes(
+                    db.cursor(),
+                    [table for table, chunk in tasks if chunk is None],
+                    watermarks,
+                    snapshots,
+                    replay_point,
+                )
+                db.rollback()
+            # unchanged XMIN_TABLES start from a newer snapshot, so it never gets too old to use
+            unchanged = {
+                table: current_snapshot
+                for table in XMIN_TABLES & set(changes)
+                if changes[table]["watermark"] is None
+            }
+            if unchanged:
+                set_xmin_snapshots(s3, unchanged)
+            for table in TABLE_LIST:
+                if table in changes and changes[table]["watermark"] is None:
+                    logger.info(f"No data changes in the table {table}")
+            tasks = [
+                (table, chunk)
+                for table, chunk in tasks
+                if chunk is not None or changes[table]["watermark"] is not None
+            ]
+            if current_state is False:
+                # most changed first, so the longest export doesn't start last
+                tasks.sort(key=lambda task: -changes[task[0]]["changed"])
 
-            db_cursor.execute(query)
-
-            try:
-                current_time = datetime.datetime.now(datetime.UTC)
-                csv_path = "/tmp/new_file.csv"
-                batch_size = 1000
-                first_batch = True
-                while True:
-                    rows = db_cursor.fetchmany(batch_size)
-                    if not rows:
-                        break
-                    df_batch = pd.DataFrame.from_records(
-                        rows, columns=[desc[0] for desc in db_cursor.description]
+            with ThreadPoolExecutor(max_workers=EXTRACT_WORKERS) as executor:
+                results = list(
+                    executor.map(
+                        lambda task: extract_table(
+                            task[0],
+                            pool,
+                            s3,
+                            watermarks,
+                            snapshot_id,
+                            chunk=task[1],
+                            high_watermark=(
+                                changes[task[0]]["watermark"]
+                                if task[1] is None
+                                else None
+                            ),
+                            full_rows=full_rows,
+                            snapshots=snapshots,
+                            governor=governor,
+                            replay_point=replay_point,
+                        ),
+                        tasks,
                     )
-                    if first_batch:
-                        df_batch.to_csv(csv_path, mode="w", index=False)
-                        first_batch = False
-                    else:
-                        df_batch.to_csv(csv_path, mode="a", index=False, header=False)
-                year = datetime.datetime.now(datetime.UTC).strftime("%Y")
-                month = datetime.datetime.now(datetime.UTC).strftime("%m")
-                day = datetime.datetime.now(datetime.UTC).strftime("%d")
-
-                csv_file_name_key = f"{year}/{month}/{day}/{table}_{current_time}.csv"
-                csv_file_name = f"s3://{BUCKET}/{table}_{current_time}.csv"
-
-                s3 = boto3.client("s3")
-                s3.upload_file(csv_path, BUCKET, csv_file_name_key)
-                os.remove(csv_path)
-                logger.info(f"Data exported to '{csv_file_name}' successfully.")
-
-            except Exception as e:
-                logger.info(f"No data changes in the table {table}")
-        return {"log_group_name": context.log_group_name}  # <- Needs testing
+                )
+            # transform reads the files in this order and needs parents (address, department) first
+            exported = sorted(
+                [result for result in results if result is not None],
+                key=lambda result: TABLE_LIST.index(result["table"]),
+            )
+        for result in exported:
+            logger.info(result["message"])
+        manifest_key = write_manifest(s3, exported, full_rows, lsn)
+        return {
+            "log_group_name": getattr(context, "log_group_name", None),
+            "manifest_key": manifest_key,
+            "connection_pool": dict(pool.stats),
+        }
 
     except ClientError as e:
         logger.error(
@@ -172,18 +1533,18 @@ def extract_handler(event, context):
             {"message": "an error occured with the psycopg2 connection", "details": e}
         )
 
-    except pd.errors.EmptyDataError as e:
-        logger.error({"message": "an error occured with pandas", "details": e})
-
     except Exception as e:
         logger.error({"message": "unknown error occured", "details": e})
 
     finally:
-        if current_state is True:
-            change_state(
-                boto3.client("s3"), False
-            )  # Once first run is ending, change 'is first run' status to False.
-        close_connection(db)
+        # Once first run is ending, change 'is first run' status to False,
+        # unless a chunked load is unfinished and has to be resumed by the next run.
+        if current_state is True and not get_chunk_progress(s3):
+            change_state(s3, False)
+        if coordinator is not None:
+            close_connection(coordinator)
+        if cdc_db is not None:
+            close_connection(cdc_db)
 
 
 if __name__ == "__main__":
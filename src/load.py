@@ -1,16 +1,20 @@
-import boto3
+import functools
 import os
 from io import BytesIO
-import pandas as pd
-from sqlalchemy import create_engine
 import dotenv
 import logging
 import botocore.exceptions
-from sqlalchemy.exc import SQLAlchemyError
+from src.utils.clients import get_client
+from src.utils.secrets import CachedSecret, is_auth_error
 
 dotenv.load_dotenv()
 BUCKET = os.environ["TRANSFORM_BUCKET"]
-PG_CONNECTION = os.environ["PG_CONNECTION"]
+
+# The warehouse's connection URL: from the Secrets Manager secret named by WAREHOUSE_SECRET_ID, or the environment
+WAREHOUSE_CREDENTIALS = CachedSecret(
+    os.environ.get("WAREHOUSE_SECRET_ID"),
+    lambda: {"PG_CONNECTION": os.environ["PG_CONNECTION"]},
+)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -44,6 +48,8 @@ def read_parquet_from_s3(s3_client, key, bucket=BUCKET):
         ReadParquetError: Raised when the file cannot be read or parsed for any reason.
     """
     try:
+        import pandas as pd
+
         response = s3_client.get_object(Bucket=bucket, Key=key)
         parquet_bytes = response["Body"].read()
         df = pd.read_parquet(BytesIO(parquet_bytes))  # bytes to df
@@ -56,11 +62,62 @@ def read_parquet_from_s3(s3_client, key, bucket=BUCKET):
         raise ReadParquetError
 
 
+def create_engine(url, **kwargs):
+    """
+    Creates a SQLAlchemy engine. SQLAlchemy is imported here rather than at module level,
+    so invocations with nothing to load don't spend their cold start importing it.
+
+    Args:
+        url (str): The database URL.
+        **kwargs: Passed on to sqlalchemy.create_engine.
+
+    Returns:
+        sqlalchemy.engine.Engine: The engine.
+    """
+    import sqlalchemy
+
+    return sqlalchemy.create_engine(url, **kwargs)
+
+
+@functools.lru_cache(maxsize=None)
+def create_cached_engine(url):
+    """
+    Creates the SQLAlchemy engine for a database once per process, so every table (and every
+    warm Lambda invocation) reuses its pooled connections instead of opening new ones.
+    'pool_pre_ping' checks a pooled connection is still alive before handing it out.
+
+    Args:
+        url (str): The database URL.
+
+    Returns:
+        sqlalchemy.engine.Engine: The engine.
+    """
+    return create_engine(url, pool_pre_ping=True)
+
+
+def get_engine(refresh=False):
+    """
+    Gets the warehouse's engine, for the URL in WAREHOUSE_CREDENTIALS.
+       A rotated password changes the URL, which gets an engine of its own.
+
+    Args:
+        refresh (bool, optional): Fetch the secret again first, e.g. after a rejected login.
+
+    Returns:
+        sqlalchemy.engine.Engine: The engine.
+    """
+    return create_cached_engine(
+        WAREHOUSE_CREDENTIALS.get(refresh=refresh)["PG_CONNECTION"]
+    )
+
+
 def write_dataframe_to_postgres(df, table_name):
     """
     Writes a pandas DataFrame to a specified table in the PostgreSQL database.
 
     This function uses SQLAlchemy to handle the connection and automatically commits the transaction.
+    - The connection comes from the engine's pool, see get_engine. If the login is rejected,
+      the secret is fetched again and the write retried once, in case the password was rotated.
     - Data is appended to the table ('if_exists='append'').
     - An empty DataFrame will not trigger any write operation.
 
@@ -71,15 +128,25 @@ def write_dataframe_to_postgres(df, table_name):
     Raises:
         WriteDataFrameError: Raised if writing to the database fails for any reason.
     """
+    from sqlalchemy.exc import SQLAlchemyError
+
     if df.empty:
         logger.warning(
             f"DataFrame for table '{table_name}' is empty. No data will be written."
         )
         return
     try:
-        engine = create_engine(PG_CONNECTION)
-        with engine.begin() as connection:
-            df.to_sql(table_name, con=connection, if_exists="append", method="multi")
+        for refresh in (False, True):
+            try:
+                with get_engine(refresh).begin() as connection:
+                    df.to_sql(
+                        table_name, con=connection, if_exists="append", method="multi"
+                    )
+                break
+            except SQLAlchemyError as e:
+                # a rejected login fails before anything is written, so it is safe to retry
+                if refresh or not is_auth_error(e):
+                    raise
     except SQLAlchemyError as e:
         logger.error(
             f"SQLAlchemyError: Failed to write DataFrame to PostgreSQL table '{table_name}': {e}"
@@ -124,9 +191,10 @@ def load_handler(event, context):
     keys = event["s3_keys"]
 
     if keys:
+        s3_client = get_client("s3")
         for key in keys:
             try:
-                df = read_parquet_from_s3(boto3.client("s3"), key)
+                df = read_parquet_from_s3(s3_client, key)
                 if "addr" in key:
                     table_name = "dim_location"
                     write_dataframe_to_postgres(df, table_name)
@@ -156,6 +224,7 @@ def load_handler(event, context):
                 logger.error(f"ClientError while accessing S3: {e}")
             except Exception as e:
                 logger.error(f"Unexpected exception when reading parquet from S3: {e}")
+        logger.info(f"Connection pool: {get_engine().pool.status()}")
         return {"Success": f"Successfully loaded records!"}
     else:
         return {"Message": "No new data to append"}
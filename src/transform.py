@@ -2,13 +2,20 @@ import datetime
 import logging
 import os
 import json
-from pprint import pprint
 import boto3
 from botocore.config import Config
 from botocore.exceptions import ClientError
-import pandas as pd
 from dotenv import load_dotenv
-from src.utils.utils import facts_and_dim, read_csv_to_df, df_to_parquet
+from src.utils.clients import get_client
+from src.utils.snapshots import DimensionSnapshot, SNAPSHOT_COLUMNS
+from src.utils.s3_stream import S3MultipartWriter
+from src.utils.utils import (
+    facts_and_dim,
+    read_csv_to_df,
+    read_csv_in_chunks,
+    df_to_parquet,
+    write_parquet_chunks,
+)
 
 
 load_dotenv(override=True)
@@ -16,11 +23,20 @@ load_dotenv(override=True)
 EXTRACT_BUCKET = os.environ["BUCKET"]
 TRANSFORM_BUCKET = os.environ["TRANSFORM_BUCKET"]
 STATUS_KEY = "transform_status_check.json"
+# Bytes of CSV transformed at a time by transform_in_chunks, for the tables in CHUNKED_TRANSFORMS.
+# 0 reads every file whole.
+TRANSFORM_CHUNK_BYTES = int(os.environ.get("TRANSFORM_CHUNK_BYTES", "0"))
+# key prefix: (transformation, warehouse table), for the tables transformed row by row
+CHUNKED_TRANSFORMS = {
+    "sale": ("sales_fact", "fact_sales_order"),
+    "desi": ("design_dim", "dim_design"),
+}
 
 my_config = Config(region_name="eu-west-2")
 
-log_client = boto3.client("logs", config=my_config)
-s3_client = boto3.client("s3", config=my_config)
+# created on first use, see get_s3_client and get_log_client
+log_client = None
+s3_client = None
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -37,6 +53,26 @@ table_list = [
 ]
 
 
+def get_s3_client():
+    """
+    Gets the S3 client, created on the first call and reused by warm invocations.
+
+    Returns:
+        boto3.client: 's3_client' if one was set, else the cached client.
+    """
+    return s3_client or get_client("s3", my_config)
+
+
+def get_log_client():
+    """
+    Gets the CloudWatch Logs client, which is only needed by events without a manifest.
+
+    Returns:
+        boto3.client: 'log_client' if one was set, else the cached client.
+    """
+    return log_client or get_client("logs", my_config)
+
+
 def get_logs(log_client: boto3.client, log_group_name: str) -> list[str]:
     """
     Fetches the 15 most recent log events from the latest stream in the given CloudWatch log group.
@@ -114,6 +150,39 @@ def get_csv_file_keys(logs: list[str]) -> list[str]:
         return file_keys
 
 
+def get_manifest_file_keys(s3_client, manifest_key: str) -> list[str]:
+    """
+    Reads the manifest written by the extract lambda and returns the keys of the files to transform.
+
+    Only tables that have a transformation are returned, in the order the extract lambda
+    listed them (parents such as address and department come first).
+
+    Args:
+        s3_client (boto3.client): Boto3 S3 client.
+        manifest_key (str): Key of the manifest in the extract bucket.
+
+    Returns:
+        list[str]: List of s3 keys for the extracted files.
+    """
+    file_keys = []
+    try:
+        response = s3_client.get_object(Bucket=EXTRACT_BUCKET, Key=manifest_key)
+        manifest = json.loads(response["Body"].read())
+        file_keys = [
+            file["key"] for file in manifest["files"] if file["table"] in table_list
+        ]
+    except ClientError as e:
+        logger.error(
+            {
+                "message": "an error occured reading the extract manifest",
+                "error_code": e.response["Error"]["Code"],
+                "details": e.response["Error"]["Message"],
+            }
+        )
+    finally:
+        return file_keys
+
+
 def get_state(s3_client):
     """
     Gets the current state of the switch file and returns it to check whether this is the first time the data pipeline is being run.
@@ -171,17 +240,66 @@ def change_state(s3_client, status: bool):
         raise TypeError("Only arguments of type bool accepted")
 
 
+def is_chunked(key):
+    """
+    Checks whether a file is transformed with transform_in_chunks.
+    Parquet extracts and cdc change files (whose rows are deduplicated across the whole file)
+    are always read whole.
+
+    Args:
+        key (str): The S3 key of an extracted file.
+
+    Returns:
+        bool: True if chunking is on and the file's table is transformed row by row.
+    """
+    return bool(
+        TRANSFORM_CHUNK_BYTES
+        and key[11:15] in CHUNKED_TRANSFORMS
+        and ".csv" in key
+        and "_changes.csv" not in key
+    )
+
+
+def transform_in_chunks(s3_client, key):
+    """
+    Transforms a CSV file a chunk at a time: the object is streamed from S3 and parsed in
+    blocks of TRANSFORM_CHUNK_BYTES, each block is transformed, and written as a row group of
+    a Parquet file that is uploaded while it is written, so memory use doesn't grow with the file.
+
+    Args:
+        s3_client (boto3.client): Boto3 S3 client.
+        key (str): The S3 key of the extracted file.
+
+    Returns:
+        tuple[str, int]: The key of the Parquet file in the transform bucket, and its number of rows.
+    """
+    prefix = key[11:15]
+    transformation = facts_and_dim[CHUNKED_TRANSFORMS[prefix][0]]
+    current_time = datetime.datetime.now(datetime.UTC)
+    parquet_file_key = f"{current_time:%Y/%m/%d}/{prefix}_{current_time}.parquet"
+    chunks = read_csv_in_chunks(key, s3_client, TRANSFORM_CHUNK_BYTES, EXTRACT_BUCKET)
+    with S3MultipartWriter(s3_client, TRANSFORM_BUCKET, parquet_file_key) as file:
+        rows = write_parquet_chunks((transformation(df) for df in chunks), file)
+    return parquet_file_key, rows
+
+
 def transform_handler(event, context):
     """
     Main Lambda handler for the transform phase of the pipeline.
 
-    - Reads logs from the latest log stream from the extract lambda.
-    - Extracts CSV S3 keys from those logs.
+    - Reads the manifest written by the extract lambda to find the files it exported.
+      Events without a 'manifest_key' (from an older extract lambda) fall back to reading the
+      CSV S3 keys from the latest log stream of the extract lambda.
     - Reads CSVs from S3 and applies transformations.
+    - With 'TRANSFORM_CHUNK_BYTES' set, sales and design files are transformed in chunks
+      instead (see transform_in_chunks), so a first run's sales file of any size fits in memory.
+    - Counterparty and staff are joined to the snapshots of address and department kept in the
+      'processed' bucket (see DimensionSnapshot), which every run's address and department rows
+      are merged into, so they can be transformed when their parent didn't change.
     - Writes transformed DataFrames as Parquet files to the 'processed' S3 bucket.
 
     Args:
-        event (dict): returned data from the extract lambda (expects 'log_group_name' key).
+        event (dict): returned data from the extract lambda (expects 'manifest_key', or 'log_group_name' key).
         context (object):  Lambda context object (locally- pass None).
 
     Returns:
@@ -190,16 +308,34 @@ def transform_handler(event, context):
             "table_names": Corresponding table names
         }
     """
-    logs = get_logs(log_client, log_group_name=event["log_group_name"])
+    s3_client = get_s3_client()
     try:
-        keys = get_csv_file_keys(logs)
+        if event.get("manifest_key"):
+            keys = get_manifest_file_keys(s3_client, event["manifest_key"])
+        else:
+            logs = get_logs(get_log_client(), log_group_name=event["log_group_name"])
+            keys = get_csv_file_keys(logs)
         parquet_keys = []
         table_name = []
         current_state = get_state(s3_client)
 
-        dfs = read_csv_to_df(keys, s3_client)
-        address, department = None, None  # These are dataframes
+        # files transformed in chunks are streamed by transform_in_chunks instead
+        dfs = read_csv_to_df([key for key in keys if not is_chunked(key)], s3_client)
+        snapshots = {
+            table: DimensionSnapshot(s3_client, TRANSFORM_BUCKET, table)
+            for table in SNAPSHOT_COLUMNS
+        }
+        address, department = None, None  # These are dataframes, from the snapshots
         for key in keys:
+            if is_chunked(key):
+                parquet_file_key, rows = transform_in_chunks(s3_client, key)
+                parquet_keys.append(parquet_file_key)
+                table_name.append(CHUNKED_TRANSFORMS[key[11:15]][1])
+                logger.info(
+                    f"Data exported to {parquet_file_key} successfully. "
+                    f"{rows} rows, transformed in chunks."
+                )
+                continue
             new_df = None
             curr_df = next(dfs)
             prefix = key[11:15]
@@ -209,13 +345,15 @@ def transform_handler(event, context):
                 table_name.append("fact_sales_order")
             elif prefix == "addr":
                 df = curr_df[key]
-                address = df
-                new_df = facts_and_dim["address_dim"](address)
+                address = snapshots["address"].merge(df)
+                new_df = facts_and_dim["address_dim"](df)
                 table_name.append("dim_location")
 
             elif prefix == "coun":
                 df = curr_df[key]
-                new_df: pd.DataFrame = facts_and_dim["counterparty_dim"](df, address)
+                if address is None:
+                    address = snapshots["address"].read()
+                new_df = facts_and_dim["counterparty_dim"](df, address)
                 # Legal_Address_id is still included. Need to look into dropping that column
                 table_name.append("dim_counterparty")
 
@@ -226,7 +364,7 @@ def transform_handler(event, context):
 
             elif prefix == "depa":
                 df = curr_df[key]
-                department = df
+                department = snapshots["department"].merge(df)
                 continue
             elif prefix == "desi":
                 df = curr_df[key]
@@ -235,6 +373,8 @@ def transform_handler(event, context):
 
             elif prefix == "staf":
                 df = curr_df[key]
+                if department is None:
+                    department = snapshots["department"].read()
                 new_df = facts_and_dim["staff_dim"](df, department)
                 table_name.append("dim_staff")
 
@@ -296,7 +436,9 @@ def transform_handler(event, context):
 
 
 if __name__ == "__main__":
-    x = get_logs(log_client, "/aws/lambda/extract_handler")
+    from pprint import pprint
+
+    x = get_logs(get_log_client(), "/aws/lambda/extract_handler")
     file_keys = get_csv_file_keys(x)
     df = read_csv_to_df(file_keys)
     next = next(df)
@@ -0,0 +1,241 @@
+import struct
+
+# pgoutput message tags of row changes, also written to a change file's 'op' column
+OPERATIONS = ("I", "U", "D")  # insert, update, delete
+PROTO_VERSION = "1"
+
+
+def lsn_to_int(lsn):
+    """
+    Converts a textual LSN such as '16/B374D848' into a number, so LSNs can be compared.
+
+    Args:
+        lsn (str): An LSN as Postgres prints it.
+
+    Returns:
+        int: The 64 bit WAL position.
+    """
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+def int_to_lsn(position):
+    """
+    Converts a 64 bit WAL position into the textual LSN Postgres accepts.
+
+    Args:
+        position (int): A WAL position, e.g. the end LSN of a commit message.
+
+    Returns:
+        str: The LSN, e.g. '16/B374D848'.
+    """
+    return f"{position >> 32:X}/{position & 0xFFFFFFFF:X}"
+
+
+class PgOutputDecoder:
+    """
+    Decodes the binary messages of the built-in 'pgoutput' logical decoding plugin (protocol version 1).
+
+    Relation messages describe a table's columns before its first change in every decoding
+    session, so the decoder keeps them and uses them to name the values of later row changes.
+    Values are returned in Postgres' text format, the same as COPY writes them.
+    Unchanged TOAST values (not sent by Postgres) and NULLs are both returned as None.
+
+    Example:
+        decoder = PgOutputDecoder()
+        change = decoder.decode(data)  # {"table": "staff", "op": "U", "row": {...}}
+    """
+
+    def __init__(self):
+        self.relations = {}
+        self.commit_lsn = None  # end LSN of the last commit message, as an int
+
+    def decode(self, data):
+        """
+        Decodes one message.
+
+        Args:
+            data (bytes): One 'data' value returned by pg_logical_slot_peek_binary_changes.
+
+        Returns:
+            dict | None: {"table", "op", "row"} for an insert, update or delete,
+                {"commit": end_lsn} for a commit, or None for any other message.
+        """
+        self._data, self._offset = bytes(data), 1
+        tag = chr(self._data[0])
+        if tag == "R":
+            relation_id = self._int32()
+            schema, table = self._string(), self._string()
+            self._offset += 1  # replica identity setting
+            columns = []
+            for _ in range(self._int16()):
+                self._offset += 1  # flags, 1 if the column is part of the key
+                columns.append(self._string())
+                self._offset += 8  # type oid and type modifier
+            self.relations[relation_id] = {
+                "schema": schema,
+                "table": table,
+                "columns": columns,
+            }
+        elif tag in OPERATIONS:
+            relation = self.relations[self._int32()]
+            kind = chr(self._byte())
+            if tag == "U" and kind in "KO":
+                # old key (or old row, with REPLICA IDENTITY FULL) before the new row
+                self._tuple()
+                kind = chr(self._byte())
+            values = self._tuple()
+            return {
+                "table": relation["table"],
+                "op": tag,
+                "row": dict(zip(relation["columns"], values)),
+            }
+        elif tag == "C":
+            self._offset += 1 + 8  # flags and commit LSN
+            self.commit_lsn = self._int64()
+            return {"commit": self.commit_lsn}
+        return None
+
+    def _byte(self):
+        value = self._data[self._offset]
+        self._offset += 1
+        return value
+
+    def _unpack(self, fmt, size):
+        (value,) = struct.unpack_from(fmt, self._data, self._offset)
+        self._offset += size
+        return value
+
+    def _int16(self):
+        return self._unpack("!h", 2)
+
+    def _int32(self):
+        return self._unpack("!i", 4)
+
+    def _int64(self):
+        return self._unpack("!Q", 8)
+
+    def _string(self):
+        end = self._data.index(b"\0", self._offset)
+        value = self._data[self._offset : end].decode("utf-8")
+        self._offset = end + 1
+        return value
+
+    def _tuple(self):
+        values = []
+        for _ in range(self._int16()):
+            kind = chr(self._byte())
+            if kind == "t":
+                length = self._int32()
+                values.append(
+                    self._data[self._offset : self._offset + length].decode("utf-8")
+                )
+                self._offset += length
+            else:  # 'n' NULL or 'u' unchanged TOAST value
+                values.append(None)
+        return values
+
+
+def ensure_replication_slot(db, slot, publication, table_list):
+    """
+    Creates the publication and the logical replication slot CDC reads from, if they don't exist yet.
+       The slot keeps every change made after it was created until it is advanced past them,
+       so create it before the initial full load.
+
+    Args:
+        db: A psycopg2 connection in autocommit mode. A slot can't be created in a transaction that has written.
+        slot (str): Name of the replication slot.
+        publication (str): Name of the publication that lists the tables to capture.
+        table_list (list[str]): The tables to capture.
+
+    Returns:
+        bool: True if the slot was created by this call, False if it already existed.
+    """
+    db_cursor = db.cursor()
+    db_cursor.execute("SELECT 1 FROM pg_publication WHERE pubname = %s", (publication,))
+    if db_cursor.fetchone() is None:
+        db_cursor.execute(
+            f"CREATE PUBLICATION {publication} FOR TABLE {', '.join(table_list)}"
+        )
+    db_cursor.execute(
+        "SELECT 1 FROM pg_replication_slots WHERE slot_name = %s", (slot,)
+    )
+    if db_cursor.fetchone() is not None:
+        return False
+    db_cursor.execute(
+        "SELECT pg_create_logical_replication_slot(%s, 'pgoutput')", (slot,)
+    )
+    return True
+
+
+def read_changes(db, slot, publication, max_changes=None, after_lsn=None):
+    """
+    Reads the committed changes waiting in a replication slot without consuming them.
+       Call advance_slot once they are safely stored, otherwise the next read returns them again.
+
+    Args:
+        db: An open psycopg2 connection.
+        slot (str): Name of the replication slot.
+        publication (str): Name of the publication the slot decodes.
+        max_changes (int, optional): Stop after the transaction that takes the count past this many messages.
+        after_lsn (str, optional): A stored checkpoint. Transactions ending at or before it are skipped,
+            in case the slot wasn't advanced after they were last stored.
+
+    Returns:
+        tuple[list[dict], str | None]: The row changes ({"table", "op", "row"}) in commit order,
+            and the end LSN of the last transaction read, or None if there were no transactions.
+    """
+    db_cursor = db.cursor()
+    db_cursor.execute(
+        """
+        SELECT data FROM pg_logical_slot_peek_binary_changes(
+            %s, NULL, %s, 'proto_version', %s, 'publication_names', %s
+        )
+        """,
+        (slot, max_changes, PROTO_VERSION, publication),
+    )
+    decoder = PgOutputDecoder()
+    changes, transaction = [], []
+    for row in db_cursor:
+        change = decoder.decode(row["data"] if isinstance(row, dict) else row[0])
+        if change is None:
+            continue
+        if "commit" in change:
+            if after_lsn is None or change["commit"] > lsn_to_int(after_lsn):
+                changes.extend(transaction)
+            transaction = []
+        else:
+            transaction.append(change)
+    end_lsn = decoder.commit_lsn
+    return changes, None if end_lsn is None else int_to_lsn(end_lsn)
+
+
+def advance_slot(db, slot, lsn):
+    """
+    Moves a replication slot past the changes up to 'lsn', so Postgres can recycle their WAL.
+
+    Args:
+        db: An open psycopg2 connection.
+        slot (str): Name of the replication slot.
+        lsn (str): The end LSN returned by read_changes.
+    """
+    db.cursor().execute("SELECT pg_replication_slot_advance(%s, %s)", (slot, lsn))
+
+
+def drop_replication_slot(db, slot, publication):
+    """
+    Drops the replication slot and its publication, e.g. when switching CDC off.
+       An unused slot stops Postgres removing old WAL, so don't leave one behind.
+
+    Args:
+        db: A psycopg2 connection in autocommit mode.
+        slot (str): Name of the replication slot.
+        publication (str): Name of the publication.
+    """
+    db_cursor = db.cursor()
+    db_cursor.execute(
+        "SELECT pg_drop_replication_slot(slot_name) FROM pg_replication_slots "
+        "WHERE slot_name = %s",
+        (slot,),
+    )
+    db_cursor.execute(f"DROP PUBLICATION IF EXISTS {publication}")
@@ -0,0 +1,19 @@
+import functools
+import boto3
+
+
+@functools.lru_cache(maxsize=None)
+def get_client(service_name, config=None):
+    """
+    Creates a boto3 client on first use and returns the same one afterwards, so a handler
+    doesn't pay for building a client at import time (or on every call), and warm Lambda
+    invocations reuse the client and its open connections.
+
+    Args:
+        service_name (str): The AWS service, e.g. 's3' or 'logs'.
+        config (botocore.config.Config, optional): Client configuration, e.g. the region.
+
+    Returns:
+        boto3.client: The cached client.
+    """
+    return boto3.client(service_name, config=config)
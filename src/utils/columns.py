@@ -0,0 +1,25 @@
+# Columns the warehouse is built from, per extracted table, primary key first. Transform drops
+# everything else (e.g. counterparty contacts, department manager), so extract doesn't select it.
+# Tables mapped to None are extracted whole.
+EXTRACT_COLUMNS = {
+    "address": [
+        "address_id",
+        "address_line_1",
+        "address_line_2",
+        "district",
+        "city",
+        "postal_code",
+        "country",
+        "phone",
+    ],
+    "counterparty": ["counterparty_id", "counterparty_legal_name", "legal_address_id"],
+    "currency": ["currency_id", "currency_code"],
+    "department": ["department_id", "department_name", "location"],
+    "design": ["design_id", "design_name", "file_location", "file_name"],
+    "staff": ["staff_id", "first_name", "last_name", "department_id", "email_address"],
+    "sales_order": None,  # every column is used, including created_at and last_updated
+    "payment": None,
+    "payment_type": None,
+    "purchase_order": None,
+    "transaction": None,
+}
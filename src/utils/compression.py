@@ -0,0 +1,79 @@
+import gzip
+from contextlib import contextmanager
+
+try:
+    import zstandard
+except ImportError:  # in requirements.txt and the etl layer, only needed for zstd
+    zstandard = None
+
+# compression: suffix added to the key of a compressed file
+COMPRESSION_SUFFIXES = {
+    "none": "",
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+GZIP_LEVEL = 6  # zlib's default, level 9 costs far more CPU for a few percent
+ZSTD_LEVEL = 3
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ImportError(
+            "zstd compression needs the 'zstandard' package (pip install zstandard)"
+        )
+    return zstandard
+
+
+@contextmanager
+def compressed_writer(file, compression="none"):
+    """
+    Wraps a writable binary file so everything written to it is compressed on the fly.
+       Leaving the 'with' block flushes the end of the compressed stream but leaves 'file' open,
+       so the caller can still complete or abort it.
+
+    Example:
+        with S3MultipartWriter(s3_client, bucket, "table.csv.gz") as file:
+            with compressed_writer(file, "gzip") as out:
+                out.write(b"...")
+
+    Args:
+        file: A writable binary file-like object that receives the compressed bytes.
+        compression (str, optional): One of COMPRESSION_SUFFIXES. Defaults to "none".
+
+    Raises:
+        ValueError: If the compression is not supported.
+        ImportError: If zstd is chosen but the 'zstandard' package is not installed.
+
+    Yields:
+        A writable binary file-like object.
+    """
+    if compression == "none":
+        yield file
+    elif compression == "gzip":
+        # mtime=0 keeps the output identical for identical input
+        with gzip.GzipFile(
+            fileobj=file, mode="wb", compresslevel=GZIP_LEVEL, mtime=0
+        ) as out:
+            yield out
+    elif compression == "zstd":
+        compressor = _require_zstandard().ZstdCompressor(level=ZSTD_LEVEL)
+        with compressor.stream_writer(file, closefd=False) as out:
+            yield out
+    else:
+        raise ValueError(f"Unsupported compression '{compression}'")
+
+
+def compression_for_key(key):
+    """
+    Works out how an object was compressed from the suffix of its key.
+
+    Args:
+        key (str): The S3 key, e.g. '2025/06/11/staff_2025-06-11 10:00:00.csv.gz'.
+
+    Returns:
+        str | None: "gzip" or "zstd", in the form pandas' 'compression' argument takes, or None if uncompressed.
+    """
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if suffix and key.endswith(suffix):
+            return compression
+    return None
@@ -1,32 +1,180 @@
 import psycopg2
+import pg8000.exceptions
 from pg8000.native import Connection
+import functools
 import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
 import psycopg2.extras
 from dotenv import load_dotenv
+from src.utils.secrets import CachedSecret, is_auth_error
 
 load_dotenv(override=True)
 
-database = os.environ["PG_DATABASE"]
-username = os.environ["PG_USERNAME"]
-password = os.environ["PG_PASSWORD"]
-host = os.environ["PG_HOST"]
 
+def credentials_from_env():
+    """
+    Reads the source database's credentials from environment variables (or .env), for local runs.
+
+    Returns:
+        dict: The same keys as the 'database_secret' secret: username, password, database and host.
+    """
+    return {
+        "username": os.environ["PG_USERNAME"],
+        "password": os.environ["PG_PASSWORD"],
+        "database": os.environ["PG_DATABASE"],
+        "host": os.environ["PG_HOST"],
+    }
+
+
+# Credentials of the source database: from the Secrets Manager secret named by PG_SECRET_ID, or the environment
+DB_CREDENTIALS = CachedSecret(os.environ.get("PG_SECRET_ID"), credentials_from_env)
+
+# Session settings for the source database, so extracts can't hold up customer traffic for long
+APPLICATION_NAME = os.environ.get("PG_APPLICATION_NAME", "totes-extract")
+# just under the Lambda's 15 minute limit, so a query can't outlive the invocation that sent it
+STATEMENT_TIMEOUT_MS = int(os.environ.get("PG_STATEMENT_TIMEOUT_MS", "840000"))
+# reads still queue behind DDL; give up instead of making everything behind us wait too
+LOCK_TIMEOUT_MS = int(os.environ.get("PG_LOCK_TIMEOUT_MS", "5000"))
+# the snapshot coordinator sits idle in its transaction for the whole run
+IDLE_IN_TRANSACTION_TIMEOUT_MS = int(
+    os.environ.get("PG_IDLE_IN_TRANSACTION_TIMEOUT_MS", "900000")
+)
 
-def create_connection():
+# Optional read replicas to extract from, comma separated. Each is a host, or a libpq connection
+# string ('host=replica1 port=5433') or URI; anything it leaves out is taken from the primary's settings.
+REPLICA_DSNS = [
+    dsn.strip()
+    for dsn in os.environ.get("PG_REPLICA_DSNS", "").split(",")
+    if dsn.strip()
+]
+# a replica further behind the primary than this is not used
+MAX_REPLICA_LAG_SECONDS = float(os.environ.get("PG_MAX_REPLICA_LAG_SECONDS", "300"))
+
+# Connecting is retried this many times in all, with jittered exponential backoff from PG_CONNECT_BASE_DELAY
+CONNECT_ATTEMPTS = int(os.environ.get("PG_CONNECT_ATTEMPTS", "4"))
+CONNECT_BASE_DELAY = float(os.environ.get("PG_CONNECT_BASE_DELAY", "0.2"))
+CONNECT_MAX_DELAY = 5.0
+# a pooled connection idle for longer than this is pinged before it is handed out again
+PING_AFTER_SECONDS = float(os.environ.get("PG_PING_AFTER_SECONDS", "30"))
+# errors that a new attempt may not hit: the server restarting, failing over or refusing connections
+TRANSIENT_ERRORS = (psycopg2.OperationalError, pg8000.exceptions.InterfaceError)
+
+
+def session_options():
+    """
+    Builds the libpq 'options' string that applies the session timeouts on connect.
+
+    Returns:
+        str: The options, e.g. '-c statement_timeout=840000 -c lock_timeout=5000 ...'.
+    """
+    settings = {
+        "statement_timeout": STATEMENT_TIMEOUT_MS,
+        "lock_timeout": LOCK_TIMEOUT_MS,
+        "idle_in_transaction_session_timeout": IDLE_IN_TRANSACTION_TIMEOUT_MS,
+    }
+    return " ".join(f"-c {name}={value}" for name, value in settings.items())
+
+
+def create_connection(dsn=None):
     """
     Establishes a connection to the main PostgreSQL database using psycopg2.
+       The session is named 'PG_APPLICATION_NAME' in pg_stat_activity and has the timeouts
+       from session_options, so the database owners can see and bound what extract runs.
+
+    The credentials come from DB_CREDENTIALS, fetched again if the login is rejected.
+
+    Args:
+        dsn (str, optional): One of REPLICA_DSNS, to connect to that replica instead of the primary.
 
     Returns:
        A live psycopg2.extensions.connection.
     """
-    db = psycopg2.connect(
-        database=database,
-        user=username,
-        password=password,
-        host=host,
-        cursor_factory=psycopg2.extras.RealDictCursor,
+
+    def connect(credentials):
+        params = {
+            "dbname": credentials["database"],
+            "user": credentials["username"],
+            "password": credentials["password"],
+            "host": credentials["host"],
+        }
+        if dsn is not None:
+            if "=" in dsn or "://" in dsn:
+                params.update(psycopg2.extensions.parse_dsn(dsn))
+            else:
+                params["host"] = dsn
+        return psycopg2.connect(
+            **params,
+            application_name=APPLICATION_NAME,
+            options=session_options(),
+            cursor_factory=psycopg2.extras.RealDictCursor,
+        )
+
+    return DB_CREDENTIALS.connect(connect)
+
+
+def replica_status(db):
+    """
+    Measures how far a database is behind the primary it replicates.
+
+    Args:
+        db: An open psycopg2 connection.
+
+    Returns:
+        tuple[float, datetime.datetime | None]: The lag in seconds, and the commit time of the last
+            transaction it replayed (its replay point). A primary has no lag and no replay point.
+    """
+    db_cursor = db.cursor()
+    # a replica with nothing left to replay is up to date, however long ago its last transaction was
+    db_cursor.execute("""
+        SELECT
+            CASE
+                WHEN NOT pg_is_in_recovery() THEN 0
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 'Infinity')
+            END::float AS lag,
+            CASE WHEN pg_is_in_recovery() THEN pg_last_xact_replay_timestamp() END AS replay_point
+        """)
+    row = db_cursor.fetchone()
+    db.rollback()
+    return row["lag"], row["replay_point"]
+
+
+def choose_replica(dsns=None, max_lag_seconds=None):
+    """
+    Picks the replica to extract from: the one least behind, if it is within 'max_lag_seconds'.
+       Replicas that can't be reached or queried are skipped.
+
+    Args:
+        dsns (list[str], optional): Replicas to consider. Defaults to REPLICA_DSNS.
+        max_lag_seconds (float, optional): Lag bound. Defaults to MAX_REPLICA_LAG_SECONDS.
+
+    Returns:
+        tuple[str | None, datetime.datetime | None]: The chosen replica's dsn and replay point,
+            or (None, None) to use the primary.
+    """
+    dsns = REPLICA_DSNS if dsns is None else dsns
+    max_lag_seconds = (
+        MAX_REPLICA_LAG_SECONDS if max_lag_seconds is None else max_lag_seconds
     )
-    return db
+    best = None
+    for dsn in dsns:
+        try:
+            db = create_connection(dsn)
+            try:
+                lag, replay_point = replica_status(db)
+            finally:
+                db.close()
+        except psycopg2.Error:
+            continue
+        if lag <= max_lag_seconds and (best is None or lag < best[0]):
+            best = (lag, dsn, replay_point)
+    if best is None:
+        return None, None
+    return best[1], best[2]
 
 
 def create_connection_to_local():
@@ -55,11 +203,13 @@ def pg8000_connect_to_oltp():
         pg8000.native.Connection: A pg8000 connection instance to the main DB.
     """
     load_dotenv(override=True)
-    return Connection(
-        user=username,
-        database=database,
-        password=password,
-        host=host,
+    return DB_CREDENTIALS.connect(
+        lambda credentials: Connection(
+            user=credentials["username"],
+            database=credentials["database"],
+            password=credentials["password"],
+            host=credentials["host"],
+        )
     )
 
 
@@ -88,3 +238,257 @@ def close_connection(db):
         db: An open database connection object.
     """
     db.close()
+
+
+def connect_with_retry(factory, attempts=None, on_retry=None):
+    """
+    Opens a connection, retrying transient errors with full-jitter exponential backoff,
+    so connections opened at the same moment don't all retry at the same moment too.
+
+    Args:
+        factory (callable): Returns a new open connection, e.g. create_connection or pg8000_connect_to_oltp.
+        attempts (int, optional): Attempts in all. Defaults to CONNECT_ATTEMPTS.
+        on_retry (callable, optional): Called with the error before each retry.
+
+    Returns:
+        The connection.
+
+    Raises:
+        The last error, if every attempt failed, or the first one that isn't in TRANSIENT_ERRORS
+        or is a rejected login.
+    """
+    attempts = CONNECT_ATTEMPTS if attempts is None else attempts
+    for attempt in range(attempts):
+        try:
+            return factory()
+        except TRANSIENT_ERRORS as e:
+            # a rejected login is already retried with fresh credentials, by CachedSecret.connect
+            if attempt == attempts - 1 or is_auth_error(e):
+                raise
+            if on_retry is not None:
+                on_retry(e)
+            time.sleep(
+                random.uniform(
+                    0, min(CONNECT_MAX_DELAY, CONNECT_BASE_DELAY * 2**attempt)
+                )
+            )
+
+
+def is_pg8000(db):
+    return isinstance(db, Connection)
+
+
+def ping(db):
+    """
+    Checks a connection still works with the cheapest query there is, e.g. after a Lambda was frozen.
+       Any transaction left open on it is rolled back.
+
+    Args:
+        db: A psycopg2 or pg8000 connection.
+
+    Returns:
+        bool: False if the connection is closed or the query failed.
+    """
+    if getattr(db, "closed", False):
+        return False
+    try:
+        if is_pg8000(db):
+            db.run("SELECT 1")
+        else:
+            db_cursor = db.cursor()
+            db_cursor.execute("SELECT 1")
+            db_cursor.fetchone()
+            db.rollback()
+    except Exception:
+        return False
+    return True
+
+
+def rollback(db):
+    """
+    Rolls back a psycopg2 or pg8000 connection's open transaction.
+
+    Args:
+        db: A psycopg2 or pg8000 connection.
+    """
+    if is_pg8000(db):
+        db.run("ROLLBACK")  # only a warning if no transaction is open
+    else:
+        db.rollback()
+
+
+def export_snapshot(db):
+    """
+    Starts a REPEATABLE READ transaction and exports its snapshot so other sessions can share it.
+       The snapshot only stays valid while this transaction is open, so keep the connection
+       open (and don't commit or roll back) until every worker has imported it.
+
+    Args:
+        db: An open psycopg2 connection dedicated to holding the snapshot.
+
+    Returns:
+        str: The snapshot identifier to pass to use_snapshot.
+    """
+    db.rollback()
+    db_cursor = db.cursor()
+    db_cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+    db_cursor.execute("SELECT pg_export_snapshot() AS snapshot_id")
+    row = db_cursor.fetchone()
+    return row["snapshot_id"] if isinstance(row, dict) else row[0]
+
+
+def use_snapshot(db, snapshot_id):
+    """
+    Starts a REPEATABLE READ transaction that sees exactly the same data as an exported snapshot.
+       Every query on the connection sees that state until the transaction ends.
+
+    Args:
+        db: An open psycopg2 connection.
+        snapshot_id (str): An identifier returned by export_snapshot.
+    """
+    db.rollback()
+    db_cursor = db.cursor()
+    db_cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+    db_cursor.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool that hands out at most 'max_size' connections at a time.
+
+    Connections are created on demand by calling 'factory' (e.g. create_connection, or a pg8000
+    function) through connect_with_retry, and are kept open for the next borrower once returned.
+    One idle for more than 'ping_after' seconds is pinged first, and replaced if it doesn't answer.
+    Borrowers beyond 'max_size' wait for a connection to be returned.
+    'stats' counts the borrows served from the pool ("hits") and by a new connection ("misses"),
+    the connections dropped as broken ("discarded") and the connection attempts retried ("retries").
+
+    Example:
+        pool = ConnectionPool(create_connection, max_size=4)
+        with pool.connection() as db:
+            db.cursor().execute("SELECT 1")
+        pool.close_all()
+    """
+
+    def __init__(self, factory, max_size=4, ping_after=None):
+        """
+        Args:
+            factory (callable): Returns a new open database connection.
+            max_size (int, optional): The most connections that can be open at once. Defaults to 4.
+            ping_after (float, optional): Idle seconds before a ping. Defaults to PING_AFTER_SECONDS.
+        """
+        self.factory = factory
+        self.max_size = max_size
+        self.ping_after = PING_AFTER_SECONDS if ping_after is None else ping_after
+        self.stats = {"hits": 0, "misses": 0, "discarded": 0, "retries": 0}
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle = queue.LifoQueue()  # (connection, time it was returned)
+        self._all = []
+        self._lock = threading.Lock()
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _borrow(self):
+        while True:
+            try:
+                db, returned_at = self._idle.get_nowait()
+            except queue.Empty:
+                db = connect_with_retry(
+                    self.factory, on_retry=lambda e: self._count("retries")
+                )
+                with self._lock:
+                    self._all.append(db)
+                self._count("misses")
+                return db
+            if time.monotonic() - returned_at < self.ping_after or ping(db):
+                self._count("hits")
+                return db
+            self._discard(db)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a connection for the duration of a 'with' block.
+           If the block raises, the connection's transaction is rolled back before it is returned.
+           A connection that is closed, or can't be rolled back, is dropped from the pool instead.
+
+        Yields:
+            A live database connection.
+        """
+        self._slots.acquire()
+        try:
+            db = self._borrow()
+            broken = False
+            try:
+                yield db
+            except BaseException:
+                try:
+                    rollback(db)
+                except Exception:
+                    broken = True  # the original error is the one worth raising
+                raise
+            finally:
+                if broken or getattr(db, "closed", False):
+                    self._discard(db)
+                else:
+                    self._idle.put((db, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def _discard(self, db):
+        with self._lock:
+            if db in self._all:
+                self._all.remove(db)
+            self.stats["discarded"] += 1
+        try:
+            close_connection(db)
+        except Exception:
+            pass
+
+    def close_all(self):
+        """
+        Closes every connection the pool has opened.
+        """
+        with self._lock:
+            connections, self._all = self._all, []
+        for db in connections:
+            close_connection(db)
+        self._idle = queue.LifoQueue()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(factory, *args, max_size=4):
+    """
+    Gets the pool of connections made by 'factory(*args)', creating it on first use.
+       Pools are kept for the life of the process, so a warm Lambda invocation reuses the
+       connections of the one before it instead of paying for new TLS handshakes and logins.
+
+    Args:
+        factory (callable): Returns a new open database connection.
+        *args: Passed to 'factory', e.g. a replica dsn for create_connection.
+        max_size (int, optional): The most connections that can be open at once. Defaults to 4.
+
+    Returns:
+        ConnectionPool: The same pool for the same factory, arguments and size.
+    """
+    key = (factory, args, max_size)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(
+                functools.partial(factory, *args), max_size=max_size
+            )
+        return _pools[key]
+
+
+def close_pools():
+    """Closes every pool made by get_pool, and forgets them."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
@@ -0,0 +1,174 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# chunks are never shrunk below this, however often the governor backed off
+MIN_CHUNK_ROWS = 10_000
+
+
+class RowRateLimiter:
+    """
+    Caps the rate rows are read at, across every thread that shares it.
+       Callers report each batch as they read it and are held back until the average rate since
+       the first batch is back under 'rows_per_sec'. Holding back a reader also holds back the
+       database, whose sends wait until the client takes the rows.
+
+    Example:
+        limiter = RowRateLimiter(50000)
+        for rows in batches:
+            limiter.wait(len(rows))
+    """
+
+    def __init__(self, rows_per_sec):
+        """
+        Args:
+            rows_per_sec (float): The cap. 0 means no cap.
+        """
+        self.rows_per_sec = rows_per_sec
+        self._lock = threading.Lock()
+        self._start = None
+        self._rows = 0
+
+    def wait(self, rows):
+        """
+        Records rows that were read, sleeping first if reading them went over the cap.
+
+        Args:
+            rows (int): Number of rows just read.
+
+        Returns:
+            float: Seconds slept.
+        """
+        if not self.rows_per_sec or rows <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            if self._start is None:
+                self._start = now
+            self._rows += rows
+            # when the rows read so far are allowed to have finished
+            delay = self._start + self._rows / self.rows_per_sec - now
+        if delay > 0:
+            time.sleep(delay)
+        return max(delay, 0.0)
+
+
+class RateLimitedWriter:
+    """
+    Wraps a writable binary file and counts the CSV lines written through it into a RowRateLimiter,
+    for COPY, which writes rows to a file instead of returning them.
+       Lines are counted by newline, so a value with a newline in it counts as an extra row.
+    """
+
+    def __init__(self, file, limiter):
+        self.file = file
+        self.limiter = limiter
+
+    def write(self, data):
+        written = self.file.write(data)
+        self.limiter.wait(bytes(data).count(b"\n"))
+        return written
+
+
+class LoadGovernor:
+    """
+    Limits how hard an extract run loads the source database.
+
+    - At most 'limit' queries run at once. Each slot holder calls measure before its query, which
+      times a 'SELECT 1' round trip. Over 'latency_target_ms' the limit is halved (down to 1),
+      under half of it the limit grows by one again (up to 'max_workers').
+    - Every back-off also halves the chunk size chunk_rows suggests for chunks planned afterwards.
+    - limiter returns one RowRateLimiter per table, shared by its chunks, capping its rows/sec.
+
+    Example:
+        governor = LoadGovernor(4, latency_target_ms=100, rows_per_sec=50000)
+        with governor.slot():
+            governor.measure(db_cursor)
+            ...
+    """
+
+    def __init__(self, max_workers, latency_target_ms, rows_per_sec=0):
+        """
+        Args:
+            max_workers (int): The most queries allowed at once, and the starting limit.
+            latency_target_ms (float): Source latency to stay under. 0 turns the back-off off.
+            rows_per_sec (float, optional): Cap per table. Defaults to 0, no cap.
+        """
+        self.max_workers = max_workers
+        self.latency_target_ms = latency_target_ms
+        self.rows_per_sec = rows_per_sec
+        self.limit = max_workers
+        self.backoffs = 0
+        self.latencies = []  # every measurement, in milliseconds
+        self._active = 0
+        self._condition = threading.Condition()
+        self._limiters = {}
+
+    @contextmanager
+    def slot(self):
+        """Waits until fewer than 'limit' queries are running and holds a slot for the block."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._active < self.limit)
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._condition.notify_all()
+
+    def measure(self, db_cursor):
+        """
+        Times a round trip to the database and adjusts 'limit' to it.
+
+        Args:
+            db_cursor: An open psycopg2 cursor.
+
+        Returns:
+            float: The latency in milliseconds.
+        """
+        start = time.perf_counter()
+        db_cursor.execute("SELECT 1")
+        db_cursor.fetchone()
+        latency_ms = (time.perf_counter() - start) * 1000
+        with self._condition:
+            self.latencies.append(latency_ms)
+            if not self.latency_target_ms:
+                return latency_ms
+            if latency_ms > self.latency_target_ms:
+                self.backoffs += 1
+                self.limit = max(1, self.limit // 2)
+            elif (
+                latency_ms < self.latency_target_ms / 2
+                and self.limit < self.max_workers
+            ):
+                self.limit += 1
+                self._condition.notify_all()
+        return latency_ms
+
+    def chunk_rows(self, rows):
+        """
+        Scales a chunk size down by the back-offs so far, so each chunk's query is shorter.
+
+        Args:
+            rows (int): The configured chunk size.
+
+        Returns:
+            int: 'rows' halved once per back-off, but no less than MIN_CHUNK_ROWS (or 'rows', if smaller).
+        """
+        return max(rows >> self.backoffs, min(rows, MIN_CHUNK_ROWS))
+
+    def limiter(self, table):
+        """
+        Gets the rate limiter of a table, shared by every chunk of it.
+
+        Args:
+            table (str): The table being read.
+
+        Returns:
+            RowRateLimiter: The table's limiter, created with 'rows_per_sec' on first use.
+        """
+        with self._condition:
+            if table not in self._limiters:
+                self._limiters[table] = RowRateLimiter(self.rows_per_sec)
+            return self._limiters[table]
@@ -0,0 +1,122 @@
+from io import BytesIO
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from botocore.exceptions import ClientError
+
+HASH_INDEX_PREFIX = "hash_index"
+SHARD_KEYS = 1_000_000  # primary keys per shard, at most 16 bytes each in memory
+MAX_CACHED_SHARDS = 8
+SHARD_SCHEMA = pa.schema([("key", pa.int64()), ("hash", pa.int64())])
+
+
+def row_hash_expression(columns):
+    """
+    Builds the SQL for a 64 bit hash of a row's content, so only 8 bytes per row are compared and stored.
+
+    Args:
+        columns (list[str]): The columns whose values count as the row's content.
+
+    Returns:
+        str: An expression giving the first 64 bits of the md5 of the columns, as a bigint.
+    """
+    return f"('x' || left(md5(row({', '.join(columns)})::text), 16))::bit(64)::bigint"
+
+
+class RowHashIndex:
+    """
+    The content hash of every exported row of one table, stored in S3 as Parquet shards of
+    SHARD_KEYS consecutive primary keys, so a table of tens of millions of rows is never loaded at once.
+    Only the shards holding the keys looked up are read, and at most MAX_CACHED_SHARDS are kept in memory.
+
+    Example:
+        index = RowHashIndex(s3_client, bucket, "staff")
+        changed = index.changed(keys, hashes)  # boolean mask
+        index.update(keys[changed], hashes[changed])
+        index.flush()
+    """
+
+    def __init__(self, s3_client, bucket, table):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.table = table
+        self._shards = {}  # shard number: [sorted keys, hashes, changed since read]
+
+    def shard_key(self, shard):
+        return f"{HASH_INDEX_PREFIX}/{self.table}/{shard:08d}.parquet"
+
+    def _load(self, shard):
+        if shard not in self._shards:
+            if len(self._shards) >= MAX_CACHED_SHARDS:
+                self.flush()
+            try:
+                response = self.s3_client.get_object(
+                    Bucket=self.bucket, Key=self.shard_key(shard)
+                )
+                stored = pq.read_table(BytesIO(response["Body"].read()))
+                keys = stored["key"].to_numpy()
+                hashes = stored["hash"].to_numpy()
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "NoSuchKey":
+                    raise
+                keys = hashes = np.empty(0, dtype=np.int64)
+            self._shards[shard] = [keys, hashes, False]
+        return self._shards[shard]
+
+    def _by_shard(self, keys):
+        shards = keys // SHARD_KEYS
+        for shard in np.unique(shards):
+            yield int(shard), shards == shard
+
+    def changed(self, keys, hashes):
+        """
+        Finds the rows whose hash differs from the stored one, or that have none stored.
+
+        Args:
+            keys (numpy.ndarray): Primary keys (int64).
+            hashes (numpy.ndarray): The rows' content hashes (int64), in the same order.
+
+        Returns:
+            numpy.ndarray: A boolean mask, True for the rows that changed.
+        """
+        mask = np.ones(len(keys), dtype=bool)
+        for shard, in_shard in self._by_shard(keys):
+            stored_keys, stored_hashes, _ = self._load(shard)
+            if not len(stored_keys):
+                continue
+            positions = np.searchsorted(stored_keys, keys[in_shard])
+            positions = np.minimum(positions, len(stored_keys) - 1)
+            known = stored_keys[positions] == keys[in_shard]
+            mask[in_shard] = ~known | (stored_hashes[positions] != hashes[in_shard])
+        return mask
+
+    def update(self, keys, hashes):
+        """
+        Records new hashes. They are only written to S3 by flush.
+
+        Args:
+            keys (numpy.ndarray): Primary keys (int64).
+            hashes (numpy.ndarray): The rows' content hashes (int64), in the same order.
+        """
+        for shard, in_shard in self._by_shard(keys):
+            entry = self._load(shard)
+            merged_keys = np.concatenate([keys[in_shard], entry[0]])
+            merged_hashes = np.concatenate([hashes[in_shard], entry[1]])
+            # np.unique keeps the first occurrence of each key, i.e. the new hash
+            entry[0], first = np.unique(merged_keys, return_index=True)
+            entry[1] = merged_hashes[first]
+            entry[2] = True
+
+    def flush(self):
+        """Writes the shards changed since they were read back to S3 and empties the cache."""
+        for shard, (keys, hashes, dirty) in self._shards.items():
+            if not dirty:
+                continue
+            buffer = BytesIO()
+            pq.write_table(
+                pa.table({"key": keys, "hash": hashes}, schema=SHARD_SCHEMA), buffer
+            )
+            self.s3_client.put_object(
+                Bucket=self.bucket, Key=self.shard_key(shard), Body=buffer.getvalue()
+            )
+        self._shards = {}
@@ -0,0 +1,300 @@
+import io
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, ThreadPoolExecutor, wait
+
+_DONE = object()  # put after the last item
+
+
+class _Failed:
+    def __init__(self, error):
+        self.error = error
+
+
+class MeteredQueue:
+    """
+    A bounded queue between two pipeline stages that records how long each side waited.
+
+    A long 'full' wait means the consumer is the bottleneck (the producer had to stop),
+    a long 'empty' wait means the producer is (the consumer had nothing to do).
+    Both are added to 'metrics' as '<name>_full_wait' and '<name>_empty_wait', in seconds.
+    """
+
+    def __init__(self, name, depth, metrics):
+        self._queue = queue.Queue(maxsize=depth)
+        self._full_key = f"{name}_full_wait"
+        self._empty_key = f"{name}_empty_wait"
+        self.metrics = metrics
+        self.metrics.setdefault(self._full_key, 0.0)
+        self.metrics.setdefault(self._empty_key, 0.0)
+
+    def put(self, item, stop):
+        """
+        Waits for room and adds an item, unless 'stop' is set first.
+
+        Returns:
+            bool: False if the consumer stopped and the item was dropped.
+        """
+        start = time.perf_counter()
+        try:
+            while not stop.is_set():
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            self.metrics[self._full_key] += time.perf_counter() - start
+
+    def get(self, stop=None):
+        """
+        Waits for the next item. Returns the end marker instead if 'stop' is set first.
+        """
+        start = time.perf_counter()
+        try:
+            while stop is None or not stop.is_set():
+                try:
+                    return self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _DONE
+        finally:
+            self.metrics[self._empty_key] += time.perf_counter() - start
+
+
+def iterate_in_background(iterable, name, depth, metrics):
+    """
+    Runs an iterable on its own thread, at most 'depth' items ahead of the caller, so producing
+    the next item (e.g. fetching rows) overlaps with processing the last one.
+       An exception raised by the iterable is raised again here. If the caller stops early,
+       the thread stops after its current item.
+
+    Args:
+        iterable: Any iterable. It is only used from the background thread.
+        name (str): Name of the queue in 'metrics'.
+        depth (int): Maximum number of items waiting in the queue.
+        metrics (dict): Collects the queue's wait times, see MeteredQueue.
+
+    Yields:
+        The iterable's items, in order.
+    """
+    items = MeteredQueue(name, depth, metrics)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if not items.put(item, stop):
+                    return
+            items.put(_DONE, stop)
+        except BaseException as e:
+            items.put(_Failed(e), stop)
+
+    thread = threading.Thread(target=produce, name=f"{name}-producer", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failed):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+class ByteBudget:
+    """
+    Caps the bytes held by prefetched items the caller hasn't finished with.
+       Reservations are granted in ticket order, so a later item can't take the room an earlier
+       one is waiting for while the caller is waiting for the earlier one.
+       A reservation bigger than the whole budget is granted once nothing else is held.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Args:
+            max_bytes (int): The most bytes held at once.
+        """
+        self.max_bytes = max_bytes
+        self.held = 0
+        self.peak = 0  # most bytes held at once so far
+        self._next_ticket = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def reserve(self, ticket, size):
+        """
+        Waits for the ticket's turn and for room, then holds 'size' bytes.
+        Tickets are numbered from 0, and each must reserve (if only 0 bytes) to pass the turn on.
+
+        Returns:
+            bool: False if the budget was closed first, and nothing is held.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._closed
+                or (
+                    self._next_ticket == ticket
+                    and (self.held == 0 or self.held + size <= self.max_bytes)
+                )
+            )
+            if self._closed:
+                return False
+            self.held += size
+            self.peak = max(self.peak, self.held)
+            self._next_ticket += 1
+            self._condition.notify_all()
+            return True
+
+    def release(self, size):
+        """Gives back bytes held by a reservation."""
+        with self._condition:
+            self.held -= size
+            self._condition.notify_all()
+
+    def close(self):
+        """Makes every waiting and later reservation return False."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+def prefetch(items, fetch, workers, max_bytes):
+    """
+    Fetches up to 'workers' items ahead of the caller on a thread pool, so e.g. the next downloads
+    overlap with processing the current one, and yields the results in the order of 'items'.
+       'fetch(item, reserve)' calls 'reserve(size)' before it holds 'size' bytes in memory, and
+       waits there while the results the caller hasn't finished with hold over 'max_bytes'.
+       A result's bytes are released when the caller asks for the next one.
+       Results are yielded as futures, so an error fetching one item is raised by its result()
+       and the caller can carry on with the next.
+
+    Args:
+        items (iterable): The items to fetch, e.g. S3 keys.
+        fetch (callable): Takes an item and the reserve function, returns the item's result.
+        workers (int): Items fetched at once, and how far ahead of the caller fetching gets.
+        max_bytes (int): The bytes held by results waiting for the caller, see ByteBudget.
+
+    Yields:
+        concurrent.futures.Future: The result of each item, in order.
+    """
+    budget = ByteBudget(max_bytes)
+    sizes = {}
+
+    def run(ticket, item):
+        reserved = False
+
+        def reserve(size):
+            nonlocal reserved
+            reserved = True
+            if not budget.reserve(ticket, size):
+                raise CancelledError()
+            sizes[ticket] = size
+
+        try:
+            return fetch(item, reserve)
+        finally:
+            if not reserved:
+                budget.reserve(ticket, 0)  # passes the turn on to the next ticket
+
+    tickets = enumerate(items)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch") as pool:
+
+        def submit(count):
+            for ticket, item in itertools.islice(tickets, count):
+                pending.append((ticket, pool.submit(run, ticket, item)))
+
+        try:
+            submit(workers)
+            while pending:
+                ticket, future = pending.popleft()
+                submit(1)
+                wait([future])
+                yield future
+                budget.release(sizes.pop(ticket, 0))
+        finally:
+            budget.close()
+            for _, future in pending:
+                future.cancel()
+
+
+class BackgroundWriter(io.RawIOBase):
+    """
+    A writable file-like object that hands every write to a thread, which writes it to 'file'.
+       The caller (e.g. COPY, or a CSV/Parquet encoder) continues while the thread compresses,
+       hashes and uploads, with at most 'depth' writes waiting in between.
+       Closing waits for the thread and raises any error it hit. 'file' is left open.
+
+    Example:
+        with BackgroundWriter(file, 4, metrics) as out:
+            out.write(b"...")
+    """
+
+    def __init__(self, file, depth, metrics, name="bytes"):
+        """
+        Args:
+            file: A writable binary file-like object, only written to from the background thread.
+            depth (int): Maximum number of writes waiting in the queue.
+            metrics (dict): Collects the queue's wait times, see MeteredQueue.
+            name (str, optional): Name of the queue in 'metrics'. Defaults to "bytes".
+        """
+        super().__init__()
+        self._chunks = MeteredQueue(name, depth, metrics)
+        self._stop = threading.Event()
+        self._error = None
+        self._position = 0
+        self._thread = threading.Thread(
+            target=self._drain, args=(file,), name=f"{name}-writer", daemon=True
+        )
+        self._thread.start()
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def _drain(self, file):
+        try:
+            while (chunk := self._chunks.get(self._stop)) is not _DONE:
+                file.write(chunk)
+        except BaseException as e:
+            self._error = e
+            self._stop.set()  # unblocks the writer, which then raises the error
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write to closed file")
+        # copy, as callers may reuse the buffer once write returns
+        if not self._chunks.put(bytes(data), self._stop):
+            raise self._error
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        """Waits until everything written has reached 'file'. Does nothing if already closed."""
+        if self.closed:
+            return
+        try:
+            self._chunks.put(_DONE, self._stop)
+            self._thread.join()
+            if self._error is not None:
+                raise self._error
+        finally:
+            super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self._stop.set()
+            self._thread.join()
+            super().close()
+        else:
+            self.close()
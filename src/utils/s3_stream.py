@@ -0,0 +1,201 @@
+import hashlib
+import io
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 rejects non-final parts smaller than 5 MiB
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+
+
+class S3MultipartWriter(io.RawIOBase):
+    """
+    A writable file-like object that streams its contents to an S3 object.
+
+    Bytes are buffered until a full part is available, which is then uploaded as part of a
+    multipart upload on a background thread while the caller keeps writing. Nothing touches disk
+    and at most 'max_in_flight' parts (plus the one being filled) are held in memory.
+    Objects smaller than one part are sent with a single put_object call instead.
+
+    Any code that writes to a binary file (psycopg2's copy_expert, DataFrame.to_csv,
+    DataFrame.to_parquet, pyarrow writers) can write to it, so every stage of the pipeline can use it.
+
+    Example:
+        with S3MultipartWriter(s3_client, "bucket", "2025/06/11/table.csv") as file:
+            file.write(b"...")
+
+    Leaving the 'with' block normally completes the upload. If an exception is raised, or
+    'abort' is called, the upload is discarded and no object is created.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        bucket,
+        key,
+        part_size=DEFAULT_PART_SIZE,
+        max_in_flight=2,
+        content_type=None,
+    ):
+        """
+        Args:
+            s3_client (boto3.client): An S3 client used for the upload.
+            bucket (str): Name of the destination bucket.
+            key (str): Key of the object to create.
+            part_size (int, optional): Size in bytes of each uploaded part. Must be at least 5 MiB.
+            max_in_flight (int, optional): Number of parts that may upload concurrently.
+            content_type (str, optional): Content-Type stored on the object.
+
+        Raises:
+            ValueError: If 'part_size' is smaller than the S3 minimum.
+        """
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE} bytes")
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.max_in_flight = max_in_flight
+        self.extra_args = {"ContentType": content_type} if content_type else {}
+        self.bytes_written = 0
+        self.parts_uploaded = 0
+        self.upload_wait = 0.0  # seconds writes were held up by parts still uploading
+        self._hash = hashlib.sha256()
+        self.completed = False
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._executor = None
+        self._futures = []
+        self._pending = deque()
+
+    def writable(self):
+        return True
+
+    @property
+    def checksum(self):
+        """str: The SHA-256 hex digest of every byte written so far."""
+        return self._hash.hexdigest()
+
+    def tell(self):
+        return self.bytes_written
+
+    def write(self, data):
+        """
+        Appends bytes to the object, uploading a part each time the buffer is full.
+
+        Args:
+            data (bytes | bytearray | memoryview): The bytes to write.
+
+        Returns:
+            int: The number of bytes written.
+        """
+        if self.closed:
+            raise ValueError("write to closed file")
+        self._buffer += data
+        self._hash.update(data)
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[: self.part_size])
+            del self._buffer[: self.part_size]
+            self._submit_part(part)
+        return len(data)
+
+    def _submit_part(self, body):
+        if self._upload_id is None:
+            response = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, **self.extra_args
+            )
+            self._upload_id = response["UploadId"]
+            self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        # Wait for the oldest upload so no more than max_in_flight parts are held in memory
+        start = time.perf_counter()
+        while len(self._pending) >= self.max_in_flight:
+            self._pending.popleft().result()
+        self.upload_wait += time.perf_counter() - start
+        part_number = len(self._futures) + 1
+        future = self._executor.submit(self._upload_part, part_number, body)
+        self._futures.append(future)
+        self._pending.append(future)
+
+    def _upload_part(self, part_number, body):
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def close(self):
+        """
+        Uploads any buffered bytes and completes the object. Does nothing if already closed.
+        """
+        if self.closed:
+            return
+        try:
+            if self._upload_id is None:
+                self.s3_client.put_object(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    Body=bytes(self._buffer),
+                    **self.extra_args,
+                )
+            else:
+                if self._buffer:
+                    self._submit_part(bytes(self._buffer))
+                start = time.perf_counter()
+                parts = [future.result() for future in self._futures]
+                self.upload_wait += time.perf_counter() - start
+                self.s3_client.complete_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={"Parts": parts},
+                )
+                self.parts_uploaded = len(parts)
+            self.completed = True
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            self._buffer = bytearray()
+            self._shutdown()
+            super().close()
+
+    def abort(self):
+        """
+        Discards everything written so far. No object is created in S3.
+        """
+        if self.closed:
+            return
+        try:
+            if self._upload_id is not None:
+                for future in self._futures:
+                    future.exception()  # wait for in-flight parts before aborting
+                self.s3_client.abort_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, UploadId=self._upload_id
+                )
+        finally:
+            self._buffer = bytearray()
+            self._shutdown()
+            super().close()
+
+    def _shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __del__(self):
+        # IOBase would close (and so publish) a half-written object when garbage collected
+        try:
+            self.abort()
+        except Exception:
+            pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
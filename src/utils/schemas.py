@@ -0,0 +1,142 @@
+import pyarrow as pa
+
+# Postgres type OIDs (pg_type.oid) mapped to the Arrow type each column is stored as
+POSTGRES_TO_ARROW = {
+    16: pa.bool_(),  # boolean
+    20: pa.int64(),  # bigint
+    21: pa.int16(),  # smallint
+    23: pa.int32(),  # integer / serial
+    700: pa.float32(),  # real
+    701: pa.float64(),  # double precision
+    1082: pa.date32(),  # date
+    1083: pa.time64("us"),  # time
+    1114: pa.timestamp("us"),  # timestamp
+    1184: pa.timestamp("us", tz="UTC"),  # timestamptz
+}
+NUMERIC_OID = 1700
+# Unconstrained NUMERIC columns (e.g. unit_price) have no declared precision or scale
+DEFAULT_DECIMAL = pa.decimal128(38, 18)
+MAX_DECIMAL_PRECISION = 38  # the most digits a decimal128 can hold
+
+
+def arrow_type_for_column(column):
+    """
+    Picks the Arrow type for a result column described by a DB-API cursor.
+
+    Args:
+        column: One entry of cursor.description.
+
+    Returns:
+        pyarrow.DataType: The matching Arrow type. Types without a mapping are stored as strings.
+    """
+    if column.type_code == NUMERIC_OID:
+        # psycopg2 reports 65535 for both when the column has no declared precision
+        if (
+            column.precision
+            and column.precision <= MAX_DECIMAL_PRECISION
+            and column.scale is not None
+            and column.scale <= column.precision
+        ):
+            return pa.decimal128(column.precision, column.scale)
+        return DEFAULT_DECIMAL
+    return POSTGRES_TO_ARROW.get(column.type_code, pa.string())
+
+
+def arrow_schema_from_description(description):
+    """
+    Builds a fixed Arrow schema from a cursor's column descriptions, so every batch of a table
+    is written with the same types instead of having them inferred from the values.
+
+    Args:
+        description: The cursor.description of an executed query.
+
+    Returns:
+        pyarrow.Schema: One nullable field per column, in query order.
+    """
+    return pa.schema(
+        [pa.field(column.name, arrow_type_for_column(column)) for column in description]
+    )
+
+
+_ID = pa.int64()
+_TEXT = pa.string()
+_TIMESTAMP = pa.timestamp("us")
+_AUDIT = {"created_at": _TIMESTAMP, "last_updated": _TIMESTAMP}
+
+# Types of the CSV columns transform reads, per table, matching the source database, so the
+# pyarrow parser doesn't infer them for every file. Columns not listed (e.g. from a full_rows
+# extract, or a change file's 'op') are still inferred. NUMERIC columns are read as float64,
+# as pandas would.
+CSV_COLUMN_TYPES = {
+    "address": {
+        "address_id": _ID,
+        "address_line_1": _TEXT,
+        "address_line_2": _TEXT,
+        "district": _TEXT,
+        "city": _TEXT,
+        "postal_code": _TEXT,
+        "country": _TEXT,
+        "phone": _TEXT,
+        **_AUDIT,
+    },
+    "counterparty": {
+        "counterparty_id": _ID,
+        "counterparty_legal_name": _TEXT,
+        "legal_address_id": _ID,
+        "commercial_contact": _TEXT,
+        "delivery_contact": _TEXT,
+        **_AUDIT,
+    },
+    "currency": {"currency_id": _ID, "currency_code": _TEXT, **_AUDIT},
+    "department": {
+        "department_id": _ID,
+        "department_name": _TEXT,
+        "location": _TEXT,
+        "manager": _TEXT,
+        **_AUDIT,
+    },
+    "design": {
+        "design_id": _ID,
+        "design_name": _TEXT,
+        "file_location": _TEXT,
+        "file_name": _TEXT,
+        **_AUDIT,
+    },
+    "sales_order": {
+        "sales_order_id": _ID,
+        "design_id": _ID,
+        "staff_id": _ID,
+        "counterparty_id": _ID,
+        "units_sold": _ID,
+        "unit_price": pa.float64(),
+        "currency_id": _ID,
+        "agreed_delivery_date": _TEXT,
+        "agreed_payment_date": _TEXT,
+        "agreed_delivery_location_id": _ID,
+        **_AUDIT,
+    },
+    "staff": {
+        "staff_id": _ID,
+        "first_name": _TEXT,
+        "last_name": _TEXT,
+        "department_id": _ID,
+        "email_address": _TEXT,
+        **_AUDIT,
+    },
+}
+
+
+def csv_column_types(key):
+    """
+    Looks up the declared CSV column types of the table an extracted file belongs to.
+
+    Args:
+        key (str): The S3 key, e.g. '2025/06/11/payment_type_2025-06-11 10:00:00.csv'.
+
+    Returns:
+        dict: Column name to Arrow type. Empty for tables without declared types.
+    """
+    name = key.rsplit("/", 1)[-1]
+    # the longest match, so 'payment_type_...' isn't taken for 'payment'
+    tables = [table for table in CSV_COLUMN_TYPES if name.startswith(f"{table}_")]
+    return CSV_COLUMN_TYPES[max(tables, key=len)] if tables else {}
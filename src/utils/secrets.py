@@ -0,0 +1,107 @@
+import json
+import os
+import threading
+import time
+import boto3
+
+# how long fetched credentials are used before Secrets Manager is asked again
+SECRET_TTL_SECONDS = float(os.environ.get("SECRET_TTL_SECONDS", "300"))
+# SQLSTATEs Postgres reports a rejected login with: invalid_password, invalid_authorization_specification
+AUTH_ERROR_CODES = ("28P01", "28000")
+
+
+class CachedSecret:
+    """
+    Credentials from a Secrets Manager secret (a JSON object), fetched once and kept in memory
+    for 'ttl' seconds, so warm Lambda invocations don't each make an API call.
+    Without a 'secret_id' (e.g. when running locally), 'fallback' is called instead,
+    typically to read the same keys from environment variables.
+
+    Example:
+        credentials = CachedSecret(os.environ.get("PG_SECRET_ID"), fallback=lambda: {...})
+        db = credentials.connect(lambda secret: psycopg2.connect(**secret))
+    """
+
+    def __init__(self, secret_id, fallback, ttl=None):
+        """
+        Args:
+            secret_id (str | None): Name or ARN of the secret.
+            fallback (callable): Returns the credentials when there is no 'secret_id'.
+            ttl (float, optional): Seconds to keep the secret. Defaults to SECRET_TTL_SECONDS.
+        """
+        self.secret_id = secret_id
+        self.fallback = fallback
+        self.ttl = SECRET_TTL_SECONDS if ttl is None else ttl
+        self.fetches = 0  # calls made to Secrets Manager
+        self._value = None
+        self._fetched_at = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self, refresh=False):
+        """
+        Gets the credentials, from the cache while it is fresh.
+
+        Args:
+            refresh (bool, optional): Fetch the secret again even if the cached copy is fresh,
+                e.g. after a login failed because the password was rotated.
+
+        Returns:
+            dict: The secret's keys and values.
+        """
+        if not self.secret_id:
+            return self.fallback()
+        with self._lock:
+            expired = (
+                self._fetched_at is None
+                or time.monotonic() - self._fetched_at >= self.ttl
+            )
+            if refresh or expired:
+                if self._client is None:
+                    self._client = boto3.client("secretsmanager")
+                response = self._client.get_secret_value(SecretId=self.secret_id)
+                self._value = json.loads(response["SecretString"])
+                self._fetched_at = time.monotonic()
+                self.fetches += 1
+            return self._value
+
+    def connect(self, connect):
+        """
+        Connects with the cached credentials, and once more with freshly fetched ones if the
+        login is rejected, so a rotated password is picked up without waiting for the TTL.
+
+        Args:
+            connect (callable): Takes the credentials and returns a new connection.
+
+        Returns:
+            The connection.
+        """
+        try:
+            return connect(self.get())
+        except Exception as e:
+            if not self.secret_id or not is_auth_error(e):
+                raise
+            return connect(self.get(refresh=True))
+
+
+def is_auth_error(error):
+    """
+    Checks whether an error (from psycopg2, pg8000 or SQLAlchemy) is Postgres rejecting a login.
+
+    Args:
+        error (Exception): The error raised while connecting.
+
+    Returns:
+        bool: True for a wrong password or user.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        code = getattr(error, "pgcode", None)
+        if code is None and error.args and isinstance(error.args[0], dict):
+            code = error.args[0].get("C")  # pg8000 passes the server's error fields
+        if code in AUTH_ERROR_CODES or "authentication failed" in str(error):
+            return True
+        # SQLAlchemy keeps the driver's error in 'orig'
+        error = getattr(error, "orig", None) or error.__cause__
+    return False
@@ -0,0 +1,93 @@
+from io import BytesIO
+import pandas as pd
+from botocore.exceptions import ClientError
+
+SNAPSHOT_PREFIX = "dimension_snapshots"
+# The parent tables other dimensions join to (counterparty to address, staff to department),
+# with the columns the joins take from them
+SNAPSHOT_COLUMNS = {
+    "address": [
+        "address_line_1",
+        "address_line_2",
+        "district",
+        "city",
+        "postal_code",
+        "country",
+        "phone",
+    ],
+    "department": ["department_name", "location"],
+}
+
+# (bucket, table): (ETag, DataFrame), kept between warm invocations
+_cache = {}
+
+
+class DimensionSnapshot:
+    """
+    The latest version of every row of a parent table, stored in the transform bucket as Parquet,
+    so a dimension can be joined to its parent when only the dimension's table changed.
+    Every run merges the parent rows it read into the snapshot, newer rows replacing older ones
+    with the same key. The frame is kept in memory between warm invocations and only
+    downloaded again when its ETag changed, e.g. after another invocation merged rows into it.
+
+    Example:
+        snapshot = DimensionSnapshot(s3_client, bucket, "address")
+        address = snapshot.merge(address_rows)  # when the batch has address rows
+        address = snapshot.read()  # when it doesn't
+    """
+
+    def __init__(self, s3_client, bucket, table):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.table = table
+
+    @property
+    def key(self):
+        return f"{SNAPSHOT_PREFIX}/{self.table}.parquet"
+
+    def read(self):
+        """
+        Gets the snapshot, from memory if it hasn't changed in S3 since it was last read or written.
+
+        Returns:
+            pd.DataFrame | None: The parent's rows, indexed by primary key, or None before the first merge.
+        """
+        cached = _cache.get((self.bucket, self.table))
+        conditions = {"IfNoneMatch": cached[0]} if cached else {}
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket, Key=self.key, **conditions
+            )
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code in ("304", "NotModified"):
+                return cached[1]
+            if code != "NoSuchKey":
+                raise
+            return None
+        df = pd.read_parquet(BytesIO(response["Body"].read()))
+        _cache[(self.bucket, self.table)] = (response["ETag"], df)
+        return df
+
+    def merge(self, rows):
+        """
+        Merges parent rows into the snapshot and writes it back.
+
+        Args:
+            rows (pd.DataFrame): Rows of the parent table read in this run, indexed by primary key.
+
+        Returns:
+            pd.DataFrame: The merged snapshot, to join to.
+        """
+        columns = [column for column in SNAPSHOT_COLUMNS[self.table] if column in rows]
+        df = rows[columns]
+        current = self.read()
+        if current is not None:
+            df = pd.concat([current[~current.index.isin(df.index)], df]).sort_index()
+        buffer = BytesIO()
+        df.to_parquet(buffer)
+        response = self.s3_client.put_object(
+            Bucket=self.bucket, Key=self.key, Body=buffer.getvalue()
+        )
+        _cache[(self.bucket, self.table)] = (response["ETag"], df)
+        return df
@@ -4,17 +4,40 @@ import logging
 from io import BytesIO
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
+from src.utils.compression import compression_for_key
+from src.utils.pipeline import prefetch
 
 load_dotenv()
 BUCKET = os.environ["BUCKET"]
+# objects read_csv_to_df downloads ahead of the one being transformed
+TRANSFORM_PREFETCH = int(os.environ.get("TRANSFORM_PREFETCH", "4"))
+# cap on the bytes of downloaded objects not yet transformed
+TRANSFORM_PREFETCH_BYTES = int(
+    os.environ.get("TRANSFORM_PREFETCH_BYTES", str(256 * 2**20))
+)
+# "pandas" infers every column's type with pd.read_csv, "pyarrow" parses on several threads
+# with the types declared in CSV_COLUMN_TYPES (see read_csv_with_arrow)
+TRANSFORM_CSV_PARSER = os.environ.get("TRANSFORM_CSV_PARSER", "pandas")
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# pyarrow (with its csv and parquet modules) and the CSV schemas are imported by the functions
+# that use them, so importing the transform lambda doesn't pay for loading them.
+
 
 def read_csv_to_df(key_list, s3_client, origin_bucket=BUCKET):
     """
     Reads CSV files from S3 and converts each into a Pandas DataFrame.
+    The next TRANSFORM_PREFETCH objects are downloaded on a thread pool while the caller works on
+    the current DataFrame, holding at most TRANSFORM_PREFETCH_BYTES, and are still yielded in order.
+    Keys ending in '.parquet' (typed extracts) are read as Parquet, so no types need inferring.
+    CSV keys are parsed with the TRANSFORM_CSV_PARSER backend.
+    CSV keys ending in '.gz' or '.zst' are not downloaded ahead, only their response is: the body
+    is streamed and decompressed as it is parsed, so the whole object is never held in memory.
+    Their compressed size still counts against TRANSFORM_PREFETCH_BYTES while the stream is open.
+    Change files from the cdc extract mode have an 'op' column. The warehouse only appends,
+    so their deleted rows are dropped and the latest state of every other row is kept.
 
     Args:
         key_list (list): List of S3 object keys (file paths).
@@ -28,10 +51,33 @@ def read_csv_to_df(key_list, s3_client, origin_bucket=BUCKET):
     if not key_list:
         raise IndexError("Argument list must not be empty.")
 
-    for key in key_list:
+    def download(key, reserve):
+        response = s3_client.get_object(Bucket=origin_bucket, Key=key)
+        reserve(response["ContentLength"])
+        if compression_for_key(key):
+            return response["Body"]
+        return response["Body"].read()
+
+    downloads = prefetch(
+        key_list, download, TRANSFORM_PREFETCH, TRANSFORM_PREFETCH_BYTES
+    )
+    for key, downloaded in zip(key_list, downloads):
         try:
-            response = s3_client.get_object(Bucket=origin_bucket, Key=key)
-            df = pd.read_csv(BytesIO(response.get("Body").read()), index_col=0)
+            data = downloaded.result()
+            if key.endswith(".parquet"):
+                df = pd.read_parquet(BytesIO(data))
+                df.set_index(df.columns[0], inplace=True)
+            elif TRANSFORM_CSV_PARSER == "pyarrow":
+                df = read_csv_with_arrow(data, key)
+            else:
+                df = pd.read_csv(
+                    BytesIO(data) if isinstance(data, bytes) else data,
+                    index_col=0,
+                    compression=compression_for_key(key),
+                )
+            if "op" in df.columns:
+                df = df[~df.index.duplicated(keep="last")]
+                df = df[df["op"] != "D"].drop(columns="op")
             yield {key: df}
 
         except ClientError as e:
@@ -43,6 +89,104 @@ def read_csv_to_df(key_list, s3_client, origin_bucket=BUCKET):
             )
 
 
+def read_csv_with_arrow(data, key):
+    """
+    Parses an extracted CSV file with pyarrow.csv, which splits it into blocks parsed on
+    several threads, into a DataFrame indexed by its first column.
+    - Columns declared in CSV_COLUMN_TYPES for the key's table get that type instead of having it
+      inferred. Timestamps are in the ISO 8601 form COPY writes ('2022-11-03 14:20:52.186'),
+      which Arrow parses natively.
+    - Unquoted empty values are null, as COPY writes NULL, and quoted ones ('""') are empty strings.
+    - Conversion to pandas reuses Arrow's buffers where it can (numbers and timestamps without
+      nulls), instead of copying every column.
+
+    Args:
+        data (bytes | file-like): The object's contents, or a readable stream of them (e.g. an S3
+            response body), compressed if the key says so.
+        key (str): The S3 key, for the table name and compression.
+
+    Returns:
+        pd.DataFrame: The file's rows.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    source = (
+        pa.py_buffer(data) if isinstance(data, bytes) else pa.PythonFile(data, mode="r")
+    )
+    table = pacsv.read_csv(
+        pa.input_stream(source, compression=compression_for_key(key)),
+        read_options=pacsv.ReadOptions(use_threads=True),
+        convert_options=arrow_convert_options(key),
+    )
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    df.set_index(df.columns[0], inplace=True)
+    return df
+
+
+def arrow_convert_options(key):
+    """
+    Builds the pyarrow.csv conversion options for an extracted file, see read_csv_with_arrow.
+
+    Args:
+        key (str): The S3 key, for the table name.
+
+    Returns:
+        pyarrow.csv.ConvertOptions: The options.
+    """
+    import pyarrow.csv as pacsv
+    from src.utils.schemas import csv_column_types
+
+    return pacsv.ConvertOptions(
+        column_types=csv_column_types(key),
+        timestamp_parsers=[pacsv.ISO8601],
+        strings_can_be_null=True,
+        quoted_strings_can_be_null=False,
+    )
+
+
+def read_csv_in_chunks(key, s3_client, block_size, origin_bucket=BUCKET):
+    """
+    Streams a CSV object from S3 and parses it a block at a time, like read_csv_with_arrow,
+    so only about 'block_size' bytes of the file are held in memory whatever its size.
+    Compressed keys are decompressed as the object streams in.
+
+    Args:
+        key (str): The S3 key of the CSV file.
+        s3_client (boto3.client): An active boto3 S3 client.
+        block_size (int): Bytes of CSV parsed into each chunk.
+        origin_bucket (str): Name of the S3 bucket to read from (default is BUCKET from .env).
+
+    Yields:
+        pd.DataFrame: Consecutive rows of the file, indexed by its first column.
+            A file without rows yields one empty DataFrame, so its columns are still known.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    response = s3_client.get_object(Bucket=origin_bucket, Key=key)
+    stream = pa.PythonFile(response["Body"], mode="r")
+    if compression := compression_for_key(key):
+        stream = pa.CompressedInputStream(stream, compression)
+    reader = pacsv.open_csv(
+        stream,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        convert_options=arrow_convert_options(key),
+    )
+    empty = True
+    for batch in reader:
+        empty = False
+        df = pa.Table.from_batches([batch]).to_pandas(
+            split_blocks=True, self_destruct=True
+        )
+        df.set_index(df.columns[0], inplace=True)
+        yield df
+    if empty:
+        df = reader.schema.empty_table().to_pandas()
+        df.set_index(df.columns[0], inplace=True)
+        yield df
+
+
 def df_to_parquet(df):
     """
     Converts a DataFrame to a Parquet file in memory.
@@ -59,9 +203,49 @@ def df_to_parquet(df):
     return buffer_value
 
 
+def write_parquet_chunks(dfs, file):
+    """
+    Writes DataFrames to one Parquet file as they come, each as its own row group, so the file
+    never has to be built in memory. Every DataFrame is converted to the schema of the first.
+    The index is always stored as a column, as a range index kept in the schema's metadata
+    would only describe the first chunk.
+
+    Args:
+        dfs (iterable): DataFrames with the same columns, e.g. transformed chunks of a file.
+        file: A writable binary file-like object, e.g. an S3MultipartWriter.
+
+    Returns:
+        int: The number of rows written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    rows = 0
+    try:
+        for df in dfs:
+            if writer is None:
+                table = pa.Table.from_pandas(df, preserve_index=True)
+                writer = pq.ParquetWriter(file, table.schema)
+            else:
+                table = pa.Table.from_pandas(
+                    df, schema=writer.schema, preserve_index=True
+                )
+            writer.write_table(table)
+            rows += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
 def create_sales_fact(df):
     """
     Prepares the sales fact table by extracting date and time from datetime columns.
+       'created_at' and 'last_updated' are each parsed once, as ISO 8601 with or without
+       fractional seconds (COPY leaves out trailing zeros), or used as they are if already typed.
+       Each is replaced in place by '<name>_date' (date32) and '<name>_time' (time64) columns
+       backed by Arrow, which df_to_parquet writes as DATE and TIME without Python objects.
 
     Args:
         df (pd.DataFrame): Raw sales data as panda dataframe.
@@ -69,12 +253,18 @@ def create_sales_fact(df):
     Returns:
         pd.DataFrame: Transformed DataFrame with split datetime columns.
     """
-    df["created_date"] = pd.to_datetime(df["created_at"]).dt.date
-    df["created_time"] = pd.to_datetime(df["created_at"]).dt.time
-    df.drop(["created_at"], axis="columns", inplace=True)
-    df["last_updated_date"] = pd.to_datetime(df["last_updated"]).dt.date
-    df["last_updated_time"] = pd.to_datetime(df["last_updated"]).dt.time
-    df.drop(["last_updated"], axis="columns", inplace=True)
+    import pyarrow as pa
+
+    for column, prefix in (("created_at", "created"), ("last_updated", "last_updated")):
+        timestamps = pa.Array.from_pandas(
+            pd.to_datetime(df.pop(column), format="ISO8601")
+        )
+        df[f"{prefix}_date"] = pd.arrays.ArrowExtensionArray(
+            timestamps.cast(pa.date32())
+        )
+        df[f"{prefix}_time"] = pd.arrays.ArrowExtensionArray(
+            timestamps.cast(pa.time64("us"))
+        )
     return df
 
 
@@ -88,7 +278,9 @@ def create_location_dim(df):
     Returns:
         pd.DataFrame: Cleaned DataFrame with appropriate index set.
     """
-    df.drop(["created_at", "last_updated"], axis="columns", inplace=True)
+    df.drop(
+        ["created_at", "last_updated"], axis="columns", inplace=True, errors="ignore"
+    )
     df.rename_axis("location_id", inplace=True)
     return df
 
@@ -103,7 +295,9 @@ def create_design_dim(df):
     Returns:
         pd.DataFrame: Cleaned design data.
     """
-    df.drop(["created_at", "last_updated"], axis="columns", inplace=True)
+    df.drop(
+        ["created_at", "last_updated"], axis="columns", inplace=True, errors="ignore"
+    )
     return df
 
 
@@ -115,7 +309,9 @@ def create_currency_dim(df):
 
     Returns: pd.Dataframe: Cleaned and enriched currency data
     """
-    df.drop(["created_at", "last_updated"], axis="columns", inplace=True)
+    df.drop(
+        ["created_at", "last_updated"], axis="columns", inplace=True, errors="ignore"
+    )
     df["currency_name"] = ["Great British Pounds", "US Dollars", "Euros"]
     return df
 
@@ -136,6 +332,7 @@ def create_counterparty_dim(df_counterparty, df_address):
         ["commercial_contact", "delivery_contact", "created_at", "last_updated"],
         axis="columns",
         inplace=True,
+        errors="ignore",
     )
     df = df_counterparty.merge(df_address, left_on="legal_address_id", right_index=True)
     # df.drop(["created_at", "last_updated"], axis="columns", inplace=True)
@@ -168,9 +365,14 @@ def create_staff_dim(df_staff, df_department):
     Returns:
         pd.DataFrame: Staff data with department info merged in.
     """
-    df_staff.drop(["created_at", "last_updated"], axis="columns", inplace=True)
+    df_staff.drop(
+        ["created_at", "last_updated"], axis="columns", inplace=True, errors="ignore"
+    )
     df_department.drop(
-        ["manager", "created_at", "last_updated"], axis="columns", inplace=True
+        ["manager", "created_at", "last_updated"],
+        axis="columns",
+        inplace=True,
+        errors="ignore",
     )
     df = df_staff.merge(df_department, left_on="department_id", right_index=True)
     df.drop(["department_id"], axis="columns", inplace=True)
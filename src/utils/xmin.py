@@ -0,0 +1,69 @@
+# row xmin values are 32 bit, snapshots hold 64 bit (epoch aware) transaction ids
+XID_MODULO = 2**32
+# age() comparisons are only reliable while the xids compared are less than 2^31 apart
+XMIN_MAX_AGE = 1_000_000_000
+
+
+def get_current_snapshot(db_cursor):
+    """
+    Gets the snapshot of the current statement (or transaction, under REPEATABLE READ).
+
+    Args:
+        db_cursor: An open psycopg2 cursor.
+
+    Returns:
+        str: The snapshot as text, 'xmin:xmax:xip_list', e.g. '7651:7655:7652,7653'.
+    """
+    db_cursor.execute("SELECT pg_current_snapshot()::text AS snapshot")
+    row = db_cursor.fetchone()
+    return row["snapshot"] if isinstance(row, dict) else row[0]
+
+
+def parse_snapshot(snapshot):
+    """
+    Splits a snapshot into the transaction ids it is made of.
+
+    Args:
+        snapshot (str): A snapshot from get_current_snapshot.
+
+    Returns:
+        tuple[int, int, list[int]]: Its xmin, its xmax and the ids that were still in progress.
+    """
+    xmin, xmax, in_progress = snapshot.split(":")
+    return int(xmin), int(xmax), [int(xid) for xid in in_progress.split(",") if xid]
+
+
+def snapshot_age(snapshot, current_snapshot):
+    """
+    Counts the transactions started since a stored snapshot was taken.
+
+    Args:
+        snapshot (str): The stored snapshot.
+        current_snapshot (str): A snapshot taken now.
+
+    Returns:
+        int: The number of transaction ids assigned in between.
+    """
+    return parse_snapshot(current_snapshot)[1] - parse_snapshot(snapshot)[1]
+
+
+def xmin_condition(snapshot):
+    """
+    Builds a WHERE condition that matches the rows written by transactions the snapshot
+    could not see, i.e. rows inserted or updated after it was taken.
+       Row xmin values wrap around every 2^32 transactions, so they are compared by age()
+       (distance back from the current transaction) instead of by value. Only use snapshots
+       younger than XMIN_MAX_AGE, checked with snapshot_age.
+
+    Args:
+        snapshot (str): The snapshot taken before the previous extract of the table.
+
+    Returns:
+        tuple[str, list]: The condition and its parameters.
+    """
+    _, xmax, in_progress = parse_snapshot(snapshot)
+    # age() is 0 or more for every committed row; frozen rows report the maximum age
+    return (
+        "(age(xmin) BETWEEN 0 AND age(%s::text::xid) OR xmin::text = ANY(%s))",
+        [str(xmax % XID_MODULO), [str(xid % XID_MODULO) for xid in in_progress]],
+    )
@@ -43,6 +43,29 @@ resource "aws_iam_role_policy_attachment" "lambda_s3_write_policy_attachment" {
   policy_arn = aws_iam_policy.lambda_s3_policy.arn
 }
 # ------------------------------
+# Lambda IAM Policy for Secrets Manager
+# ------------------------------
+# Define
+data "aws_iam_policy_document" "secrets_policy_doc" {
+  statement {
+    effect = "Allow"
+    actions = ["secretsmanager:GetSecretValue"]
+    resources = [data.aws_secretsmanager_secret_version.database_secret.arn,
+      data.aws_secretsmanager_secret_version.warehouse_secret.arn
+    ]
+  }
+}
+# Create
+resource "aws_iam_policy" "lambda_secrets_policy" {
+  name   = "lambda_secrets_policy"
+  policy = data.aws_iam_policy_document.secrets_policy_doc.json
+}
+# Attach
+resource "aws_iam_role_policy_attachment" "lambda_secrets_policy_attachment" {
+  role       = aws_iam_role.lambda_role.name
+  policy_arn = aws_iam_policy.lambda_secrets_policy.arn
+}
+# ------------------------------
 # Lambda IAM Policy for CloudWatch
 # ------------------------------
 # Define
@@ -57,10 +57,8 @@ resource "aws_lambda_function" "extract_handler" {
   environment {
     variables = {
       BUCKET = var.ingestion_bucket_name
-      PG_USERNAME=jsondecode(data.aws_secretsmanager_secret_version.database_secret.secret_string)["username"],
-      PG_DATABASE=jsondecode(data.aws_secretsmanager_secret_version.database_secret.secret_string)["database"],
-      PG_PASSWORD=jsondecode(data.aws_secretsmanager_secret_version.database_secret.secret_string)["password"],
-      PG_HOST=jsondecode(data.aws_secretsmanager_secret_version.database_secret.secret_string)["host"]
+      # read at run time (and cached), so a rotated password is picked up without a redeploy
+      PG_SECRET_ID = data.aws_secretsmanager_secret_version.database_secret.secret_id
     }
   }
 }
@@ -136,7 +134,7 @@ resource "aws_lambda_function" "load_handler" {
   environment {
     variables = {
       TRANSFORM_BUCKET = var.transformation_bucket_name
-      PG_CONNECTION=jsondecode(data.aws_secretsmanager_secret_version.warehouse_secret.secret_string)["PG_CONNECTION"],
+      WAREHOUSE_SECRET_ID = data.aws_secretsmanager_secret_version.warehouse_secret.secret_id
     }
   }
 }
\ No newline at end of file
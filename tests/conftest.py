@@ -6,10 +6,12 @@ from psycopg2.extras import RealDictCursor
 from moto import mock_aws
 import boto3
 from unittest.mock import Mock, patch
-from src.extract import BUCKET
+from src.extract import BUCKET, TABLE_LIST, get_high_watermark, set_watermark
 from src.transform import TRANSFORM_BUCKET
 from tests.test_db.seed import seed_db
-from src.utils.connection import create_connection_to_local
+from src.utils.cdc import drop_replication_slot
+from src.utils.clients import get_client
+from src.utils.connection import close_pools, create_connection_to_local
 
 #######################
 # AWS MOCKING
@@ -95,6 +97,25 @@ def seed_database():
         print(e)
 
 
+@pytest.fixture(autouse=True)
+def fresh_connection_pools():
+    """
+    Closes the pools a test opened, as they would otherwise be kept for the rest of the session.
+    """
+    yield
+    close_pools()
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients():
+    """
+    Drops the cached boto3 clients after each test, so a client created inside one test's
+    mock_aws isn't reused by a later test.
+    """
+    yield
+    get_client.cache_clear()
+
+
 ##########################
 # MOCKS AND PATCHES
 ##########################
@@ -126,6 +147,22 @@ def mock_get_state_false():
         yield mock
 
 
+@pytest.fixture()
+def stored_watermarks(seed_database, s3_with_bucket):
+    """
+    Stores every table's current watermark, as a previous run would have,
+    so a repeat run only exports rows changed after this point.
+
+    Yields:
+        s3_client: mocked s3 client with the status file written
+    """
+    db = create_connection_to_local()
+    for table in TABLE_LIST:
+        set_watermark(s3_with_bucket, table, get_high_watermark(db.cursor(), table))
+    db.close()
+    yield s3_with_bucket
+
+
 @pytest.fixture()
 def mock_change_state():
     """Mocks the response from the delete_object_from_bucket aws util
@@ -146,9 +183,28 @@ def mock_connection():
         mock: mock with return value of success response expected
     """
     with patch("src.extract.create_connection") as mock:
-        new_conn = create_connection_to_local()
-        mock.return_value = new_conn
-        yield mock.return_value
+        # a new connection per call, as extract workers must not share one
+        mock.side_effect = create_connection_to_local
+        yield mock
+
+
+@pytest.fixture()
+def cdc_mode(seed_database):
+    """
+    Switches the extract lambda to cdc mode with a test replication slot,
+    and drops the slot afterwards so it doesn't hold on to WAL.
+
+    Yields:
+        str: The name of the replication slot.
+    """
+    with patch("src.extract.EXTRACT_STRATEGY", "cdc"), patch(
+        "src.extract.CDC_SLOT", "test_extract_slot"
+    ), patch("src.extract.CDC_PUBLICATION", "test_extract_publication"):
+        yield "test_extract_slot"
+    db = create_connection_to_local()
+    db.autocommit = True
+    drop_replication_slot(db, "test_extract_slot", "test_extract_publication")
+    db.close()
 
 
 @pytest.fixture()
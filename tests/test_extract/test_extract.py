@@ -1,3 +1,5 @@
+import gzip
+import hashlib
 import io
 import json
 import logging
@@ -7,8 +9,22 @@ import pandas as pd
 import pytest
 from botocore.exceptions import ClientError
 
-from src.extract import extract_handler, BUCKET
-from src.utils.connection import pg8000_connect_to_local
+from unittest.mock import patch
+from src.extract import (
+    extract_handler,
+    get_watermarks,
+    get_chunk_progress,
+    save_chunk_plan,
+    build_extract_query,
+    get_high_watermark,
+    BUCKET,
+)
+from src.utils.connection import (
+    pg8000_connect_to_local,
+    create_connection_to_local,
+    export_snapshot,
+    use_snapshot,
+)
 
 # BEFORE RUNNING, RUN:
 #    setup_dbs.sql
@@ -45,21 +61,26 @@ class TestLambdaExtractHandler:
         extract_handler({}, None)
         res = s3_client.list_objects_v2(Bucket=BUCKET)
 
-        assert len(res["Contents"]) == len(table_list) + 1
+        assert (
+            len(res["Contents"]) == len(table_list) + 2
+        )  # plus status file and manifest
 
     def test_empty_csv_files_are_filtered_out(
         self,
         seed_database,
         mock_get_state_false,
         mock_connection,
-        s3_with_bucket,
+        stored_watermarks,
         s3_client,
     ):
         # mock get state false means it's not the first run
         extract_handler({}, None)
         res = s3_client.list_objects_v2(Bucket=BUCKET)
 
-        assert "Contents" not in res.keys()
+        keys = [x["Key"] for x in res["Contents"]]
+        assert len(keys) == 2
+        assert "status_check.json" in keys
+        assert keys[0].startswith("manifests/")
 
     def test_csv_files_have_correct_names(
         self,
@@ -73,7 +94,11 @@ class TestLambdaExtractHandler:
         res = s3_client.list_objects_v2(Bucket=BUCKET)
         contents: list = res["Contents"]
 
-        contents = [x for x in contents if x["Key"] != "status_check.json"]
+        contents = [
+            x
+            for x in contents
+            if x["Key"] != "status_check.json" and not x["Key"].startswith("manifests/")
+        ]
         year = datetime.datetime.now(datetime.UTC).strftime("%Y")
         month = datetime.datetime.now(datetime.UTC).strftime("%m")
         day = datetime.datetime.now(datetime.UTC).strftime("%d")
@@ -95,7 +120,7 @@ class TestLambdaExtractHandler:
         seed_database,
         mock_get_state_false,
         mock_connection,
-        s3_with_bucket,
+        stored_watermarks,
         s3_client,
     ):
         timestamp = datetime.datetime.now(datetime.UTC)
@@ -108,7 +133,7 @@ class TestLambdaExtractHandler:
                        RETURNING *;""")
         time.sleep(1)
 
-        extract_handler({}, None)
+        extract_handler({"full_rows": True}, None)
 
         res = s3_client.list_objects_v2(Bucket=BUCKET)
         file_key = res["Contents"][0]["Key"]
@@ -122,6 +147,577 @@ class TestLambdaExtractHandler:
         assert df["created_at"].iloc[0][:10] == timestamp_str[:10]
         assert df["last_updated"].iloc[0][:10] == timestamp_str[:10]
 
+    def test_repeat_runs_export_rows_after_the_watermark(
+        self, seed_database, s3_with_bucket, s3_client
+    ):
+        with patch(
+            "src.extract.create_connection", side_effect=create_connection_to_local
+        ):
+            extract_handler({}, None)
+            first_watermarks = get_watermarks(s3_client)
+
+            conn = pg8000_connect_to_local()
+            conn.run(
+                "UPDATE staff SET last_updated = CURRENT_TIMESTAMP WHERE staff_id = 1"
+            )
+            conn.close()
+            extract_handler({}, None)
+
+        second_watermarks = get_watermarks(s3_client)
+        keys = [
+            record["Key"]
+            for record in s3_client.list_objects_v2(Bucket=BUCKET)["Contents"]
+        ]
+        staff_keys = [key for key in keys if key.split("/")[-1].startswith("staff_")]
+        body = s3_client.get_object(Bucket=BUCKET, Key=staff_keys[-1])["Body"].read()
+        df = pd.read_csv(io.BytesIO(body))
+
+        assert set(first_watermarks) == set(table_list)
+        assert len(keys) == len(table_list) + 4  # plus status file and two manifests
+        assert list(df["staff_id"]) == [1]
+        assert second_watermarks["staff"] > first_watermarks["staff"]
+        assert second_watermarks["address"] == first_watermarks["address"]
+
+    def test_unchanged_tables_are_skipped_without_querying_them(
+        self, mock_get_state_false, mock_connection, stored_watermarks, s3_client
+    ):
+        conn = pg8000_connect_to_local()
+        conn.run("UPDATE staff SET last_updated = CURRENT_TIMESTAMP WHERE staff_id = 1")
+        conn.close()
+
+        with patch(
+            "src.extract.build_extract_query", wraps=build_extract_query
+        ) as query_spy, patch(
+            "src.extract.get_high_watermark", wraps=get_high_watermark
+        ) as watermark_spy:
+            extract_handler({}, None)
+
+        assert [call.args[0] for call in query_spy.call_args_list] == ["staff"]
+        watermark_spy.assert_not_called()
+
+    def test_tables_without_a_watermark_are_exported_in_full(
+        self,
+        seed_database,
+        mock_get_state_false,
+        mock_connection,
+        s3_with_bucket,
+        s3_client,
+    ):
+        extract_handler({}, None)
+
+        keys = [
+            record["Key"]
+            for record in s3_client.list_objects_v2(Bucket=BUCKET)["Contents"]
+        ]
+        staff_key = next(key for key in keys if "/staff_" in key)
+        body = s3_client.get_object(Bucket=BUCKET, Key=staff_key)["Body"].read()
+        conn = pg8000_connect_to_local()
+        staff_count = conn.run("SELECT count(*) FROM staff")[0][0]
+        conn.close()
+
+        assert len([key for key in keys if key.endswith(".csv")]) == len(table_list)
+        assert len(pd.read_csv(io.BytesIO(body))) == staff_count
+
+    def test_failed_table_does_not_stop_the_others(
+        self, seed_database, mock_get_state_true, s3_with_bucket, s3_client, caplog
+    ):
+        with patch(
+            "src.extract.create_connection", side_effect=create_connection_to_local
+        ), patch(
+            "src.extract.build_extract_query",
+            side_effect=lambda table, low, high, *args, **kwargs: (
+                (f"SELECT * FROM missing_{table}", ())
+                if table == "design"
+                else (f"SELECT * FROM {table}", ())
+            ),
+        ):
+            extract_handler({}, None)
+
+        keys = [
+            record["Key"]
+            for record in s3_client.list_objects_v2(Bucket=BUCKET)["Contents"]
+        ]
+        assert not any("/design_" in key for key in keys)
+        assert len([key for key in keys if key.endswith(".csv")]) == len(table_list) - 1
+        assert "failed to extract the table design" in caplog.text
+
+    def test_exports_are_logged_in_table_order(
+        self, seed_database, mock_get_state_true, s3_with_bucket, s3_client, caplog
+    ):
+        caplog.set_level(logging.INFO)
+        with patch(
+            "src.extract.create_connection", side_effect=create_connection_to_local
+        ), patch(
+            "src.extract.order_tables_by_size",
+            side_effect=lambda db_cursor, tables: tables[::-1],
+        ):
+            extract_handler({}, None)
+
+        exported = [
+            record.message.split(f"s3://{BUCKET}/")[1].split("_20")[0]
+            for record in caplog.records
+            if record.message.startswith("Data exported")
+        ]
+        assert exported == table_list
+
+    def test_snapshot_mode_exports_every_table(
+        self, seed_database, mock_get_state_true, s3_with_bucket, s3_client
+    ):
+        with patch(
+            "src.extract.create_connection", side_effect=create_connection_to_local
+        ), patch("src.extract.EXTRACT_SNAPSHOT", True), patch(
+            "src.extract.use_snapshot", wraps=use_snapshot
+        ) as spy:
+            extract_handler({}, None)
+
+        keys = [
+            record["Key"]
+            for record in s3_client.list_objects_v2(Bucket=BUCKET)["Contents"]
+        ]
+        snapshot_ids = {call.args[1] for call in spy.call_args_list}
+        assert len([key for key in keys if key.endswith(".csv")]) == len(table_list)
+        assert len(snapshot_ids) == 1
+        assert spy.call_count == len(table_list) + 1  # every worker, plus the planner
+
+    def test_uses_snapshot_from_event(
+        self, seed_database, mock_get_state_true, s3_with_bucket, s3_client
+    ):
+        coordinator = create_connection_to_local()
+        snapshot_id = export_snapshot(coordinator)
+        with patch(
+            "src.extract.create_connection", side_effect=create_connection_to_local
+        ), patch("src.extract.use_snapshot", wraps=use_snapshot) as spy:
+            extract_handler({"snapshot_id": snapshot_id}, None)
+        coordinator.close()
+
+        assert {call.args[1] for call in spy.call_args_list} == {snapshot_id}
+
+    def test_first_run_splits_large_tables_into_parts(
+        self,
+        seed_database,
+        mock_get_state_true,
+        mock_connection,
+        s3_with_bucket,
+        s3_client,
+    ):
+        with patch("src.extract.EXTRACT_CHUNK_ROWS", 2):
+            extract_handler({}, None)
+
+        keys = [
+            record["Key"]
+            for record in s3_client.list_objects_v2(Bucket=BUCKET)["Contents"]
+        ]
+        sales_parts = [key for key in keys if "/sales_order_" in key]
+        rows = sum(
+            len(pd.read_csv(s3_client.get_object(Bucket=BUCKET, Key=key)["Body"]))
+            for key in sales_parts
+        )
+        assert len(sales_parts) == 3
+        assert all("_part000" in key for key in sales_parts)
+        assert rows == 5
+        assert get_chunk_progress(s3_client) == {}
+        assert "sales_order" in get_watermarks(s3_client)
+
+    def test_first_run_resumes_from_remaining_chunks(
+        self,
+        seed_database,
+        mock_get_state_true,
+        mock_connection,
+        s3_with_bucket,
+        s3_client,
+    ):
+        watermark = datetime.datetime(2030, 1, 1)
+        save_chunk_plan(s3_client, "sales_order", [[None, 4], [4, None]], watermark)
+        progress = get_chunk_progress(s3_client)
+        progress["sales_order"]["done"] = [0]
+        state = json.loads(
+            s3_client.get_object(Bucket=BUCKET, Key="status_check.json")["Body"].read()
+        )
+        state["chunks"] = progress
+        s3_client.put_object(
+            Bucket=BUCKET, Key="status_check.json", Body=json.dumps(state)
+        )
+
+        extract_handler({}, None)
+
+        keys = [
+            record["Key"]
+            for record in s3_client.list_objects_v2(Bucket=BUCKET)["Contents"]
+        ]
+        sales_parts = [key for key in keys if "/sales_order_" in key]
+        df = pd.read_csv(
+            s3_client.get_object(Bucket=BUCKET, Key=sales_parts[0])["Body"]
+        )
+        assert len(sales_parts) == 1
+        assert sales_parts[0].endswith("_part0001.csv")
+        assert df["sales_order_id"].min() >= 4
+        assert get_watermarks(s3_client)["sales_order"] == watermark
+
+    def test_resumed_first_run_skips_finished_tables(
+        self, mock_get_state_true, mock_connection, stored_watermarks, s3_client
+    ):
+        state = json.loads(
+            s3_client.get_object(Bucket=BUCKET, Key="status_check.json")["Body"].read()
+        )
+        del state["watermarks"]["sales_order"]
+        s3_client.put_object(
+            Bucket=BUCKET, Key="status_check.json", Body=json.dumps(state)
+        )
+
+        extract_handler({}, None)
+
+        keys = [
+            record["Key"]
+            for record in s3_client.list_objects_v2(Bucket=BUCKET)["Contents"]
+        ]
+        csv_keys = [key for key in keys if key.endswith(".csv")]
+        assert len(csv_keys) == 1
+        assert "/sales_order_" in csv_keys[0]
+
+    def test_first_run_is_not_ended_while_chunks_are_pending(
+        self, seed_database, mock_connection, s3_with_bucket, s3_client
+    ):
+        with patch("src.extract.EXTRACT_CHUNK_ROWS", 2), patch(
+            "src.extract.complete_chunk", side_effect=Exception("timed out")
+        ):
+            extract_handler({}, None)
+
+        state = json.loads(
+            s3_client.get_object(Bucket=BUCKET, Key="status_check.json")["Body"].read()
+        )
+        assert state["is_first_run"] is True
+        assert "sales_order" in get_chunk_progress(s3_client)
+
+    def test_gzip_compression_is_recorded_in_the_key(
+        self,
+        seed_database,
+        mock_get_state_true,
+        mock_connection,
+        s3_with_bucket,
+        s3_client,
+    ):
+        with patch("src.extract.EXTRACT_COMPRESSION", "gzip"):
+            extract_handler({}, None)
+
+        keys = [
+            record["Key"]
+            for record in s3_client.list_objects_v2(Bucket=BUCKET)["Contents"]
+        ]
+        staff_key = next(key for key in keys if "/staff_" in key)
+        body = s3_client.get_object(Bucket=BUCKET, Key=staff_key)["Body"].read()
+        df = pd.read_csv(io.BytesIO(gzip.decompress(body)))
+
+        assert len([key for key in keys if key.endswith(".csv.gz")]) == len(table_list)
+        assert len(df) == 5
+
+    def test_manifest_lists_every_exported_file(
+        self,
+        seed_database,
+        mock_get_state_true,
+        mock_connection,
+        s3_with_bucket,
+        s3_client,
+    ):
+        response = extract_handler({}, None)
+
+        manifest = json.loads(
+            s3_client.get_object(Bucket=BUCKET, Key=response["manifest_key"])[
+                "Body"
+            ].read()
+        )
+        files = manifest["files"]
+        staff = next(file for file in files if file["table"] == "staff")
+        body = s3_client.get_object(Bucket=BUCKET, Key=staff["key"])["Body"].read()
+
+        assert [file["table"] for file in files] == table_list
+        assert staff["row_count"] == len(pd.read_csv(io.BytesIO(body)))
+        assert staff["bytes"] == len(body)
+        assert staff["checksum"] == hashlib.sha256(body).hexdigest()
+        assert staff["watermark"] == get_watermarks(s3_client)["staff"].isoformat()
+
+    def test_manifest_is_written_when_nothing_changed(
+        self, mock_get_state_false, mock_connection, stored_watermarks, s3_client
+    ):
+        response = extract_handler({}, None)
+
+        manifest = json.loads(
+            s3_client.get_object(Bucket=BUCKET, Key=response["manifest_key"])[
+                "Body"
+            ].read()
+        )
+        assert manifest["files"] == []
+
+    @pytest.mark.parametrize("full_rows", [False, True])
+    def test_only_warehouse_columns_are_exported_unless_full_rows(
+        self,
+        seed_database,
+        mock_get_state_true,
+        mock_connection,
+        s3_with_bucket,
+        s3_client,
+        full_rows,
+    ):
+        response = extract_handler({"full_rows": full_rows}, None)
+
+        manifest = json.loads(
+            s3_client.get_object(Bucket=BUCKET, Key=response["manifest_key"])[
+                "Body"
+            ].read()
+        )
+        department = next(
+            file for file in manifest["files"] if file["table"] == "department"
+        )
+        body = s3_client.get_object(Bucket=BUCKET, Key=department["key"])["Body"]
+        df = pd.read_csv(body)
+
+        assert manifest["full_rows"] is full_rows
+        assert ("manager" in df.columns) is full_rows
+        assert list(df.columns[:3]) == ["department_id", "department_name", "location"]
+
+    def test_xmin_tables_export_backfills_that_keep_last_updated(
+        self, seed_database, mock_connection, s3_with_bucket, s3_client
+    ):
+        with patch("src.extract.XMIN_TABLES", {"staff"}):
+            with patch("src.extract.get_state", return_value=True):
+                extract_handler({}, None)
+            conn = pg8000_connect_to_local()
+            conn.run(
+                "UPDATE staff SET email_address = email_address WHERE staff_id = 2"
+            )
+            conn.close()
+            with patch("src.extract.get_state", return_value=False):
+                response = extract_handler({}, None)
+
+        manifest = json.loads(
+            s3_client.get_object(Bucket=BUCKET, Key=response["manifest_key"])[
+                "Body"
+            ].read()
+        )
+        [staff] = manifest["files"]
+        body = s3_client.get_object(Bucket=BUCKET, Key=staff["key"])["Body"].read()
+        df = pd.read_csv(io.BytesIO(body))
+
+        assert staff["table"] == "staff"
+        assert list(df["staff_id"]) == [2]
+
+    def test_row_hashes_leave_out_rows_that_only_had_last_updated_touched(
+        self, seed_database, mock_connection, s3_with_bucket, s3_client
+    ):
+        with patch("src.extract.EXTRACT_ROW_HASHES", True):
+            with patch("src.extract.get_state", return_value=True):
+                extract_handler({}, None)
+            conn = pg8000_connect_to_local()
+            conn.run("UPDATE staff SET last_updated = now() WHERE staff_id IN (1, 2)")
+            conn.run(
+                "UPDATE staff SET email_address = 'new@terrifictotes.com' "
+                "WHERE staff_id = 2"
+            )
+            conn.run("UPDATE currency SET last_updated = now() WHERE currency_id = 1")
+            conn.close()
+            with patch("src.extract.get_state", return_value=False):
+                response = extract_handler({}, None)
+                repeat = extract_handler({}, None)
+
+        manifest = json.loads(
+            s3_client.get_object(Bucket=BUCKET, Key=response["manifest_key"])[
+                "Body"
+            ].read()
+        )
+        repeat_manifest = json.loads(
+            s3_client.get_object(Bucket=BUCKET, Key=repeat["manifest_key"])[
+                "Body"
+            ].read()
+        )
+        [staff] = manifest["files"]
+        body = s3_client.get_object(Bucket=BUCKET, Key=staff["key"])["Body"].read()
+        df = pd.read_csv(io.BytesIO(body))
+
+        assert staff["table"] == "staff"
+        assert list(df["staff_id"]) == [2]
+        assert list(df["email_address"]) == ["new@terrifictotes.com"]
+        assert repeat_manifest["files"] == []
+
+    def test_row_hashes_export_changed_keys_in_batches(
+        self, seed_database, mock_connection, s3_with_bucket, s3_client
+    ):
+        with patch("src.extract.EXTRACT_ROW_HASHES", True), patch(
+            "src.extract.EXTRACT_KEY_BATCH", 1
+        ):
+            with patch("src.extract.get_state", return_value=True):
+                extract_handler({}, None)
+            conn = pg8000_connect_to_local()
+            conn.run(
+                "UPDATE staff SET email_address = 'new' || staff_id || '@terrifictotes.com', "
+                "last_updated = now() WHERE staff_id IN (3, 1, 2)"
+            )
+            conn.close()
+            with patch("src.extract.get_state", return_value=False):
+                response = extract_handler({}, None)
+
+        manifest = json.loads(
+            s3_client.get_object(Bucket=BUCKET, Key=response["manifest_key"])[
+                "Body"
+            ].read()
+        )
+        [staff] = manifest["files"]
+        body = s3_client.get_object(Bucket=BUCKET, Key=staff["key"])["Body"].read()
+        df = pd.read_csv(io.BytesIO(body))
+
+        assert staff["row_count"] == 3
+        assert list(df["staff_id"]) == [1, 2, 3]
+
+    def test_warm_invocations_reuse_pooled_connections(
+        self, stored_watermarks, mock_get_state_false, mock_connection
+    ):
+        first = extract_handler({}, None)
+        opened = mock_connection.call_count
+        second = extract_handler({}, None)
+
+        assert mock_connection.call_count == opened
+        assert second["connection_pool"]["hits"] > first["connection_pool"]["hits"]
+        assert second["connection_pool"]["misses"] == first["connection_pool"]["misses"]
+
+    def test_replica_watermarks_stop_at_its_replay_point(
+        self, stored_watermarks, mock_get_state_false, s3_client
+    ):
+        conn = pg8000_connect_to_local()
+        # ahead of the stored watermarks, whatever earlier tests left in the table
+        conn.run(
+            "UPDATE staff SET last_updated = now() + interval '1 hour' "
+            "WHERE staff_id = 1"
+        )
+        conn.run(
+            "UPDATE staff SET last_updated = now() + interval '2 hours' "
+            "WHERE staff_id = 2"
+        )
+        [[replay_point]] = conn.run("SELECT now() + interval '90 minutes'")
+        conn.close()
+
+        with patch(
+            "src.extract.choose_replica", return_value=("replica1", replay_point)
+        ), patch(
+            "src.extract.create_connection",
+            side_effect=lambda dsn=None: create_connection_to_local(),
+        ) as connect:
+            response = extract_handler({}, None)
+            with patch("src.extract.choose_replica", return_value=(None, None)):
+                caught_up = extract_handler({}, None)
+
+        def exported_staff(result):
+            manifest = json.loads(
+                s3_client.get_object(Bucket=BUCKET, Key=result["manifest_key"])[
+                    "Body"
+                ].read()
+            )
+            [staff] = manifest["files"]
+            body = s3_client.get_object(Bucket=BUCKET, Key=staff["key"])["Body"]
+            return list(pd.read_csv(body)["staff_id"])
+
+        assert connect.call_args_list[0].args == ("replica1",)
+        assert exported_staff(response) == [1]
+        assert exported_staff(caught_up) == [2]
+
+    def test_first_cdc_run_creates_the_slot_and_polls_every_table(
+        self, mock_get_state_true, mock_connection, cdc_mode, s3_with_bucket, s3_client
+    ):
+        response = extract_handler({}, None)
+
+        manifest = json.loads(
+            s3_client.get_object(Bucket=BUCKET, Key=response["manifest_key"])[
+                "Body"
+            ].read()
+        )
+        db = create_connection_to_local()
+        db_cursor = db.cursor()
+        db_cursor.execute(
+            "SELECT plugin FROM pg_replication_slots WHERE slot_name = %s", (cdc_mode,)
+        )
+        slot = db_cursor.fetchone()
+        db.close()
+
+        assert slot["plugin"] == "pgoutput"
+        assert [file["table"] for file in manifest["files"]] == table_list
+
+    def test_cdc_runs_export_inserts_updates_and_deletes(
+        self,
+        mock_get_state_false,
+        mock_connection,
+        cdc_mode,
+        stored_watermarks,
+        s3_client,
+    ):
+        extract_handler({}, None)  # creates the slot
+        conn = pg8000_connect_to_local()
+        conn.run(
+            "INSERT INTO staff VALUES (9001, 'Ada', 'Lovelace', 1, "
+            "'ada@terrifictotes.com', now(), now())"
+        )
+        conn.run("UPDATE staff SET last_name = 'King' WHERE staff_id = 9001")
+        conn.run("DELETE FROM staff WHERE staff_id = 9001")
+        conn.close()
+
+        response = extract_handler({}, None)
+        repeat = extract_handler({}, None)
+
+        manifest = json.loads(
+            s3_client.get_object(Bucket=BUCKET, Key=response["manifest_key"])[
+                "Body"
+            ].read()
+        )
+        repeat_manifest = json.loads(
+            s3_client.get_object(Bucket=BUCKET, Key=repeat["manifest_key"])[
+                "Body"
+            ].read()
+        )
+        state = json.loads(
+            s3_client.get_object(Bucket=BUCKET, Key="status_check.json")["Body"].read()
+        )
+        [staff] = manifest["files"]
+        body = s3_client.get_object(Bucket=BUCKET, Key=staff["key"])["Body"].read()
+        df = pd.read_csv(io.BytesIO(body))
+
+        assert staff["key"].endswith("_changes.csv")
+        assert list(df.columns) == [
+            "staff_id",
+            "first_name",
+            "last_name",
+            "department_id",
+            "email_address",
+            "op",
+        ]
+        assert list(df["op"]) == ["I", "U", "D"]
+        assert list(df["last_name"].fillna("")) == ["Lovelace", "King", ""]
+        assert manifest["lsn"] == state["cdc_lsn"]
+        assert repeat_manifest["files"] == []
+        assert repeat_manifest["lsn"] == manifest["lsn"]
+
+    def test_failed_cdc_upload_keeps_the_changes_for_the_next_run(
+        self,
+        mock_get_state_false,
+        mock_connection,
+        cdc_mode,
+        stored_watermarks,
+        s3_client,
+    ):
+        extract_handler({}, None)  # creates the slot
+        conn = pg8000_connect_to_local()
+        conn.run(
+            "UPDATE currency SET currency_code = currency_code WHERE currency_id = 1"
+        )
+        conn.close()
+
+        with patch(
+            "src.extract.write_change_file", side_effect=Exception("S3 went away")
+        ):
+            extract_handler({}, None)
+        response = extract_handler({}, None)
+
+        manifest = json.loads(
+            s3_client.get_object(Bucket=BUCKET, Key=response["manifest_key"])[
+                "Body"
+            ].read()
+        )
+        assert [file["table"] for file in manifest["files"]] == ["currency"]
 
     def test_handles_errors(self, seed_database, s3_client):
         # testing only boto3 errors for now as other errors would cause the function to not run at all
@@ -136,11 +732,11 @@ class TestLambdaExtractHandler:
         extract_handler({}, None)
 
         initial_state = s3_client.get_object(Bucket=BUCKET, Key="status_check.json")
-    
+
         file = json.loads(initial_state["Body"].read().decode())
-       
+
         assert file["is_first_run"] == False
-        
+
 
     def test_exported_data_logs(self, caplog, s3_client, s3_with_bucket, mock_get_state_true):
         extract_handler({}, None)
@@ -155,5 +751,3 @@ class TestLambdaExtractHandler:
         with caplog.at_level(logging.INFO):
             for ind,record in enumerate(caplog.records):
                 assert record.message == f"No data changes in the table {table_list[ind]}"
-
-
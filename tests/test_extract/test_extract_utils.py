@@ -1,6 +1,38 @@
+import datetime
 import json
+import time
+from io import BytesIO
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import pytest
-from src.extract import get_state, change_state, BUCKET, STATUS_KEY
+from unittest.mock import patch
+from src.extract import (
+    get_state,
+    change_state,
+    copy_query_to_file,
+    fetch_query_to_file,
+    parquet_query_to_file,
+    get_watermarks,
+    set_watermark,
+    get_high_watermark,
+    build_extract_query,
+    order_tables_by_size,
+    probe_changes,
+    get_chunk_ranges,
+    get_chunk_progress,
+    plan_table,
+    save_chunk_plan,
+    complete_chunk,
+    get_xmin_snapshots,
+    set_xmin_snapshots,
+    get_usable_snapshots,
+    BUCKET,
+    STATUS_KEY,
+)
+from src.utils.connection import create_connection_to_local
+from src.utils.governor import RowRateLimiter
+from src.utils.xmin import get_current_snapshot
 
 
 class TestChangeState:
@@ -61,3 +93,462 @@ class TestGetState:
         data = json.loads(get_object["Body"].read().decode("utf-8"))
 
         assert data["is_first_run"] == False
+
+
+class TestCopyQueryToFile:
+    def test_writes_csv_with_header(self, seed_database):
+        db = create_connection_to_local()
+        file = BytesIO()
+
+        row_count = copy_query_to_file(db.cursor(), "SELECT * FROM currency", file)
+        db.close()
+
+        df = pd.read_csv(BytesIO(file.getvalue()))
+        assert row_count == len(df) == 3
+        assert list(df.columns) == [
+            "currency_id",
+            "currency_code",
+            "created_at",
+            "last_updated",
+        ]
+
+    def test_returns_zero_for_no_rows(self, seed_database):
+        db = create_connection_to_local()
+        file = BytesIO()
+
+        row_count = copy_query_to_file(
+            db.cursor(), "SELECT * FROM currency WHERE false", file
+        )
+        db.close()
+
+        assert row_count == 0
+
+    def test_limiter_counts_every_line(self, seed_database):
+        db = create_connection_to_local()
+        limiter = RowRateLimiter(0)
+        counted = []
+        limiter.wait = counted.append
+
+        row_count = copy_query_to_file(
+            db.cursor(), "SELECT * FROM staff", BytesIO(), limiter=limiter
+        )
+        db.close()
+
+        assert sum(counted) == row_count + 1  # the header line
+
+    def test_param_sets_append_rows_under_one_header(self, seed_database):
+        db = create_connection_to_local()
+        file = BytesIO()
+
+        row_count = copy_query_to_file(
+            db.cursor(),
+            "SELECT * FROM currency WHERE currency_id = ANY(%s)",
+            file,
+            [([1, 2],), ([3],)],
+        )
+        db.close()
+
+        df = pd.read_csv(BytesIO(file.getvalue()))
+        assert row_count == 3
+        assert list(df["currency_id"]) == [1, 2, 3]
+
+
+class TestFetchQueryToFile:
+    @pytest.mark.parametrize("table", ["staff", "payment"])
+    def test_matches_copy_output(self, seed_database, table):
+        db = create_connection_to_local()
+        copy_file, fetch_file = BytesIO(), BytesIO()
+
+        copy_rows = copy_query_to_file(db.cursor(), f"SELECT * FROM {table}", copy_file)
+        fetch_rows = fetch_query_to_file(
+            db.cursor(), f"SELECT * FROM {table}", fetch_file, batch_size=2
+        )
+        db.close()
+
+        dates = ["created_at", "last_updated"]
+        copy_df = pd.read_csv(BytesIO(copy_file.getvalue()), parse_dates=dates)
+        fetch_df = pd.read_csv(BytesIO(fetch_file.getvalue()), parse_dates=dates)
+        assert copy_rows == fetch_rows
+        pd.testing.assert_frame_equal(copy_df, fetch_df)
+
+    def test_pipelined_fetch_matches_and_records_stalls(self, seed_database):
+        db = create_connection_to_local()
+        sequential, pipelined, metrics = BytesIO(), BytesIO(), {}
+
+        with patch("src.extract.EXTRACT_PIPELINE_DEPTH", 0):
+            fetch_query_to_file(
+                db.cursor(), "SELECT * FROM sales_order", sequential, batch_size=2
+            )
+        fetch_query_to_file(
+            db.cursor(),
+            "SELECT * FROM sales_order",
+            pipelined,
+            batch_size=2,
+            metrics=metrics,
+        )
+        db.close()
+
+        assert pipelined.getvalue() == sequential.getvalue()
+        assert set(metrics) == {"rows_full_wait", "rows_empty_wait"}
+
+    def test_rate_limit_slows_the_fetch(self, seed_database):
+        db = create_connection_to_local()
+
+        start = time.perf_counter()
+        row_count = fetch_query_to_file(
+            db.cursor(),
+            "SELECT * FROM sales_order",
+            BytesIO(),
+            batch_size=2,
+            limiter=RowRateLimiter(100),
+        )
+        elapsed = time.perf_counter() - start
+        db.close()
+
+        assert elapsed >= (row_count - 2) / 100 * 0.9
+
+    def test_param_sets_match_copy_output(self, seed_database):
+        db = create_connection_to_local()
+        copy_file, fetch_file = BytesIO(), BytesIO()
+        query = "SELECT * FROM staff WHERE staff_id = ANY(%s)"
+        params = [([1],), ([],), ([2, 3],)]
+
+        copy_rows = copy_query_to_file(db.cursor(), query, copy_file, params)
+        fetch_rows = fetch_query_to_file(
+            db.cursor(), query, fetch_file, params, batch_size=2
+        )
+        db.close()
+
+        assert copy_rows == fetch_rows == 3
+        assert copy_file.getvalue() == fetch_file.getvalue()
+
+
+class TestParquetQueryToFile:
+    def test_keeps_column_types(self, seed_database):
+        db = create_connection_to_local()
+        file = BytesIO()
+
+        row_count = parquet_query_to_file(
+            db.cursor(), "SELECT * FROM sales_order", file, batch_size=2
+        )
+        db.close()
+
+        table = pq.read_table(BytesIO(file.getvalue()))
+        assert row_count == table.num_rows == 5
+        assert table.schema.field("sales_order_id").type == pa.int32()
+        assert table.schema.field("created_at").type == pa.timestamp("us")
+        assert pa.types.is_decimal(table.schema.field("unit_price").type)
+        assert table.schema.field("agreed_delivery_date").type == pa.string()
+
+    def test_returns_zero_for_no_rows(self, seed_database):
+        db = create_connection_to_local()
+
+        row_count = parquet_query_to_file(
+            db.cursor(), "SELECT * FROM sales_order WHERE false", BytesIO()
+        )
+        db.close()
+
+        assert row_count == 0
+
+    def test_param_sets_write_one_file(self, seed_database):
+        db = create_connection_to_local()
+        file = BytesIO()
+
+        row_count = parquet_query_to_file(
+            db.cursor(),
+            "SELECT * FROM sales_order WHERE sales_order_id = ANY(%s)",
+            file,
+            [([],), ([2, 3],), ([4],)],
+            batch_size=2,
+        )
+        db.close()
+
+        table = pq.read_table(BytesIO(file.getvalue()))
+        assert row_count == table.num_rows == 3
+        assert table["sales_order_id"].to_pylist() == [2, 3, 4]
+
+
+class TestWatermarks:
+    def test_no_watermarks_before_first_export(self, s3_with_bucket):
+        assert get_watermarks(s3_with_bucket) == {}
+
+    def test_set_watermark_round_trips(self, s3_with_bucket):
+        watermark = datetime.datetime(2025, 6, 4, 12, 46, 22, 643000)
+
+        set_watermark(s3_with_bucket, "sales_order", watermark)
+
+        assert get_watermarks(s3_with_bucket) == {"sales_order": watermark}
+
+    def test_state_and_watermarks_do_not_overwrite_each_other(self, s3_with_bucket):
+        watermark = datetime.datetime(2025, 6, 4, 12, 46, 22)
+        get_state(s3_with_bucket)
+        set_watermark(s3_with_bucket, "staff", watermark)
+        change_state(s3_with_bucket, False)
+
+        assert get_state(s3_with_bucket) == False
+        assert get_watermarks(s3_with_bucket) == {"staff": watermark}
+
+
+class TestGetHighWatermark:
+    def test_returns_latest_last_updated(self, seed_database):
+        db = create_connection_to_local()
+        cursor = db.cursor()
+
+        watermark = get_high_watermark(cursor, "sales_order")
+        cursor.execute("SELECT max(last_updated) AS latest FROM sales_order")
+        expected = cursor.fetchone()["latest"]
+        db.close()
+
+        assert watermark == expected
+
+    def test_returns_none_when_nothing_is_newer(self, seed_database):
+        db = create_connection_to_local()
+        cursor = db.cursor()
+
+        latest = get_high_watermark(cursor, "sales_order")
+        watermark = get_high_watermark(cursor, "sales_order", latest)
+        db.close()
+
+        assert watermark is None
+
+
+class TestBuildExtractQuery:
+    def test_selects_rows_between_watermarks(self, seed_database):
+        db = create_connection_to_local()
+        cursor = db.cursor()
+        cursor.execute("SELECT min(last_updated) AS oldest FROM sales_order")
+        oldest = cursor.fetchone()["oldest"]
+        latest = get_high_watermark(cursor, "sales_order")
+
+        query, params = build_extract_query("sales_order", oldest, latest)
+        row_count = copy_query_to_file(cursor, query, BytesIO(), params)
+        cursor.execute(
+            "SELECT count(*) AS newer FROM sales_order WHERE last_updated > %s",
+            (oldest,),
+        )
+        newer = cursor.fetchone()["newer"]
+        db.close()
+
+        assert 0 < row_count == newer
+
+    def test_first_run_has_no_lower_bound(self):
+        query, params = build_extract_query(
+            "sales_order", None, datetime.datetime(2025, 6, 4)
+        )
+
+        assert query == "SELECT * FROM sales_order WHERE last_updated <= %s"
+        assert params == (datetime.datetime(2025, 6, 4),)
+
+    def test_selects_only_the_warehouse_columns(self):
+        query, _ = build_extract_query(
+            "department", None, datetime.datetime(2025, 6, 4)
+        )
+
+        assert query.startswith(
+            "SELECT department_id, department_name, location FROM department WHERE"
+        )
+
+    def test_full_rows_selects_every_column(self):
+        query, _ = build_extract_query(
+            "department", None, datetime.datetime(2025, 6, 4), full_rows=True
+        )
+
+        assert query.startswith("SELECT * FROM department WHERE")
+
+    def test_xmin_snapshot_replaces_the_last_updated_bounds(self):
+        query, params = build_extract_query(
+            "sales_order", None, None, xmin_snapshot="100:105:103"
+        )
+
+        assert "last_updated" not in query
+        assert "xmin" in query
+        assert params == ("105", ["103"])
+
+    def test_no_bounds_selects_the_whole_table(self):
+        query, params = build_extract_query("sales_order", None, None)
+
+        assert query == "SELECT * FROM sales_order"
+        assert params == ()
+
+
+class TestOrderTablesBySize:
+    def test_largest_tables_come_first(self, seed_database):
+        db = create_connection_to_local()
+        db.autocommit = True
+        cursor = db.cursor()
+        cursor.execute("ANALYZE currency, sales_order")
+
+        ordered = order_tables_by_size(cursor, ["currency", "sales_order"])
+        db.close()
+
+        assert ordered == ["sales_order", "currency"]
+
+    def test_unknown_tables_go_last(self, seed_database):
+        db = create_connection_to_local()
+
+        ordered = order_tables_by_size(db.cursor(), ["not_a_table", "sales_order"])
+        db.close()
+
+        assert ordered == ["sales_order", "not_a_table"]
+
+
+class TestProbeChanges:
+    def test_reports_changed_tables_in_one_query(self, seed_database):
+        db = create_connection_to_local()
+        cursor = db.cursor()
+        latest = get_high_watermark(cursor, "staff")
+
+        changes = probe_changes(
+            cursor, ["staff", "currency"], {"staff": latest, "currency": None}
+        )
+        currency_latest = get_high_watermark(cursor, "currency")
+        db.close()
+
+        assert changes["staff"] == {"watermark": None, "changed": 0}
+        assert changes["currency"] == {"watermark": currency_latest, "changed": 3}
+
+    def test_no_tables_need_no_query(self):
+        assert probe_changes(None, [], {}) == {}
+
+    def test_xmin_tables_are_checked_against_their_snapshot(self, seed_database):
+        db = create_connection_to_local()
+        db.autocommit = True
+        cursor = db.cursor()
+        snapshot = get_current_snapshot(cursor)
+        latest = get_high_watermark(cursor, "staff")
+        # a backfill that doesn't move last_updated
+        cursor.execute(
+            "UPDATE staff SET email_address = email_address WHERE staff_id = 2"
+        )
+
+        with patch("src.extract.XMIN_TABLES", {"staff"}):
+            changes = probe_changes(
+                cursor, ["staff"], {"staff": latest}, {"staff": snapshot}
+            )
+        db.close()
+
+        assert changes["staff"]["changed"] == 1
+
+
+class TestXminSnapshots:
+    def test_set_snapshots_round_trips(self, s3_with_bucket):
+        set_xmin_snapshots(s3_with_bucket, {"staff": "100:105:"})
+        set_xmin_snapshots(s3_with_bucket, {"design": "110:110:"})
+
+        assert get_xmin_snapshots(s3_with_bucket) == {
+            "staff": "100:105:",
+            "design": "110:110:",
+        }
+
+    def test_snapshots_too_old_to_compare_are_dropped(self, caplog):
+        current = f"{2**31}:{2**31}:"
+        with patch("src.extract.XMIN_TABLES", {"staff", "design"}):
+            usable = get_usable_snapshots(
+                {
+                    "staff": f"{2**31 - 10}:{2**31 - 5}:",
+                    "design": "100:105:",
+                    "currency": f"{2**31}:{2**31}:",
+                },
+                current,
+            )
+
+        assert usable == {"staff": f"{2**31 - 10}:{2**31 - 5}:"}
+        assert "The snapshot of design is too old" in caplog.text
+
+
+class TestGetChunkRanges:
+    def count_rows_in_chunks(self, cursor, ranges):
+        latest = get_high_watermark(cursor, "sales_order")
+        total = 0
+        for key_range in ranges:
+            query, params = build_extract_query("sales_order", None, latest, key_range)
+            total += copy_query_to_file(cursor, query, BytesIO(), params)
+        return total
+
+    def test_small_tables_are_not_split(self, seed_database):
+        db = create_connection_to_local()
+
+        ranges = get_chunk_ranges(db.cursor(), "sales_order", chunk_rows=1000)
+        db.close()
+
+        assert ranges == [[None, None]]
+
+    def test_min_max_split_covers_every_row(self, seed_database):
+        db = create_connection_to_local()
+        cursor = db.cursor()
+
+        ranges = get_chunk_ranges(cursor, "sales_order", chunk_rows=2)
+        total = self.count_rows_in_chunks(cursor, ranges)
+        db.close()
+
+        assert len(ranges) == 3
+        assert ranges[0][0] is None and ranges[-1][1] is None
+        assert total == 5
+
+    def test_histogram_split_covers_every_row(self, seed_database):
+        db = create_connection_to_local()
+        db.autocommit = True
+        cursor = db.cursor()
+        cursor.execute("ANALYZE sales_order")
+
+        ranges = get_chunk_ranges(cursor, "sales_order", chunk_rows=2)
+        total = self.count_rows_in_chunks(cursor, ranges)
+        db.close()
+
+        assert len(ranges) > 1
+        assert total == 5
+
+
+class TestPlanTable:
+    def test_table_without_last_updated_values_is_not_chunked(
+        self, s3_with_bucket, caplog
+    ):
+        with patch(
+            "src.extract.get_chunk_ranges", return_value=[[None, 10], [10, None]]
+        ), patch("src.extract.get_high_watermark", return_value=None):
+            tasks = plan_table(None, s3_with_bucket, "sales_order", {})
+
+        assert tasks == [None]
+        assert get_chunk_progress(s3_with_bucket) == {}
+        assert "sales_order has no 'last_updated' values" in caplog.text
+
+    def test_new_plan_is_saved_with_its_watermark(self, s3_with_bucket):
+        watermark = datetime.datetime(2025, 6, 4, 12, 0)
+        with patch(
+            "src.extract.get_chunk_ranges", return_value=[[None, 10], [10, None]]
+        ), patch("src.extract.get_high_watermark", return_value=watermark):
+            tasks = plan_table(None, s3_with_bucket, "sales_order", {})
+
+        assert [task["range"] for task in tasks] == [[None, 10], [10, None]]
+        assert {task["watermark"] for task in tasks} == {watermark}
+        assert get_chunk_progress(s3_with_bucket)["sales_order"]["done"] == []
+
+
+class TestChunkProgress:
+    def test_watermark_advances_after_last_chunk(self, s3_with_bucket):
+        watermark = datetime.datetime(2025, 6, 4, 12, 0)
+        save_chunk_plan(
+            s3_with_bucket, "sales_order", [[None, 10], [10, None]], watermark
+        )
+
+        first = complete_chunk(s3_with_bucket, "sales_order", 1)
+        progress = get_chunk_progress(s3_with_bucket)
+        watermarks = get_watermarks(s3_with_bucket)
+        second = complete_chunk(s3_with_bucket, "sales_order", 0)
+
+        assert first is False
+        assert progress["sales_order"]["done"] == [1]
+        assert watermarks == {}
+        assert second is True
+        assert get_chunk_progress(s3_with_bucket) == {}
+        assert get_watermarks(s3_with_bucket) == {"sales_order": watermark}
+
+    def test_snapshot_is_stored_after_last_chunk(self, s3_with_bucket):
+        watermark = datetime.datetime(2025, 6, 4, 12, 0)
+        save_chunk_plan(
+            s3_with_bucket, "sales_order", [[None, 10]], watermark, "100:105:"
+        )
+
+        complete_chunk(s3_with_bucket, "sales_order", 0)
+
+        assert get_xmin_snapshots(s3_with_bucket) == {"sales_order": "100:105:"}
@@ -5,15 +5,24 @@ from io import BytesIO
 from moto import mock_aws
 from unittest.mock import patch, MagicMock
 import logging
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
 from src.load import (
+    create_cached_engine,
     read_parquet_from_s3,
     write_dataframe_to_postgres,
     ReadParquetError,
+    WAREHOUSE_CREDENTIALS,
     WriteDataFrameError,
 )
 
 
+@pytest.fixture(autouse=True)
+def fresh_engine():
+    create_cached_engine.cache_clear()
+    yield
+    create_cached_engine.cache_clear()
+
+
 @mock_aws
 class TestReadParquetFromS3:
 
@@ -187,3 +196,40 @@ class TestWriteDataframeToPostgresUtil:
                 f"DataFrame for table '{table_name}' is empty. No data will be written."
                 in caplog.text
             )
+
+    def test_engine_is_created_once_and_reused(self):
+        df = pd.DataFrame({"address_id": [1]})
+        engine = MagicMock()
+
+        with patch(
+            "src.load.create_engine", return_value=engine
+        ) as mock_create_engine, patch.object(df, "to_sql"):
+            write_dataframe_to_postgres(df, "dim_location")
+            write_dataframe_to_postgres(df, "dim_location")
+
+        mock_create_engine.assert_called_once()
+        assert mock_create_engine.call_args.kwargs == {"pool_pre_ping": True}
+        assert engine.begin.call_count == 2
+
+    def test_rejected_login_fetches_the_secret_again(self):
+        df = pd.DataFrame({"address_id": [1]})
+        rejected, engine = MagicMock(), MagicMock()
+        rejected.begin.side_effect = OperationalError(
+            "connect", {}, Exception("password authentication failed for user")
+        )
+
+        with patch(
+            "src.load.create_engine", side_effect=[rejected, engine]
+        ), patch.object(WAREHOUSE_CREDENTIALS, "get") as get, patch.object(
+            df, "to_sql"
+        ) as mock_to_sql:
+            get.side_effect = lambda refresh=False: {
+                "PG_CONNECTION": "postgresql://new" if refresh else "postgresql://old"
+            }
+            write_dataframe_to_postgres(df, "dim_location")
+
+        assert [call.kwargs for call in get.call_args_list] == [
+            {"refresh": False},
+            {"refresh": True},
+        ]
+        mock_to_sql.assert_called_once()
@@ -1,10 +1,16 @@
 import logging
 from unittest.mock import patch
 import pytest
+import json
+from io import BytesIO
+import pandas as pd
+import pyarrow.parquet as pq
 from src.transform import (
     transform_handler,
     get_csv_file_keys,
     get_logs,
+    get_manifest_file_keys,
+    EXTRACT_BUCKET,
     TRANSFORM_BUCKET,
 )
 
@@ -70,6 +76,30 @@ class TestGetCSVFileKeys:
         assert "unexpected error occured" in caplog.text
 
 
+class TestGetManifestFileKeys:
+    def test_returns_keys_of_transformable_tables_in_order(self, s3_with_bucket):
+        files = [
+            {"key": "2025/06/05/address_1.csv", "table": "address"},
+            {"key": "2025/06/05/payment_1.csv", "table": "payment"},
+            {"key": "2025/06/05/staff_1.csv", "table": "staff"},
+        ]
+        s3_with_bucket.put_object(
+            Bucket=EXTRACT_BUCKET,
+            Key="manifests/run.json",
+            Body=json.dumps({"files": files}),
+        )
+
+        response = get_manifest_file_keys(s3_with_bucket, "manifests/run.json")
+
+        assert response == ["2025/06/05/address_1.csv", "2025/06/05/staff_1.csv"]
+
+    def test_handles_a_missing_manifest(self, s3_with_bucket, caplog):
+        response = get_manifest_file_keys(s3_with_bucket, "manifests/missing.json")
+
+        assert response == []
+        assert "an error occured reading the extract manifest" in caplog.text
+
+
 # @pytest.mark.skip
 class TestTransformHandler:
     @pytest.mark.skip
@@ -129,6 +159,104 @@ class TestTransformHandler:
             for file in response["Contents"]:
                 assert file["Key"][-8:] == ".parquet"
 
+    def test_reads_files_from_the_manifest_without_logs(
+        self, s3_with_bucket, s3_with_transform_bucket, mock_get_logs
+    ):
+        key = "2025/06/05/design_2025-06-05 10:00:00.csv"
+        s3_with_bucket.put_object(
+            Bucket=EXTRACT_BUCKET,
+            Key=key,
+            Body="design_id,created_at,design_name,file_location,file_name,last_updated\n"
+            "1,2022-11-03,Wooden,/usr,wooden.json,2022-11-03\n",
+        )
+        s3_with_bucket.put_object(
+            Bucket=EXTRACT_BUCKET,
+            Key="manifests/run.json",
+            Body=json.dumps({"files": [{"key": key, "table": "design"}]}),
+        )
+
+        with patch("src.transform.s3_client", s3_with_bucket):
+            response = transform_handler({"manifest_key": "manifests/run.json"}, None)
+
+        mock_get_logs.assert_not_called()
+        assert "dim_design" in response["table_names"]
+
+    def test_counterparty_joins_the_address_snapshot_of_an_earlier_run(
+        self, s3_with_bucket, s3_with_transform_bucket, mock_get_logs
+    ):
+        files = {
+            "address": "address_id,address_line_1,address_line_2,district,city,"
+            "postal_code,country,phone\n1,6826 Herzog Via,,Avon,New Patienceburgh,"
+            "28441,Turkey,1803 637401\n",
+            "counterparty": "counterparty_id,counterparty_legal_name,legal_address_id\n"
+            "1,Fahey and Sons,1\n",
+        }
+        runs = [["address", "counterparty"], ["counterparty"]]
+        for run, tables in enumerate(runs):
+            manifest = []
+            for table in tables:
+                key = f"2025/06/0{run + 5}/{table}_2025-06-0{run + 5} 10:00:00.csv"
+                s3_with_bucket.put_object(
+                    Bucket=EXTRACT_BUCKET, Key=key, Body=files[table]
+                )
+                manifest.append({"key": key, "table": table})
+            s3_with_bucket.put_object(
+                Bucket=EXTRACT_BUCKET,
+                Key=f"manifests/run{run}.json",
+                Body=json.dumps({"files": manifest}),
+            )
+
+            with patch("src.transform.s3_client", s3_with_bucket):
+                response = transform_handler(
+                    {"manifest_key": f"manifests/run{run}.json"}, None
+                )
+
+            assert "dim_counterparty" in response["table_names"]
+
+    def test_sales_transformed_in_chunks_match_the_whole_file(
+        self, s3_with_bucket, s3_with_transform_bucket, mock_get_logs
+    ):
+        key = "2025/06/05/sales_order_2025-06-05 10:00:00.csv"
+        s3_with_bucket.put_object(
+            Bucket=EXTRACT_BUCKET,
+            Key=key,
+            Body="sales_order_id,created_at,last_updated,design_id,staff_id,"
+            "counterparty_id,units_sold,unit_price,currency_id,agreed_delivery_date,"
+            "agreed_payment_date,agreed_delivery_location_id\n"
+            + "".join(
+                f"{n},2022-11-03 14:20:52.186,2022-11-03 14:20:52.186,{n % 9},1,2,"
+                f"{n * 10},3.94,2,2022-11-07,2022-11-08,8\n"
+                for n in range(1, 1001)
+            ),
+        )
+        s3_with_bucket.put_object(
+            Bucket=EXTRACT_BUCKET,
+            Key="manifests/run.json",
+            Body=json.dumps({"files": [{"key": key, "table": "sales_order"}]}),
+        )
+
+        tables = []
+        for chunk_bytes in (0, 10_000):
+            with patch("src.transform.s3_client", s3_with_bucket), patch(
+                "src.transform.TRANSFORM_CHUNK_BYTES", chunk_bytes
+            ):
+                response = transform_handler(
+                    {"manifest_key": "manifests/run.json"}, None
+                )
+            sales_key = response["s3_keys"][
+                response["table_names"].index("fact_sales_order")
+            ]
+            body = s3_with_bucket.get_object(Bucket=TRANSFORM_BUCKET, Key=sales_key)[
+                "Body"
+            ].read()
+            tables.append(pq.ParquetFile(BytesIO(body)))
+
+        whole, chunked = tables
+        assert chunked.metadata.num_row_groups > 1
+        pd.testing.assert_frame_equal(
+            chunked.read().to_pandas(), whole.read().to_pandas()
+        )
+
     # @pytest.mark.xfail
     def test_subsequent_runs_no_changes(self, caplog, mock_get_logs):
         # "function logs that there were no changes for an empty keys list"
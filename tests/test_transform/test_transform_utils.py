@@ -1,11 +1,23 @@
 from moto import mock_aws
-from src.utils.utils import read_csv_to_df, df_to_parquet
+from src.utils.utils import (
+    read_csv_to_df,
+    read_csv_in_chunks,
+    read_csv_with_arrow,
+    df_to_parquet,
+    write_parquet_chunks,
+)
+from src.utils.compression import compressed_writer, COMPRESSION_SUFFIXES
+from src.utils.columns import EXTRACT_COLUMNS
+from src.utils.utils import facts_and_dim
+import datetime
 import pytest
 import boto3
+import pyarrow as pa
+import pyarrow.parquet as pq
 import pandas as pd
 from io import BytesIO
 import logging
-
+from unittest.mock import patch
 
 @mock_aws
 class TestReadCsvToDf:
@@ -93,6 +105,135 @@ class TestReadCsvToDf:
 
         assert str(err.value) == "Argument list must not be empty."
 
+    def test_parquet_keys_are_read_with_their_types(self, aws_credentials):
+        s3_client = boto3.client("s3", region_name="eu-west-2")
+        s3_client.create_bucket(
+            Bucket=self.TEST_BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        df = pd.DataFrame(
+            {
+                "sales_order_id": [1, 2],
+                "created_at": pd.to_datetime(
+                    ["2022-11-03 14:20:52.186000", "2022-11-04 10:15:00.000000"]
+                ),
+            }
+        )
+        s3_client.put_object(
+            Bucket=self.TEST_BUCKET,
+            Key="sales_order.parquet",
+            Body=df.to_parquet(index=False),
+        )
+
+        result = next(
+            read_csv_to_df(["sales_order.parquet"], s3_client, self.TEST_BUCKET)
+        )
+
+        pd.testing.assert_frame_equal(
+            result["sales_order.parquet"], df.set_index("sales_order_id")
+        )
+
+    @pytest.mark.parametrize("parser", ["pandas", "pyarrow"])
+    @pytest.mark.parametrize("compression", ["gzip", "zstd"])
+    def test_compressed_keys_are_streamed_and_decompressed(
+        self, aws_credentials, compression, parser
+    ):
+        if compression == "zstd":
+            pytest.importorskip("zstandard")
+        s3_client = boto3.client("s3", region_name="eu-west-2")
+        s3_client.create_bucket(
+            Bucket=self.TEST_BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        key = f"address.csv{COMPRESSION_SUFFIXES[compression]}"
+        body = BytesIO()
+        with compressed_writer(body, compression) as out:
+            out.write(self.CSV_1.encode())
+        s3_client.put_object(Bucket=self.TEST_BUCKET, Key=key, Body=body.getvalue())
+        get_object = s3_client.get_object
+        reads = []
+
+        def recording_get_object(**kwargs):
+            response = get_object(**kwargs)
+            read = response["Body"].read
+
+            def recording_read(*args, **kwargs):
+                reads.append(args[0] if args else kwargs.get("amt"))
+                return read(*args, **kwargs)
+
+            response["Body"].read = recording_read
+            return response
+
+        with patch.object(s3_client, "get_object", recording_get_object), patch(
+            "src.utils.utils.TRANSFORM_CSV_PARSER", parser
+        ):
+            result = next(read_csv_to_df([key], s3_client, self.TEST_BUCKET))
+
+        pd.testing.assert_frame_equal(
+            result[key],
+            pd.read_csv(BytesIO(self.CSV_1.encode()), index_col=0),
+        )
+        # the body is only ever read a block at a time, never whole
+        assert reads and None not in reads
+
+    def test_change_files_keep_the_latest_state_of_each_row(self, aws_credentials):
+        s3_client = boto3.client("s3", region_name="eu-west-2")
+        s3_client.create_bucket(
+            Bucket=self.TEST_BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        key = "currency_changes.csv"
+        body = (
+            "currency_id,currency_code,op\n"
+            "1,GBP,U\n2,USD,I\n1,EUR,U\n3,CHF,I\n3,,D\n"
+        )
+        s3_client.put_object(Bucket=self.TEST_BUCKET, Key=key, Body=body)
+
+        df = next(read_csv_to_df([key], s3_client, self.TEST_BUCKET))[key]
+
+        assert list(df.columns) == ["currency_code"]
+        assert df["currency_code"].to_dict() == {2: "USD", 1: "EUR"}
+
+    def test_prefetched_keys_are_yielded_in_order(self, aws_credentials):
+        s3_client = boto3.client("s3", region_name="eu-west-2")
+        s3_client.create_bucket(
+            Bucket=self.TEST_BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        keys = [f"address_{number}.csv" for number in range(10)]
+        for number, key in enumerate(keys):
+            s3_client.put_object(
+                Bucket=self.TEST_BUCKET, Key=key, Body=f"address_id,n\n{number},x\n"
+            )
+
+        with patch("src.utils.utils.TRANSFORM_PREFETCH_BYTES", 1):
+            results = list(read_csv_to_df(keys, s3_client, self.TEST_BUCKET))
+
+        assert [list(result) for result in results] == [[key] for key in keys]
+        assert [list(result.values())[0].index[0] for result in results] == list(
+            range(10)
+        )
+
+    def test_missing_key_is_logged_and_the_rest_are_read(self, aws_credentials, caplog):
+        s3_client = boto3.client("s3", region_name="eu-west-2")
+        s3_client.create_bucket(
+            Bucket=self.TEST_BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        s3_client.put_object(
+            Bucket=self.TEST_BUCKET, Key="test_object_1.csv", Body=self.CSV_1
+        )
+
+        with caplog.at_level(logging.ERROR):
+            results = list(
+                read_csv_to_df(
+                    ["missing.csv", "test_object_1.csv"], s3_client, self.TEST_BUCKET
+                )
+            )
+
+        assert [list(result) for result in results] == [["test_object_1.csv"]]
+        assert "missing.csv" in caplog.text
+
     @pytest.mark.skip("TODO LATER")
     def test_function_raises_name_error(self, aws_credentials, caplog):
         s3_client = boto3.client("s3", region_name="eu-west-2")
@@ -113,6 +254,196 @@ class TestReadCsvToDf:
         # assert next(result) == "The key 'xxx.csv' does not exist in bucket 'test_ingestion_bucket'."
 
 
+class TestReadCsvWithArrow:
+    def test_matches_the_pandas_parser(self):
+        body = TestReadCsvToDf.CSV_1.encode()
+
+        pd.testing.assert_frame_equal(
+            read_csv_with_arrow(body, "address.csv"),
+            pd.read_csv(BytesIO(body), index_col=0),
+        )
+
+    def test_declared_columns_are_not_inferred(self):
+        body = (
+            b"address_id,postal_code,created_at,last_updated\n"
+            b"1,28441,2022-11-03 14:20:52.186,2022-11-03 14:20:52\n"
+        )
+
+        df = read_csv_with_arrow(body, "2025/06/11/address_2025-06-11.csv")
+
+        assert df["postal_code"].tolist() == ["28441"]
+        assert df["created_at"].dtype == "datetime64[us]"
+        assert df["last_updated"].iloc[0] == pd.Timestamp("2022-11-03 14:20:52")
+
+    def test_unquoted_empty_values_are_null_and_quoted_ones_empty(self):
+        body = b'address_id,address_line_2,district\n1,,""\n'
+
+        df = read_csv_with_arrow(body, "address_2025.csv")
+
+        assert df["address_line_2"].isna().all()
+        assert df["district"].tolist() == [""]
+
+    @pytest.mark.parametrize("compression", ["gzip", "zstd"])
+    def test_compressed_keys_are_decompressed(self, compression):
+        if compression == "zstd":
+            pytest.importorskip("zstandard")
+        body = BytesIO()
+        with compressed_writer(body, compression) as out:
+            out.write(TestReadCsvToDf.CSV_1.encode())
+        key = f"address.csv{COMPRESSION_SUFFIXES[compression]}"
+
+        df = read_csv_with_arrow(body.getvalue(), key)
+
+        assert df["address_line_1"].tolist() == ["6826 Herzog Via"]
+
+    @mock_aws
+    def test_is_used_by_read_csv_to_df_when_selected(self, aws_credentials):
+        s3_client = boto3.client("s3", region_name="eu-west-2")
+        s3_client.create_bucket(
+            Bucket=TestReadCsvToDf.TEST_BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        key = "sales_order_2025.csv"
+        s3_client.put_object(
+            Bucket=TestReadCsvToDf.TEST_BUCKET,
+            Key=key,
+            Body="sales_order_id,created_at\n1,2022-11-03 14:20:52.186\n",
+        )
+
+        with patch("src.utils.utils.TRANSFORM_CSV_PARSER", "pyarrow"):
+            result = next(read_csv_to_df([key], s3_client, TestReadCsvToDf.TEST_BUCKET))
+
+        assert result[key]["created_at"].dtype == "datetime64[us]"
+
+
+SALES_CSV = "sales_order_id,created_at,last_updated,units_sold,unit_price\n" + "".join(
+    f"{n},2022-11-03 14:20:{n % 60:02d}.5,2022-11-04 09:00:00,{n * 10},{n}.25\n"
+    for n in range(1, 2001)
+)
+
+
+@mock_aws
+class TestReadCsvInChunks:
+    KEY = "2025/06/05/sales_order_2025-06-05 10:00:00.csv"
+
+    def put(self, key, body):
+        s3_client = boto3.client("s3", region_name="eu-west-2")
+        s3_client.create_bucket(
+            Bucket=TestReadCsvToDf.TEST_BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        s3_client.put_object(Bucket=TestReadCsvToDf.TEST_BUCKET, Key=key, Body=body)
+        return s3_client
+
+    def test_chunks_add_up_to_the_whole_file(self, aws_credentials):
+        s3_client = self.put(self.KEY, SALES_CSV)
+
+        chunks = list(
+            read_csv_in_chunks(self.KEY, s3_client, 10_000, TestReadCsvToDf.TEST_BUCKET)
+        )
+
+        assert len(chunks) > 1
+        pd.testing.assert_frame_equal(
+            pd.concat(chunks), read_csv_with_arrow(SALES_CSV.encode(), self.KEY)
+        )
+
+    def test_compressed_files_are_streamed(self, aws_credentials):
+        key = f"{self.KEY}.gz"
+        body = BytesIO()
+        with compressed_writer(body, "gzip") as out:
+            out.write(SALES_CSV.encode())
+        s3_client = self.put(key, body.getvalue())
+
+        chunks = list(
+            read_csv_in_chunks(key, s3_client, 10_000, TestReadCsvToDf.TEST_BUCKET)
+        )
+
+        assert sum(len(chunk) for chunk in chunks) == 2000
+
+    def test_a_file_without_rows_yields_an_empty_frame(self, aws_credentials):
+        s3_client = self.put(self.KEY, SALES_CSV.splitlines()[0] + "\n")
+
+        (chunk,) = read_csv_in_chunks(
+            self.KEY, s3_client, 10_000, TestReadCsvToDf.TEST_BUCKET
+        )
+
+        assert chunk.empty
+        assert chunk["created_at"].dtype == "datetime64[us]"
+
+
+class TestWriteParquetChunks:
+    def test_each_chunk_is_a_row_group(self):
+        df = read_csv_with_arrow(SALES_CSV.encode(), "sales_order.csv")
+        chunks = [df.iloc[:500], df.iloc[500:1500], df.iloc[1500:]]
+        file = BytesIO()
+
+        rows = write_parquet_chunks((chunk.copy() for chunk in chunks), file)
+
+        parquet = pq.ParquetFile(BytesIO(file.getvalue()))
+        assert rows == 2000
+        assert parquet.metadata.num_row_groups == 3
+        pd.testing.assert_frame_equal(
+            parquet.read().to_pandas(), pd.read_parquet(BytesIO(df_to_parquet(df)))
+        )
+
+    def test_later_chunks_take_the_first_chunks_types(self):
+        first = pd.DataFrame({"id": [1], "name": ["a"]}).set_index("id")
+        later = pd.DataFrame({"id": [2], "name": [None]}).set_index("id")
+        file = BytesIO()
+
+        write_parquet_chunks([first, later], file)
+
+        table = pq.read_table(BytesIO(file.getvalue()))
+        assert table.schema.field("name").type == pa.large_string()
+        assert table["name"].to_pylist() == ["a", None]
+
+
+class TestCreateSalesFact:
+    def test_splits_timestamps_of_mixed_precision(self):
+        df = pd.DataFrame(
+            {
+                "sales_order_id": [1, 2],
+                "created_at": ["2022-11-03 14:20:52.186", "2022-11-03 14:20:52"],
+                "units_sold": [10, 20],
+                "last_updated": ["2022-11-04 09:00:00", "2022-11-04 09:00:00.5"],
+            }
+        ).set_index("sales_order_id")
+
+        result = facts_and_dim["sales_fact"](df)
+
+        assert result is df
+        assert list(result.columns) == [
+            "units_sold",
+            "created_date",
+            "created_time",
+            "last_updated_date",
+            "last_updated_time",
+        ]
+        assert result["created_date"].tolist() == [datetime.date(2022, 11, 3)] * 2
+        assert result["created_time"].tolist() == [
+            datetime.time(14, 20, 52, 186000),
+            datetime.time(14, 20, 52),
+        ]
+        assert result["last_updated_time"].iloc[1] == datetime.time(9, 0, 0, 500000)
+
+    def test_typed_columns_become_arrow_dates_and_times(self):
+        df = pd.DataFrame(
+            {
+                "created_at": pd.to_datetime(["2022-11-03 14:20:52.186", None]),
+                "last_updated": pd.to_datetime(["2022-11-03", "2022-11-04"]),
+            }
+        )
+
+        result = facts_and_dim["sales_fact"](df)
+
+        assert str(result["created_date"].dtype) == "date32[day][pyarrow]"
+        assert str(result["created_time"].dtype) == "time64[us][pyarrow]"
+        assert result["created_date"].isna().tolist() == [False, True]
+        table = pq.read_table(BytesIO(df_to_parquet(result)))
+        assert table.schema.field("created_date").type == pa.date32()
+        assert table.schema.field("last_updated_time").type == pa.time64("us")
+
+
 class TestDfToParquet:
     def test_df_to_parquet(self):
         df_1 = pd.DataFrame(
@@ -139,3 +470,81 @@ class TestDfToParquet:
         pd.testing.assert_frame_equal(
             prev_df, df_read
         )
+
+
+class TestProjectedExtracts:
+    ADDRESS = {
+        "address_id": [1],
+        "address_line_1": ["6826 Herzog Via"],
+        "address_line_2": [None],
+        "district": ["Avon"],
+        "city": ["New Patienceburgh"],
+        "postal_code": ["28441"],
+        "country": ["Turkey"],
+        "phone": ["1803 637401"],
+        "created_at": ["2022-11-03 14:20:49.962"],
+        "last_updated": ["2022-11-03 14:20:49.962"],
+    }
+    COUNTERPARTY = {
+        "counterparty_id": [1],
+        "counterparty_legal_name": ["Fahey and Sons"],
+        "legal_address_id": [1],
+        "commercial_contact": ["Micheal Toy"],
+        "delivery_contact": ["Mrs. Lucy Runolfsdottir"],
+        "created_at": ["2022-11-03 14:20:51.563"],
+        "last_updated": ["2022-11-03 14:20:51.563"],
+    }
+    STAFF = {
+        "staff_id": [1],
+        "first_name": ["Jeremie"],
+        "last_name": ["Franey"],
+        "department_id": [2],
+        "email_address": ["jeremie.franey@terrifictotes.com"],
+        "created_at": ["2022-11-03 14:20:51.563"],
+        "last_updated": ["2022-11-03 14:20:51.563"],
+    }
+    DEPARTMENT = {
+        "department_id": [2],
+        "department_name": ["Purchasing"],
+        "location": ["Manchester"],
+        "manager": ["Naomi Lapaglia"],
+        "created_at": ["2022-11-03 14:20:49.962"],
+        "last_updated": ["2022-11-03 14:20:49.962"],
+    }
+
+    def frames(self, table, data):
+        full = pd.DataFrame(data).set_index(f"{table}_id")
+        projected = pd.DataFrame(data)[EXTRACT_COLUMNS[table]].set_index(f"{table}_id")
+        return full, projected
+
+    def test_counterparty_dim_is_the_same_from_projected_extracts(self):
+        # transform_handler builds the location dim from the address frame first
+        full_address, projected_address = [
+            facts_and_dim["address_dim"](df)
+            for df in self.frames("address", self.ADDRESS)
+        ]
+        full, projected = self.frames("counterparty", self.COUNTERPARTY)
+
+        pd.testing.assert_frame_equal(
+            facts_and_dim["counterparty_dim"](projected, projected_address),
+            facts_and_dim["counterparty_dim"](full, full_address),
+        )
+
+    def test_staff_dim_is_the_same_from_projected_extracts(self):
+        full_department, projected_department = self.frames(
+            "department", self.DEPARTMENT
+        )
+        full, projected = self.frames("staff", self.STAFF)
+
+        pd.testing.assert_frame_equal(
+            facts_and_dim["staff_dim"](projected, projected_department),
+            facts_and_dim["staff_dim"](full, full_department),
+        )
+
+    def test_location_dim_is_the_same_from_projected_extracts(self):
+        full, projected = self.frames("address", self.ADDRESS)
+
+        pd.testing.assert_frame_equal(
+            facts_and_dim["address_dim"](projected),
+            facts_and_dim["address_dim"](full),
+        )
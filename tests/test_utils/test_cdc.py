@@ -0,0 +1,81 @@
+import struct
+import pytest
+from src.utils.cdc import PgOutputDecoder, int_to_lsn, lsn_to_int
+
+
+def relation_message(relation_id, table, columns):
+    body = struct.pack("!i", relation_id) + b"public\0" + table.encode() + b"\0"
+    body += b"d" + struct.pack("!h", len(columns))
+    for column in columns:
+        body += b"\0" + column.encode() + b"\0" + struct.pack("!ii", 25, -1)
+    return b"R" + body
+
+
+def tuple_data(values):
+    body = struct.pack("!h", len(values))
+    for value in values:
+        if value is None:
+            body += b"n"
+        else:
+            body += b"t" + struct.pack("!i", len(value)) + value.encode()
+    return body
+
+
+def commit_message(end_lsn):
+    return b"C" + b"\0" + struct.pack("!QQq", end_lsn - 8, end_lsn, 0)
+
+
+class TestLsn:
+    @pytest.mark.parametrize("lsn", ["0/0", "0/83E71C0", "16/B374D848"])
+    def test_round_trips(self, lsn):
+        assert int_to_lsn(lsn_to_int(lsn)) == lsn
+
+    def test_orders_by_position(self):
+        assert lsn_to_int("1/0") > lsn_to_int("0/FFFFFFFF")
+
+
+class TestPgOutputDecoder:
+    def setup_method(self):
+        self.decoder = PgOutputDecoder()
+        self.decoder.decode(
+            relation_message(16400, "currency", ["currency_id", "code"])
+        )
+
+    def test_decodes_inserts(self):
+        change = self.decoder.decode(
+            b"I" + struct.pack("!i", 16400) + b"N" + tuple_data(["1", "GBP"])
+        )
+        assert change == {
+            "table": "currency",
+            "op": "I",
+            "row": {"currency_id": "1", "code": "GBP"},
+        }
+
+    def test_decodes_the_new_row_of_updates_that_change_the_key(self):
+        change = self.decoder.decode(
+            b"U"
+            + struct.pack("!i", 16400)
+            + b"K"
+            + tuple_data(["1", None])
+            + b"N"
+            + tuple_data(["2", "EUR"])
+        )
+        assert change["op"] == "U"
+        assert change["row"] == {"currency_id": "2", "code": "EUR"}
+
+    def test_deletes_only_hold_the_key(self):
+        change = self.decoder.decode(
+            b"D" + struct.pack("!i", 16400) + b"K" + tuple_data(["1", None])
+        )
+        assert change["op"] == "D"
+        assert change["row"] == {"currency_id": "1", "code": None}
+
+    def test_commit_returns_its_end_lsn(self):
+        change = self.decoder.decode(commit_message(lsn_to_int("0/83E71C0")))
+
+        assert change == {"commit": lsn_to_int("0/83E71C0")}
+        assert self.decoder.commit_lsn == lsn_to_int("0/83E71C0")
+
+    def test_other_messages_are_ignored(self):
+        begin = b"B" + struct.pack("!Qqi", 1, 0, 700)
+        assert self.decoder.decode(begin) is None
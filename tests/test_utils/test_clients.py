@@ -0,0 +1,44 @@
+import subprocess
+import sys
+import pytest
+from botocore.config import Config
+from moto import mock_aws
+from src.utils.clients import get_client
+
+
+@mock_aws
+class TestGetClient:
+    def test_returns_the_same_client_for_a_service(self, aws_credentials):
+        assert get_client("s3") is get_client("s3")
+
+    def test_services_and_configs_get_their_own_clients(self, aws_credentials):
+        config = Config(region_name="eu-west-1")
+
+        assert get_client("s3") is not get_client("logs")
+        assert get_client("s3", config) is not get_client("s3")
+        assert get_client("s3", config).meta.region_name == "eu-west-1"
+
+
+class TestLazyImports:
+    @pytest.mark.parametrize("module", ["src.extract", "src.load"])
+    def test_handler_import_leaves_out_heavy_libraries(self, module):
+        # a fresh interpreter, as this one has already imported everything
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                f"import sys, {module}; "
+                "print(sorted({'numpy', 'pandas', 'pyarrow', 'sqlalchemy'} & set(sys.modules)))",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        assert output.stdout.strip() == "[]"
+
+    def test_transform_creates_no_clients_on_import(self):
+        from src import transform
+
+        assert transform.s3_client is None
+        assert transform.log_client is None
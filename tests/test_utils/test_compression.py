@@ -0,0 +1,52 @@
+import gzip
+import pytest
+from io import BytesIO
+from src.utils.compression import compressed_writer, compression_for_key
+
+
+class TestCompressedWriter:
+    def test_gzip_round_trips(self):
+        file = BytesIO()
+        with compressed_writer(file, "gzip") as out:
+            out.write(b"staff_id,first_name\n")
+            out.write(b"1,Jeremie\n")
+
+        assert gzip.decompress(file.getvalue()) == b"staff_id,first_name\n1,Jeremie\n"
+
+    def test_zstd_round_trips(self):
+        zstandard = pytest.importorskip("zstandard")
+        file = BytesIO()
+        with compressed_writer(file, "zstd") as out:
+            out.write(b"1,Jeremie\n" * 1000)
+
+        reader = zstandard.ZstdDecompressor().stream_reader(BytesIO(file.getvalue()))
+        assert reader.read() == b"1,Jeremie\n" * 1000
+        assert len(file.getvalue()) < 10000
+
+    @pytest.mark.parametrize("compression", ["none", "gzip", "zstd"])
+    def test_leaves_the_file_open(self, compression):
+        if compression == "zstd":
+            pytest.importorskip("zstandard")
+        file = BytesIO()
+        with compressed_writer(file, compression) as out:
+            out.write(b"x")
+
+        assert not file.closed
+
+    def test_rejects_unknown_compression(self):
+        with pytest.raises(ValueError):
+            with compressed_writer(BytesIO(), "bzip2"):
+                pass
+
+
+class TestCompressionForKey:
+    @pytest.mark.parametrize(
+        "key, expected",
+        [
+            ("2025/06/11/staff_2025-06-11 10:00:00.csv", None),
+            ("2025/06/11/staff_2025-06-11 10:00:00.csv.gz", "gzip"),
+            ("2025/06/11/staff_2025-06-11 10:00:00_part0001.csv.zst", "zstd"),
+        ],
+    )
+    def test_reads_the_key_suffix(self, key, expected):
+        assert compression_for_key(key) == expected
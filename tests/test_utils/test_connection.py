@@ -0,0 +1,323 @@
+import os
+import threading
+import time
+import psycopg2
+import pytest
+from unittest.mock import Mock, patch
+from src.utils.connection import (
+    ConnectionPool,
+    choose_replica,
+    connect_with_retry,
+    create_connection,
+    create_connection_to_local,
+    export_snapshot,
+    get_pool,
+    pg8000_connect_to_local,
+    replica_status,
+    session_options,
+    use_snapshot,
+)
+
+
+class TestConnectionPool:
+    def test_reuses_returned_connections(self):
+        factory = Mock(side_effect=lambda: Mock(closed=0))
+        pool = ConnectionPool(factory, max_size=2)
+
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+
+        assert first is second
+        assert factory.call_count == 1
+
+    def test_never_opens_more_than_max_size(self):
+        factory = Mock(side_effect=lambda: Mock(closed=0))
+        pool = ConnectionPool(factory, max_size=2)
+        in_use = []
+        peak = []
+        lock = threading.Lock()
+
+        def borrow():
+            with pool.connection() as db:
+                with lock:
+                    in_use.append(db)
+                    peak.append(len(in_use))
+                time.sleep(0.01)
+                with lock:
+                    in_use.remove(db)
+
+        threads = [threading.Thread(target=borrow) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert max(peak) <= 2
+        assert factory.call_count <= 2
+
+    def test_rolls_back_when_block_raises(self):
+        db = Mock(closed=0)
+        pool = ConnectionPool(lambda: db, max_size=1)
+
+        with pytest.raises(ValueError):
+            with pool.connection():
+                raise ValueError("bad query")
+
+        db.rollback.assert_called_once()
+
+    def test_close_all_closes_every_connection(self):
+        connections = [Mock(closed=0), Mock(closed=0)]
+        pool = ConnectionPool(Mock(side_effect=connections), max_size=2)
+
+        with pool.connection():
+            with pool.connection():
+                pass
+        pool.close_all()
+
+        for db in connections:
+            db.close.assert_called_once()
+
+    def test_drops_connections_that_cannot_roll_back(self):
+        broken = Mock(closed=0)
+        broken.rollback.side_effect = Exception("server closed the connection")
+        factory = Mock(side_effect=[broken, Mock(closed=0)])
+        pool = ConnectionPool(factory, max_size=1)
+
+        with pytest.raises(ValueError):
+            with pool.connection():
+                raise ValueError("bad query")
+        with pool.connection() as db:
+            pass
+
+        assert db is not broken
+        broken.close.assert_called_once()
+
+    def test_drops_closed_connections(self):
+        closed = Mock(closed=1)
+        factory = Mock(side_effect=[closed, Mock(closed=0)])
+        pool = ConnectionPool(factory, max_size=1)
+
+        with pool.connection():
+            pass
+        with pool.connection() as db:
+            pass
+
+        assert db is not closed
+        assert factory.call_count == 2
+
+    def test_counts_hits_and_misses(self):
+        pool = ConnectionPool(Mock(side_effect=lambda: Mock(closed=0)), max_size=2)
+
+        with pool.connection():
+            with pool.connection():
+                pass
+        with pool.connection():
+            pass
+
+        assert pool.stats == {"hits": 1, "misses": 2, "discarded": 0, "retries": 0}
+
+    def test_pings_idle_connections_and_replaces_dead_ones(self):
+        dead = Mock(closed=0)
+        dead.cursor.return_value.execute.side_effect = Exception("server closed")
+        alive = Mock(closed=0)
+        pool = ConnectionPool(Mock(side_effect=[dead, alive]), ping_after=0)
+
+        with pool.connection():
+            pass
+        with pool.connection() as db:
+            pass
+
+        assert db is alive
+        dead.close.assert_called_once()
+        assert pool.stats["discarded"] == 1
+
+    def test_recently_used_connections_are_not_pinged(self):
+        db = Mock(closed=0)
+        pool = ConnectionPool(lambda: db, ping_after=60)
+
+        with pool.connection():
+            pass
+        with pool.connection():
+            pass
+
+        db.cursor.assert_not_called()
+
+    def test_pools_pg8000_connections_too(self, seed_database):
+        pool = ConnectionPool(pg8000_connect_to_local, ping_after=0)
+
+        with pytest.raises(ValueError):
+            with pool.connection() as first:
+                first.run("BEGIN")
+                raise ValueError("bad query")
+        with pool.connection() as second:
+            [[total]] = second.run("SELECT count(*) FROM currency")
+        pool.close_all()
+
+        assert second is first
+        assert total == 3
+        assert pool.stats["hits"] == 1
+
+
+class TestConnectWithRetry:
+    def test_retries_transient_errors(self):
+        factory = Mock(
+            side_effect=[psycopg2.OperationalError("the database is starting up"), "db"]
+        )
+        retried = []
+
+        with patch("src.utils.connection.time.sleep") as sleep:
+            db = connect_with_retry(factory, attempts=3, on_retry=retried.append)
+
+        assert db == "db"
+        assert len(retried) == 1
+        sleep.assert_called_once()
+
+    def test_backoff_is_jittered_and_grows(self):
+        factory = Mock(side_effect=psycopg2.OperationalError("refused"))
+
+        with patch("src.utils.connection.time.sleep") as sleep, patch(
+            "src.utils.connection.random.uniform", side_effect=lambda low, high: high
+        ) as uniform, pytest.raises(psycopg2.OperationalError):
+            connect_with_retry(factory, attempts=4)
+
+        assert factory.call_count == 4
+        assert [call.args for call in uniform.call_args_list] == [
+            (0, 0.2),
+            (0, 0.4),
+            (0, 0.8),
+        ]
+        assert sleep.call_count == 3
+
+    def test_rejected_logins_are_not_retried(self):
+        factory = Mock(
+            side_effect=psycopg2.OperationalError(
+                'FATAL:  password authentication failed for user "extract"'
+            )
+        )
+
+        with pytest.raises(psycopg2.OperationalError):
+            connect_with_retry(factory, attempts=3)
+
+        assert factory.call_count == 1
+
+    def test_other_errors_are_not_retried(self):
+        factory = Mock(side_effect=psycopg2.ProgrammingError("bad option"))
+
+        with pytest.raises(psycopg2.ProgrammingError):
+            connect_with_retry(factory, attempts=3)
+
+        assert factory.call_count == 1
+
+
+class TestGetPool:
+    def test_warm_calls_get_the_same_pool(self):
+        factory = Mock()
+
+        assert get_pool(factory, max_size=2) is get_pool(factory, max_size=2)
+        assert get_pool(factory, "replica1") is not get_pool(factory)
+
+    def test_pool_passes_its_arguments_to_the_factory(self):
+        factory = Mock(return_value=Mock(closed=0))
+
+        with get_pool(factory, "replica1").connection():
+            pass
+
+        factory.assert_called_once_with("replica1")
+
+
+class TestSnapshots:
+    def test_workers_see_the_exported_state(self, seed_database):
+        coordinator = create_connection_to_local()
+        worker = create_connection_to_local()
+        writer = create_connection_to_local()
+        writer.autocommit = True
+
+        snapshot_id = export_snapshot(coordinator)
+        writer.cursor().execute("INSERT INTO currency VALUES (99, 'JPY', now(), now())")
+        use_snapshot(worker, snapshot_id)
+        worker_cursor = worker.cursor()
+        worker_cursor.execute("SELECT count(*) AS total FROM currency")
+        in_snapshot = worker_cursor.fetchone()["total"]
+        worker.rollback()
+        worker_cursor.execute("SELECT count(*) AS total FROM currency")
+        after_snapshot = worker_cursor.fetchone()["total"]
+
+        writer.cursor().execute("DELETE FROM currency WHERE currency_id = 99")
+        for db in (coordinator, worker, writer):
+            db.close()
+
+        assert after_snapshot == in_snapshot + 1
+
+
+class TestSessionSettings:
+    def test_create_connection_names_the_session_and_sets_timeouts(self):
+        with patch("src.utils.connection.psycopg2.connect") as connect:
+            create_connection()
+
+        kwargs = connect.call_args.kwargs
+        assert kwargs["application_name"] == "totes-extract"
+        assert kwargs["options"] == session_options()
+
+    def test_postgres_applies_the_session_options(self, seed_database):
+        db = psycopg2.connect(
+            user=os.getenv("TEST_PG_USERNAME"),
+            database=os.getenv("TEST_PG_DATABASE"),
+            password=os.getenv("TEST_PG_PASSWORD"),
+            port=int(os.getenv("TEST_PG_PORT")),
+            options=session_options(),
+        )
+        db_cursor = db.cursor()
+        settings = {}
+        for name in ("statement_timeout", "lock_timeout"):
+            db_cursor.execute(f"SHOW {name}")
+            settings[name] = db_cursor.fetchone()[0]
+        db.close()
+
+        assert settings == {"statement_timeout": "14min", "lock_timeout": "5s"}
+
+
+class TestReplicaRouting:
+    @pytest.mark.parametrize(
+        "dsn, expected",
+        [
+            ("replica1", {"host": "replica1"}),
+            ("host=replica1 port=5433", {"host": "replica1", "port": "5433"}),
+            ("postgresql://replica1:5433", {"host": "replica1", "port": "5433"}),
+        ],
+    )
+    def test_replica_dsns_override_the_primarys_settings(self, dsn, expected):
+        with patch("src.utils.connection.psycopg2.connect") as connect:
+            create_connection(dsn)
+
+        kwargs = connect.call_args.kwargs
+        assert {name: kwargs[name] for name in expected} == expected
+        assert kwargs["dbname"] == os.environ["PG_DATABASE"]
+
+    def test_a_primary_has_no_lag(self, seed_database):
+        db = create_connection_to_local()
+
+        assert replica_status(db) == (0.0, None)
+        db.close()
+
+    def test_picks_the_freshest_replica_within_the_bound(self):
+        lags = {"stale": 600.0, "behind": 20.0, "fresh": 2.0}
+
+        with patch(
+            "src.utils.connection.create_connection",
+            side_effect=lambda dsn: Mock(dsn=dsn),
+        ), patch(
+            "src.utils.connection.replica_status",
+            side_effect=lambda db: (lags[db.dsn], f"{db.dsn} replay point"),
+        ):
+            chosen = choose_replica(["stale", "behind", "fresh"], max_lag_seconds=60)
+            none_close_enough = choose_replica(["stale"], max_lag_seconds=60)
+
+        assert chosen == ("fresh", "fresh replay point")
+        assert none_close_enough == (None, None)
+
+    def test_unreachable_replicas_are_skipped(self, seed_database):
+        chosen = choose_replica(["host=nowhere.invalid", "localhost"], 60)
+
+        assert chosen == ("localhost", None)
@@ -0,0 +1,118 @@
+import threading
+import time
+from io import BytesIO
+from unittest.mock import Mock
+from src.utils.governor import (
+    MIN_CHUNK_ROWS,
+    LoadGovernor,
+    RateLimitedWriter,
+    RowRateLimiter,
+)
+
+
+def slow_cursor(delay):
+    cursor = Mock()
+    cursor.execute.side_effect = lambda query: time.sleep(delay)
+    return cursor
+
+
+class TestRowRateLimiter:
+    def test_holds_readers_to_the_cap(self):
+        limiter = RowRateLimiter(1000)
+
+        start = time.perf_counter()
+        for _ in range(5):
+            limiter.wait(50)
+        elapsed = time.perf_counter() - start
+
+        assert elapsed >= 0.25 * 0.9
+
+    def test_no_cap_never_waits(self):
+        limiter = RowRateLimiter(0)
+
+        assert limiter.wait(1_000_000) == 0.0
+
+    def test_writer_counts_lines(self):
+        limiter = Mock()
+        file = BytesIO()
+
+        RateLimitedWriter(file, limiter).write(b"id,name\n1,a\n2,b\n")
+
+        limiter.wait.assert_called_once_with(3)
+        assert file.getvalue() == b"id,name\n1,a\n2,b\n"
+
+
+class TestLoadGovernor:
+    def test_backs_off_when_latency_is_over_target(self):
+        governor = LoadGovernor(8, latency_target_ms=5)
+
+        governor.measure(slow_cursor(0.02))
+
+        assert governor.limit == 4
+        assert governor.backoffs == 1
+        assert governor.latencies[0] >= 20 * 0.9
+
+    def test_recovers_one_slot_at_a_time(self):
+        governor = LoadGovernor(8, latency_target_ms=1000)
+        governor.limit = 2
+
+        governor.measure(slow_cursor(0))
+        governor.measure(slow_cursor(0))
+
+        assert governor.limit == 4
+
+    def test_never_goes_below_one_slot(self):
+        governor = LoadGovernor(2, latency_target_ms=5)
+
+        for _ in range(3):
+            governor.measure(slow_cursor(0.01))
+
+        assert governor.limit == 1
+
+    def test_zero_target_never_backs_off(self):
+        governor = LoadGovernor(4, latency_target_ms=0)
+
+        governor.measure(slow_cursor(0.01))
+
+        assert governor.limit == 4
+
+    def test_slots_are_limited(self):
+        governor = LoadGovernor(4, latency_target_ms=0)
+        governor.limit = 2
+        running, most = [0], [0]
+        lock = threading.Lock()
+
+        def task():
+            with governor.slot():
+                with lock:
+                    running[0] += 1
+                    most[0] = max(most[0], running[0])
+                time.sleep(0.02)
+                with lock:
+                    running[0] -= 1
+
+        threads = [threading.Thread(target=task) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert most[0] == 2
+
+    def test_chunks_shrink_after_backoffs(self):
+        governor = LoadGovernor(4, latency_target_ms=5)
+        assert governor.chunk_rows(500_000) == 500_000
+
+        governor.backoffs = 2
+        assert governor.chunk_rows(500_000) == 125_000
+
+        governor.backoffs = 20
+        assert governor.chunk_rows(500_000) == MIN_CHUNK_ROWS
+        assert governor.chunk_rows(100) == 100
+
+    def test_chunks_of_a_table_share_a_limiter(self):
+        governor = LoadGovernor(4, latency_target_ms=0, rows_per_sec=100)
+
+        assert governor.limiter("staff") is governor.limiter("staff")
+        assert governor.limiter("staff") is not governor.limiter("payment")
+        assert governor.limiter("staff").rows_per_sec == 100
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from unittest.mock import patch
+from src.utils.hash_index import RowHashIndex, SHARD_KEYS, row_hash_expression
+from src.utils.connection import create_connection_to_local
+
+TEST_BUCKET = "test_hash_bucket"
+
+
+@pytest.fixture
+def s3_with_test_bucket(s3_client):
+    s3_client.create_bucket(
+        Bucket=TEST_BUCKET,
+        CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+    )
+    yield s3_client
+
+
+def keys_and_hashes(*pairs):
+    keys, hashes = zip(*pairs)
+    return np.array(keys, dtype=np.int64), np.array(hashes, dtype=np.int64)
+
+
+class TestRowHashIndex:
+    def test_every_row_is_changed_in_an_empty_index(self, s3_with_test_bucket):
+        index = RowHashIndex(s3_with_test_bucket, TEST_BUCKET, "staff")
+
+        assert index.changed(*keys_and_hashes((1, 10), (2, 20))).tolist() == [
+            True,
+            True,
+        ]
+
+    def test_only_new_or_different_hashes_are_changed(self, s3_with_test_bucket):
+        index = RowHashIndex(s3_with_test_bucket, TEST_BUCKET, "staff")
+        index.update(*keys_and_hashes((1, 10), (2, 20), (SHARD_KEYS + 1, 30)))
+        index.flush()
+
+        reloaded = RowHashIndex(s3_with_test_bucket, TEST_BUCKET, "staff")
+        changed = reloaded.changed(
+            *keys_and_hashes((2, 20), (1, 11), (3, 30), (SHARD_KEYS + 1, 30))
+        )
+
+        assert changed.tolist() == [False, True, True, False]
+
+    def test_keys_are_stored_in_shards(self, s3_with_test_bucket):
+        index = RowHashIndex(s3_with_test_bucket, TEST_BUCKET, "staff")
+        index.update(*keys_and_hashes((1, 10), (SHARD_KEYS * 3, 30)))
+        index.flush()
+
+        listing = s3_with_test_bucket.list_objects_v2(Bucket=TEST_BUCKET)
+        assert [item["Key"] for item in listing["Contents"]] == [
+            "hash_index/staff/00000000.parquet",
+            "hash_index/staff/00000003.parquet",
+        ]
+
+    def test_updates_replace_stored_hashes(self, s3_with_test_bucket):
+        index = RowHashIndex(s3_with_test_bucket, TEST_BUCKET, "staff")
+        index.update(*keys_and_hashes((1, 10), (2, 20)))
+        index.update(*keys_and_hashes((2, 21)))
+
+        assert index.changed(*keys_and_hashes((1, 10), (2, 21))).tolist() == [
+            False,
+            False,
+        ]
+
+    def test_cache_is_flushed_when_full(self, s3_with_test_bucket):
+        index = RowHashIndex(s3_with_test_bucket, TEST_BUCKET, "staff")
+        with patch("src.utils.hash_index.MAX_CACHED_SHARDS", 2):
+            for shard in range(3):
+                index.update(*keys_and_hashes((shard * SHARD_KEYS, shard)))
+
+            assert len(index._shards) == 1
+            assert not index.changed(*keys_and_hashes((0, 0))).any()
+
+
+class TestRowHashExpression:
+    def test_gives_a_distinct_bigint_per_row(self, seed_database):
+        db = create_connection_to_local()
+        cursor = db.cursor()
+        cursor.execute(
+            f"SELECT {row_hash_expression(['currency_code'])} AS row_hash "
+            "FROM currency ORDER BY currency_id"
+        )
+        hashes = [row["row_hash"] for row in cursor.fetchall()]
+        db.close()
+
+        assert all(isinstance(row_hash, int) for row_hash in hashes)
+        assert len(set(hashes)) == len(hashes)
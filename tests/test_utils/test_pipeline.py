@@ -0,0 +1,169 @@
+import threading
+import time
+from io import BytesIO
+import pytest
+from src.utils.pipeline import BackgroundWriter, iterate_in_background, prefetch
+
+
+def slow(items, delay=0.01):
+    for item in items:
+        time.sleep(delay)
+        yield item
+
+
+class TestIterateInBackground:
+    def test_yields_every_item_in_order(self):
+        metrics = {}
+
+        assert list(iterate_in_background(range(100), "rows", 4, metrics)) == list(
+            range(100)
+        )
+        assert set(metrics) == {"rows_full_wait", "rows_empty_wait"}
+
+    def test_raises_the_producers_error(self):
+        def broken():
+            yield 1
+            raise RuntimeError("connection lost")
+
+        with pytest.raises(RuntimeError, match="connection lost"):
+            list(iterate_in_background(broken(), "rows", 2, {}))
+
+    def test_slow_producer_shows_as_empty_wait(self):
+        metrics = {}
+
+        list(iterate_in_background(slow(range(10)), "rows", 2, metrics))
+
+        assert metrics["rows_empty_wait"] > metrics["rows_full_wait"]
+
+    def test_slow_consumer_shows_as_full_wait(self):
+        metrics = {}
+
+        for _ in iterate_in_background(range(10), "rows", 2, metrics):
+            time.sleep(0.01)
+
+        assert metrics["rows_full_wait"] > metrics["rows_empty_wait"]
+
+    def test_stopping_early_stops_the_producer(self):
+        produced = []
+
+        def counting():
+            for item in range(1000):
+                produced.append(item)
+                yield item
+
+        batches = iterate_in_background(counting(), "rows", 2, {})
+        next(batches)
+        batches.close()
+
+        assert len(produced) < 10
+
+
+class TestPrefetch:
+    def test_results_come_in_order_whatever_finishes_first(self):
+        def fetch(item, reserve):
+            reserve(1)
+            time.sleep(0.01 * (5 - item))  # later items finish first
+            return item * 10
+
+        results = [future.result() for future in prefetch(range(5), fetch, 5, 100)]
+
+        assert results == [0, 10, 20, 30, 40]
+
+    def test_fetches_run_at_once(self):
+        started = []
+
+        def fetch(item, reserve):
+            started.append(item)
+            time.sleep(0.05)
+            return item
+
+        start = time.perf_counter()
+        list(future.result() for future in prefetch(range(4), fetch, 4, 100))
+
+        assert time.perf_counter() - start < 0.15
+
+    def test_held_bytes_stay_under_the_budget(self):
+        held, peak, lock = [0], [0], threading.Lock()
+
+        def fetch(item, reserve):
+            reserve(40)
+            with lock:
+                held[0] += 40
+                peak[0] = max(peak[0], held[0])
+            return item
+
+        for future in prefetch(range(10), fetch, 8, 100):
+            future.result()
+            time.sleep(0.01)  # lets the workers run ahead as far as they are allowed
+            with lock:
+                held[0] -= 40
+
+        assert peak[0] == 80
+
+    def test_an_item_over_the_budget_is_still_fetched(self):
+        def fetch(item, reserve):
+            reserve(500)
+            return item
+
+        assert [f.result() for f in prefetch(range(3), fetch, 2, 100)] == [0, 1, 2]
+
+    def test_a_failed_item_doesnt_stop_the_rest(self):
+        def fetch(item, reserve):
+            if item == 1:
+                raise KeyError(item)
+            reserve(60)
+            return item
+
+        futures = list(prefetch(range(4), fetch, 2, 100))
+
+        with pytest.raises(KeyError):
+            futures[1].result()
+        assert [futures[i].result() for i in (0, 2, 3)] == [0, 2, 3]
+
+    def test_stopping_early_unblocks_waiting_fetches(self):
+        def fetch(item, reserve):
+            reserve(100)
+            return item
+
+        results = prefetch(range(10), fetch, 4, 100)
+        assert next(results).result() == 0
+        results.close()  # returns once the workers waiting for room have given up
+
+
+class FailingFile(BytesIO):
+    def write(self, data):
+        raise OSError("upload failed")
+
+
+class TestBackgroundWriter:
+    def test_everything_written_reaches_the_file(self):
+        file, metrics = BytesIO(), {}
+        with BackgroundWriter(file, 2, metrics) as out:
+            for number in range(100):
+                out.write(f"{number}\n".encode())
+
+        assert file.getvalue() == b"".join(f"{n}\n".encode() for n in range(100))
+        assert out.tell() == len(file.getvalue())
+        assert set(metrics) == {"bytes_full_wait", "bytes_empty_wait"}
+
+    def test_reused_buffers_are_copied(self):
+        file, buffer = BytesIO(), bytearray(b"a")
+        with BackgroundWriter(file, 2, {}) as out:
+            out.write(buffer)
+            buffer[0] = ord("b")
+            out.write(buffer)
+
+        assert file.getvalue() == b"ab"
+
+    def test_errors_from_the_file_are_raised(self):
+        with pytest.raises(OSError, match="upload failed"):
+            with BackgroundWriter(FailingFile(), 1, {}) as out:
+                for _ in range(100):
+                    out.write(b"x")
+
+    def test_leaves_the_file_open(self):
+        file = BytesIO()
+        with BackgroundWriter(file, 2, {}) as out:
+            out.write(b"x")
+
+        assert not file.closed
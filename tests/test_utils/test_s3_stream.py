@@ -0,0 +1,75 @@
+import hashlib
+import pandas as pd
+import pytest
+from io import BytesIO
+from src.utils.s3_stream import S3MultipartWriter, MIN_PART_SIZE
+
+TEST_BUCKET = "test_stream_bucket"
+
+
+@pytest.fixture
+def s3_with_test_bucket(s3_client):
+    s3_client.create_bucket(
+        Bucket=TEST_BUCKET,
+        CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+    )
+    yield s3_client
+
+
+class TestS3MultipartWriter:
+    def test_small_object_is_uploaded_in_one_put(self, s3_with_test_bucket):
+        with S3MultipartWriter(s3_with_test_bucket, TEST_BUCKET, "small.csv") as file:
+            file.write(b"a,b\n")
+            file.write(b"1,2\n")
+
+        body = s3_with_test_bucket.get_object(Bucket=TEST_BUCKET, Key="small.csv")
+        assert body["Body"].read() == b"a,b\n1,2\n"
+        assert file.completed is True
+        assert file.parts_uploaded == 0
+        assert file.bytes_written == 8
+        assert file.checksum == hashlib.sha256(b"a,b\n1,2\n").hexdigest()
+
+    def test_large_object_is_uploaded_in_parts(self, s3_with_test_bucket):
+        chunk = bytes(range(256)) * 4096  # 1 MiB
+        with S3MultipartWriter(
+            s3_with_test_bucket, TEST_BUCKET, "large.bin", part_size=MIN_PART_SIZE
+        ) as file:
+            for _ in range(11):
+                file.write(chunk)
+
+        body = s3_with_test_bucket.get_object(Bucket=TEST_BUCKET, Key="large.bin")
+        assert body["Body"].read() == chunk * 11
+        assert file.parts_uploaded == 3
+
+    def test_exception_discards_upload(self, s3_with_test_bucket):
+        with pytest.raises(RuntimeError):
+            with S3MultipartWriter(
+                s3_with_test_bucket, TEST_BUCKET, "broken.bin", part_size=MIN_PART_SIZE
+            ) as file:
+                file.write(b"x" * (MIN_PART_SIZE + 1))
+                raise RuntimeError("database went away")
+
+        listing = s3_with_test_bucket.list_objects_v2(Bucket=TEST_BUCKET)
+        uploads = s3_with_test_bucket.list_multipart_uploads(Bucket=TEST_BUCKET)
+        assert "Contents" not in listing
+        assert "Uploads" not in uploads
+
+    def test_abort_creates_no_object(self, s3_with_test_bucket):
+        with S3MultipartWriter(s3_with_test_bucket, TEST_BUCKET, "empty.csv") as file:
+            file.write(b"header\n")
+            file.abort()
+
+        listing = s3_with_test_bucket.list_objects_v2(Bucket=TEST_BUCKET)
+        assert "Contents" not in listing
+
+    def test_accepts_dataframe_writers(self, s3_with_test_bucket):
+        df = pd.DataFrame({"id": [1, 2], "name": ["tote", "bag"]})
+        with S3MultipartWriter(s3_with_test_bucket, TEST_BUCKET, "df.parquet") as file:
+            df.to_parquet(file)
+
+        body = s3_with_test_bucket.get_object(Bucket=TEST_BUCKET, Key="df.parquet")
+        pd.testing.assert_frame_equal(pd.read_parquet(BytesIO(body["Body"].read())), df)
+
+    def test_rejects_parts_below_s3_minimum(self, s3_with_test_bucket):
+        with pytest.raises(ValueError):
+            S3MultipartWriter(s3_with_test_bucket, TEST_BUCKET, "x", part_size=1024)
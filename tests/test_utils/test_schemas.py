@@ -0,0 +1,71 @@
+import pyarrow as pa
+from unittest.mock import patch
+from psycopg2.extensions import Column
+from src.utils.schemas import (
+    arrow_schema_from_description,
+    csv_column_types,
+    CSV_COLUMN_TYPES,
+    DEFAULT_DECIMAL,
+)
+
+
+def column(name, type_code, precision=None, scale=None):
+    return Column(name=name, type_code=type_code, precision=precision, scale=scale)
+
+
+class TestArrowSchemaFromDescription:
+    def test_maps_postgres_types(self):
+        description = [
+            column("sales_order_id", 23),
+            column("created_at", 1114),
+            column("paid", 16),
+            column("agreed_delivery_date", 1043),
+        ]
+
+        schema = arrow_schema_from_description(description)
+
+        assert schema.names == [
+            "sales_order_id",
+            "created_at",
+            "paid",
+            "agreed_delivery_date",
+        ]
+        assert schema.types == [
+            pa.int32(),
+            pa.timestamp("us"),
+            pa.bool_(),
+            pa.string(),
+        ]
+
+    def test_numeric_uses_declared_precision(self):
+        schema = arrow_schema_from_description(
+            [
+                column("price", 1700, 10, 2),
+                column("unit_price", 1700, 65535, 65535),
+                column("total", 1700, 50, 2),
+            ]
+        )
+
+        assert schema.types == [pa.decimal128(10, 2), DEFAULT_DECIMAL, DEFAULT_DECIMAL]
+
+    def test_unknown_types_become_strings(self):
+        schema = arrow_schema_from_description([column("details", 3802)])
+
+        assert schema.types == [pa.string()]
+
+
+class TestCsvColumnTypes:
+    def test_finds_the_table_from_the_key(self):
+        key = "2025/06/11/sales_order_2025-06-11 10:00:00.csv.gz"
+
+        assert csv_column_types(key) is CSV_COLUMN_TYPES["sales_order"]
+        assert csv_column_types(key)["created_at"] == pa.timestamp("us")
+
+    def test_prefers_the_longest_table_name(self):
+        with patch.dict(CSV_COLUMN_TYPES, {"sales": {}}):
+            types = csv_column_types("sales_order_2025.csv")
+
+        assert types is CSV_COLUMN_TYPES["sales_order"]
+
+    def test_tables_without_declared_types_have_none(self):
+        assert csv_column_types("payment_type_2025-06-11.csv") == {}
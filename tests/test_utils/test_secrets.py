@@ -0,0 +1,106 @@
+import json
+import boto3
+import psycopg2
+import pytest
+from moto import mock_aws
+from unittest.mock import Mock, patch
+from sqlalchemy.exc import OperationalError
+from src.utils.secrets import CachedSecret, is_auth_error
+
+SECRET = {
+    "username": "extract",
+    "password": "first",
+    "database": "totes",
+    "host": "db.example.com",
+}
+
+
+@pytest.fixture()
+def secrets_client(aws_credentials):
+    with mock_aws():
+        client = boto3.client("secretsmanager", region_name="eu-west-2")
+        client.create_secret(Name="database_secret", SecretString=json.dumps(SECRET))
+        yield client
+
+
+def rotate(client, password):
+    client.put_secret_value(
+        SecretId="database_secret",
+        SecretString=json.dumps({**SECRET, "password": password}),
+    )
+
+
+class TestCachedSecret:
+    def test_fetches_the_secret_once_while_it_is_fresh(self, secrets_client):
+        credentials = CachedSecret("database_secret", fallback=Mock(), ttl=60)
+
+        first = credentials.get()
+        rotate(secrets_client, "second")
+        second = credentials.get()
+
+        assert first == second == SECRET
+        assert credentials.fetches == 1
+        credentials.fallback.assert_not_called()
+
+    def test_fetches_again_once_the_ttl_has_passed(self, secrets_client):
+        credentials = CachedSecret("database_secret", fallback=Mock(), ttl=60)
+
+        with patch("src.utils.secrets.time.monotonic", return_value=1000.0):
+            credentials.get()
+        rotate(secrets_client, "second")
+        with patch("src.utils.secrets.time.monotonic", return_value=1061.0):
+            refreshed = credentials.get()
+
+        assert refreshed["password"] == "second"
+        assert credentials.fetches == 2
+
+    def test_falls_back_without_a_secret_id(self):
+        credentials = CachedSecret(None, fallback=lambda: {"password": "from env"})
+
+        assert credentials.get() == {"password": "from env"}
+        assert credentials.fetches == 0
+
+    def test_rejected_login_is_retried_with_the_rotated_password(self, secrets_client):
+        credentials = CachedSecret("database_secret", fallback=Mock(), ttl=60)
+        credentials.get()
+        rotate(secrets_client, "second")
+
+        def connect(secret):
+            if secret["password"] != "second":
+                raise psycopg2.OperationalError(
+                    'FATAL:  password authentication failed for user "extract"'
+                )
+            return "db"
+
+        assert credentials.connect(connect) == "db"
+        assert credentials.fetches == 2
+
+    def test_other_connection_errors_are_not_retried(self, secrets_client):
+        credentials = CachedSecret("database_secret", fallback=Mock(), ttl=60)
+        connect = Mock(side_effect=psycopg2.OperationalError("connection refused"))
+
+        with pytest.raises(psycopg2.OperationalError):
+            credentials.connect(connect)
+
+        assert connect.call_count == 1
+        assert credentials.fetches == 1
+
+
+class TestIsAuthError:
+    def test_recognises_each_driver(self):
+        pg8000_error = Exception(
+            {
+                "S": "FATAL",
+                "C": "28P01",
+                "M": 'password authentication failed for user "x"',
+            }
+        )
+        wrapped = OperationalError(
+            "connect",
+            {},
+            psycopg2.OperationalError("FATAL:  password authentication failed"),
+        )
+
+        assert is_auth_error(pg8000_error)
+        assert is_auth_error(wrapped)
+        assert not is_auth_error(psycopg2.OperationalError("connection refused"))
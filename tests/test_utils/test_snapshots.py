@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+from unittest.mock import patch
+from src.utils.snapshots import DimensionSnapshot
+
+BUCKET = "test-snapshots"
+
+
+@pytest.fixture()
+def s3_with_snapshot_bucket(s3_client):
+    s3_client.create_bucket(
+        Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": "eu-west-2"}
+    )
+    yield s3_client
+
+
+def departments(rows):
+    return pd.DataFrame(
+        {
+            "department_id": [row[0] for row in rows],
+            "department_name": [row[1] for row in rows],
+            "location": ["Leeds"] * len(rows),
+            "manager": ["Someone"] * len(rows),
+        }
+    ).set_index("department_id")
+
+
+class TestDimensionSnapshot:
+    def test_read_before_any_merge_is_none(self, s3_with_snapshot_bucket):
+        snapshot = DimensionSnapshot(s3_with_snapshot_bucket, BUCKET, "department")
+
+        assert snapshot.read() is None
+
+    def test_merge_keeps_the_joined_columns_and_newest_rows(
+        self, s3_with_snapshot_bucket
+    ):
+        snapshot = DimensionSnapshot(s3_with_snapshot_bucket, BUCKET, "department")
+        snapshot.merge(departments([(1, "Sales"), (2, "Purchasing")]))
+
+        merged = snapshot.merge(departments([(2, "Procurement"), (3, "Finance")]))
+
+        assert list(merged.columns) == ["department_name", "location"]
+        assert merged["department_name"].to_dict() == {
+            1: "Sales",
+            2: "Procurement",
+            3: "Finance",
+        }
+
+    def test_warm_reads_come_from_memory_until_the_object_changes(
+        self, s3_with_snapshot_bucket
+    ):
+        snapshot = DimensionSnapshot(s3_with_snapshot_bucket, BUCKET, "department")
+        merged = snapshot.merge(departments([(1, "Sales")]))
+        # another invocation, with its own snapshot object
+        other = DimensionSnapshot(s3_with_snapshot_bucket, BUCKET, "department")
+
+        with patch("src.utils.snapshots.pd.read_parquet") as read_parquet:
+            assert other.read() is merged
+        read_parquet.assert_not_called()
+
+        s3_with_snapshot_bucket.put_object(
+            Bucket=BUCKET,
+            Key=snapshot.key,
+            Body=departments([(1, "Renamed")])[["department_name"]].to_parquet(),
+        )
+        assert snapshot.read()["department_name"].to_dict() == {1: "Renamed"}
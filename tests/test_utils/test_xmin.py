@@ -0,0 +1,49 @@
+import pytest
+from src.utils.connection import create_connection_to_local
+from src.utils.xmin import (
+    get_current_snapshot,
+    parse_snapshot,
+    snapshot_age,
+    xmin_condition,
+)
+
+
+class TestParseSnapshot:
+    def test_splits_in_progress_ids(self):
+        assert parse_snapshot("7651:7655:7652,7653") == (7651, 7655, [7652, 7653])
+
+    def test_no_transactions_in_progress(self):
+        assert parse_snapshot("7651:7651:") == (7651, 7651, [])
+
+
+class TestSnapshotAge:
+    def test_counts_transactions_since_the_snapshot(self):
+        assert snapshot_age("100:105:", "4294967400:4294967400:") == 4294967295
+
+
+class TestXminCondition:
+    def test_ids_are_wrapped_to_32_bits(self):
+        _, params = xmin_condition(f"{2**32 + 3}:{2**32 + 5}:{2**32 + 4}")
+
+        assert params == ["5", ["4"]]
+
+    def test_matches_only_rows_written_after_the_snapshot(self, seed_database):
+        db = create_connection_to_local()
+        db.autocommit = True
+        cursor = db.cursor()
+        snapshot = get_current_snapshot(cursor)
+        condition, params = xmin_condition(snapshot)
+        cursor.execute(
+            f"SELECT count(*) AS changed FROM currency WHERE {condition}", params
+        )
+        before = cursor.fetchone()["changed"]
+
+        cursor.execute(
+            "UPDATE currency SET currency_code = currency_code WHERE currency_id = 2"
+        )
+        cursor.execute(f"SELECT currency_id FROM currency WHERE {condition}", params)
+        after = cursor.fetchall()
+        db.close()
+
+        assert before == 0
+        assert [row["currency_id"] for row in after] == [2]